@@ -0,0 +1,110 @@
+"""
+In-memory library interface to the assembler
+
+Unlike assembler.assemble(...), nothing here touches the filesystem or prints: the source is passed in directly, the
+encoded program is returned, and invalid programs raise the structured exceptions defined in custom_types.py
+(AssemblerError and its subclasses InvalidLineError, InvalidInstructionError, and UndefinedLabelError).
+
+Example:
+    program = api.assemble_source("main: addi $t0, $0, 1\n j main\n", start_address=0x400000)
+    program.words           # array of 32 bit words
+    program.to_bytes()      # raw big endian machine code
+    program.symbol_table    # {"main": 4194304}
+    program.data_image      # memory image of the .data segment (bytearray, empty without data)
+"""
+from custom_types import AssemblerError
+from typing import NamedTuple
+from array import array
+import output_formats
+import data_segment
+import assembler
+import profiler
+import io
+
+
+class AssembledProgram(NamedTuple):
+    words: array            # Encoded instructions in address order (array of unsigned 32 bit ints)
+    symbol_table: dict      # Labels mapped to their byte addresses
+    variable_table: dict    # Variables mapped to their byte addresses
+    start_address: int      # Byte address of the first instruction
+    profile: dict = None    # Per phase timings if requested (see profiler.get_empty_profile(...))
+    schedule: list = None   # Blocks reordered by the scheduler if requested (see scheduler.schedule_words(...))
+    optimization: dict = None   # Instruction count reduction if optimized (see peephole.optimize_lines(...))
+    data_image: bytearray = None    # Big endian memory image of the data segment (see data_segment.py)
+    data_address: int = None    # Byte address of the data segment
+    line_numbers: array = None  # Source line of every word from 0 (see assembler.get_word_line_numbers(...))
+
+    def to_bytes(self, byteorder="big"):
+        """
+        Raw machine code of the program
+        :param byteorder: "big" (MIPS default) or "little"
+        :return: bytes
+        """
+        if byteorder == "big":
+            return output_formats.render_big_endian(self.words)
+        return output_formats.render_little_endian(self.words)
+
+
+def get_source_lines(source):
+    """
+    Turns any supported source into an iterable of lines
+    :param source: the assembly program as one of the following
+        str - the text of the program
+        bytes, bytearray, memoryview - the UTF-8 encoded text of the program
+        text stream (i.e. io.StringIO or an open text file) - read from its current position
+        binary stream (i.e. io.BytesIO) - read from its current position and decoded as UTF-8
+        any other iterable of lines (i.e. a list of strings)
+    :return: iterable of lines
+    """
+    if isinstance(source, str):
+        return io.StringIO(source, newline=None)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.StringIO(bytes(source).decode(), newline=None)
+    if isinstance(source, io.TextIOBase):
+        return iter(source)
+    if isinstance(source, (io.BufferedIOBase, io.RawIOBase)):
+        return io.StringIO(source.read().decode(), newline=None)
+    return source
+
+
+def assemble_source(source, start_address=None, single_pass=False, profile=False, profile_memory=False,
+                    schedule=False, optimize=False, data_address=None):
+    """
+    Assembles a program held in memory
+    :param source: the assembly program (see get_source_lines(...) for the supported types)
+    :param start_address: byte address of the first instruction (defaults to assembler.START_ADDRESS)
+    :param single_pass: read the source only once (see assembler.process_single_pass(...), la with a label is not
+        supported)
+    :param profile: measure every phase and return the profile with the program (see profiler.py)
+    :param profile_memory: also measure memory in bytes when profiling (slower)
+    :param schedule: reorder the instructions within basic blocks to hide latencies and return the reordered blocks
+        with the program (see scheduler.schedule_words(...)) (single_pass is ignored when scheduling)
+    :param optimize: remove redundant instructions with the peephole optimizer and return its report with the program
+        (see peephole.optimize_lines(...)) (single_pass is ignored when optimizing)
+    :param data_address: byte address of the data segment (defaults to data_segment.DATA_START_ADDRESS)
+    :return: AssembledProgram (line_numbers is None in single pass mode, and gives the lines of the words before they
+        were scheduled when scheduling)
+    :raises AssemblerError if the program is invalid (line_number is filled in, and line whenever it is known)
+    """
+    start_address = assembler.START_ADDRESS if start_address is None else start_address
+    data_layout = data_segment.get_empty_data_layout(data_address)
+    program_profile = profiler.get_empty_profile(profile_memory) if profile else None
+    schedule_report = [] if schedule else None
+    optimization = {} if optimize else None
+
+    try:
+        words, symbol_table, variable_table, line_numbers = assembler.assemble_program(
+            get_source_lines(source), single_pass, None, start_address, program_profile, schedule_report, optimization,
+            data_layout, line_numbers=True)
+        data_image = data_segment.build_data_image(data_layout, symbol_table, variable_table)
+        return AssembledProgram(words, symbol_table, variable_table, start_address, program_profile, schedule_report,
+                                optimization, data_image, data_layout["start_address"], line_numbers)
+
+    except AssemblerError as error:
+        # The second pass only knows the line number, look up the text if the source can be read again
+        if error.line is None and error.line_number is not None and isinstance(source, (str, bytes, bytearray)):
+            text = source if isinstance(source, str) else bytes(source).decode()
+            source_lines = text.splitlines()
+            if error.line_number <= len(source_lines):
+                error.line = source_lines[error.line_number-1]
+        raise
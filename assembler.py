@@ -1,27 +1,64 @@
-from custom_types import LineType
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from custom_types import LineType, AssemblerError, InvalidLineError, InvalidInstructionError, UndefinedLabelError
 import custom_types
 from instruction_assemblers import *
+import mapped_source
+import data_segment
+import pseudo
+import output_formats
+import profiler
+import peephole
 import helpers
-import dicts
-import re
+from array import array
+import os
 
 # Random byte memory address where the first instruction will be placed in memory
 # Can be changed to anything, but note that it should be word aligned (divisible by 4)
 # since each instruction occupies 1 word (4 bytes)
+# (used whenever no start_address is passed to the functions below)
 START_ADDRESS = 7996
 
+# Error message for an instruction found after a .data directive
+DATA_INSTRUCTION_MESSAGE = "Instruction in the data segment (missing .text directive?)"
 
-def process_first_pass(i_file):
+# Maximum number of distinct instructions remembered by encode_instruction(...)
+ENCODE_MEMO_SIZE = 65536
+
+# Bounded LRU memo mapping the tokens of position independent instructions to their encoded word
+# (generated code and unrolled loops repeat the same instruction text constantly)
+encode_memo = OrderedDict()
+
+# Counters for the memo (uncached counts branches and jumps, which are never memoized)
+encode_memo_stats = {"hits": 0, "misses": 0, "uncached": 0}
+
+# Number of lines in each chunk handed to a worker process when the second pass runs in parallel
+PARALLEL_CHUNK_SIZE = 16384
+
+# Number of assembled instructions buffered by the single pass (streaming) writer before writing them to the output file
+STREAM_CHUNK_SIZE = 4096
+
+
+def process_first_pass(i_file, start_address=None, data_layout=None, profile=None):
     """
     Scans through the file line by line
     determines each line's type and saves it to the respective index in the line_type_list (along with its memory
     address if the type is an instruction)
     if the line contains a symbol/label, it will add it to the symbol table with its proper address
-    TODO: also add variables to the variable table
+    data directives are laid out in the data segment and their labels are added to the variable table
+    (see data_segment.py)
     :param i_file: assembly language input file handle (previously opened and ready to read from)
+        (or any other iterable of lines)
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+    :param data_layout: data layout filled out with the data segment (see data_segment.get_empty_data_layout(...))
+        (a temporary one is used if None)
+    :param profile: profile dictionary to add the read, classify, and tokenize phases to (see profiler.py), None to not
+        profile (the file is read up front when profiling, so reading is measured on its own)
     :return: Tuple (symbol table, variable table, line type list)
-        line type list contains tuples as well (LineType, memory_address if type is instruction)
-    :raises Exception if a line is invalid
+        line type list contains tuples as well
+        (LineType, memory_address if type is instruction, tokenized instruction list if type is instruction)
+        pseudo instructions occupy a single instruction slot until pseudo.expand_lines(...) lowers them
+    :raises InvalidLineError if a line is invalid
     """
     # Dictionary mapping labels to their corresponding byte addresses
     symbol_table = {}
@@ -30,45 +67,62 @@ def process_first_pass(i_file):
     # (points to start of data if multiple bytes)
     variable_table = {}
 
-    # List of tuples containing the type of each line in the assembly file and
-    # the instruction address in memory if the line is an instruction (None otherwise)
+    # List of tuples containing the type of each line in the assembly file,
+    # the instruction address in memory if the line is an instruction (None otherwise) and
+    # the tokenized instruction if the line is an instruction (None otherwise)
     # possible line types are given in the LineType enum
     # indexed by line number starting with 0 as first line
     line_type_list = []
 
     # Initialize current instruction address counter variable (in bytes, each instruction is 4 bytes)
     # (less 4 because it will be incremented upon reaching the first valid instruction)
-    current_instruction_address = START_ADDRESS-4
-    i_file.seek(0)  # Reset read pointer to top of file
+    current_instruction_address = (START_ADDRESS if start_address is None else start_address) - 4
+    if data_layout is None:
+        data_layout = data_segment.get_empty_data_layout()
+    helpers.rewind(i_file)  # Reset read pointer to top of file
+    if profile is not None:
+        with profiler.measure_phase(profile, "read"):
+            i_file = list(i_file)
+    clock = profiler.get_lap_clock(profile)
     for line_number, line in enumerate(i_file):
 
-        # Determine line type
-        line_type = helpers.get_line_type(line)
+        # Determine line type (along with its label, mnemonic and operands)
+        classified_line = helpers.classify_line(line)
+        line_type = classified_line.line_type
+        if clock is not None:
+            profiler.lap_classified(clock, line_number, line_type)
 
         # Catch and report invalid lines at this stage
         if line_type == LineType.INVALID:
-            raise Exception("Error invalid line encountered in assembly file\n"
-                            "Line number: ", line_number+1, "\n",               # +1 since first line is 0
-                            "Line: ", line)
+            raise InvalidLineError("Error invalid line encountered in assembly file",
+                                   line_number+1, line)                         # +1 since first line is 0
 
         # Increment current instruction address if valid instruction
-        if line_type in custom_types.ALL_INSTRUCTIONAL_TYPES:
+        # (pseudo instructions get a single slot for now, see pseudo.expand_lines(...))
+        if line_type in custom_types.ALL_INSTRUCTIONAL_TYPES or line_type in custom_types.ALL_PSEUDO_TYPES:
+            if data_layout["in_data"]:
+                raise InvalidLineError(DATA_INSTRUCTION_MESSAGE, line_number+1, line)
             # Increment instruction address counter by 4 bytes (since each instruction is 1 word)
             current_instruction_address += 4
         # Fill out line type list
-            line_type_list.append((line_type, current_instruction_address))
+        # (the instruction is tokenized now, so the second pass doesn't need to read or split the line again)
+            line_type_list.append((line_type, current_instruction_address,
+                                   tokenize_classified_line(line, classified_line)))
+            if clock is not None:
+                profiler.lap(clock, "tokenize", line_number)
         else:
-            line_type_list.append((line_type, None))
+            line_type_list.append((line_type, None, None))
 
-        # Fill out variable table
-        if line_type == LineType.VARIABLE:
-            variable = re.search(dicts.REGEX_DICT["variable"], line)
-            # TODO fill out variable table (support variables)
+        # Lay out data and fill out variable table (label only lines in the data segment are variables as well)
+        if line_type in data_segment.DATA_LINE_TYPES and \
+                data_segment.process_line(data_layout, line_type, classified_line.label, line, line_number,
+                                          variable_table):
+            continue
 
         # Fill out symbol/label table
         if line_type in custom_types.ALL_LABEL_TYPES:
-            # Isolate label portion (remove the instruction or comment portions) and strip whitespace
-            label = line.split(":", 1)[0].strip()  # Split on the ":", max of 1 split, keep the first portion
+            # Label portion was isolated when the line was classified
+            label = classified_line.label
 
             # Add label and its associated instruction address to symbol table
             if line_type == LineType.LABEL_ONLY:
@@ -78,42 +132,753 @@ def process_first_pass(i_file):
                 # Since it is a label with an instruction, the associated instruction is on the same line, so no offset
                 symbol_table[label] = current_instruction_address
 
+    data_segment.finish_layout(data_layout, variable_table)
+    if clock is not None:
+        profiler.record_slowest_lines(profile, clock["line_seconds"], i_file.__getitem__)
+    return symbol_table, variable_table, line_type_list
+
+
+def process_first_pass_mapped(source, start_address=None, data_layout=None, profile=None):
+    """
+    Same as process_first_pass(...), but classifies and tokenizes the lines of a memory mapped file in place
+    (see mapped_source.py), so no line is decoded into a string unless it contains an instruction, a label, or a
+    directive
+    :param source: MappedSource of the assembly file
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+    :param data_layout: data layout filled out with the data segment (see process_first_pass(...))
+    :param profile: profile dictionary to add the classify and tokenize phases to (see profiler.py), None to not profile
+    :return: Tuple (symbol table, variable table, line type list) (see process_first_pass(...))
+    :raises InvalidLineError if a line is invalid
+    """
+    symbol_table = {}
+    variable_table = {}
+    line_type_list = []
+
+    current_instruction_address = (START_ADDRESS if start_address is None else start_address) - 4
+    if data_layout is None:
+        data_layout = data_segment.get_empty_data_layout()
+    clock = profiler.get_lap_clock(profile)
+    for line_number, line_type, label, tokenized_instr_list in source.scan_lines(clock):
+        if line_type == LineType.INVALID:
+            raise InvalidLineError("Error invalid line encountered in assembly file",
+                                   line_number+1, source.get_line(line_number))  # +1 since first line is 0
+
+        if line_type in custom_types.ALL_INSTRUCTIONAL_TYPES or line_type in custom_types.ALL_PSEUDO_TYPES:
+            if data_layout["in_data"]:
+                raise InvalidLineError(DATA_INSTRUCTION_MESSAGE, line_number+1, source.get_line(line_number))
+            current_instruction_address += 4
+            line_type_list.append((line_type, current_instruction_address, tokenized_instr_list))
+        else:
+            line_type_list.append((line_type, None, None))
+
+        if line_type in data_segment.DATA_LINE_TYPES and \
+                data_segment.process_line(data_layout, line_type, label, source.get_line(line_number), line_number,
+                                          variable_table):
+            continue
+
+        if line_type in custom_types.ALL_LABEL_TYPES:
+            if line_type == LineType.LABEL_ONLY:
+                symbol_table[label] = current_instruction_address + 4
+            else:
+                symbol_table[label] = current_instruction_address
+
+    data_segment.finish_layout(data_layout, variable_table)
+    if clock is not None:
+        profiler.record_slowest_lines(profile, clock["line_seconds"], source.get_line)
     return symbol_table, variable_table, line_type_list
 
 
-def process_second_pass(i_file, o_file, symbol_table, variable_table, line_type_list):
-    # Read entire input file
-    i_file.seek(0)                      # Reset read pointer to top of file
-    i_file_data = i_file.readlines()    # Read all the lines in the file (can't index to a specific line sadly)
+def assemble_instruction(line_type, tokenized_instr_list, instr_format_dict, symbol_table,
+                         current_instruction_address):
+    """
+    Calls the instruction assembler matching the line type
+    :param line_type: LineType of the (instructional) line
+    :param tokenized_instr_list: tokenized instruction list (list)
+    :param instr_format_dict: dictionary from instruction_list containing the formatting info for the given instruction
+    :param symbol_table: dictionary mapping symbols/labels to their respective addresses
+    :param current_instruction_address: memory address of the instruction (int)
+    :return: the final 32 bit instruction word (int)
+    """
+    if line_type in [LineType.R_INSTRUCTION, LineType.LABEL_WITH_R_INSTR]:
+        return assemble_r_instruction(tokenized_instr_list, instr_format_dict)
+    if line_type in [LineType.I_INSTRUCTION, LineType.LABEL_WITH_I_INSTR]:
+        return assemble_i_instruction(tokenized_instr_list, instr_format_dict, symbol_table,
+                                      current_instruction_address)
+    return assemble_j_instruction(tokenized_instr_list, instr_format_dict, symbol_table)
+
+
+def encode_instruction(line_type, tokenized_instr_list, symbol_table, current_instruction_address):
+    """
+    Verifies and assembles an instruction
+    Instructions which don't reference a label (R type and non branch I type) only depend on their tokens, so their
+    words are remembered in the encode_memo and reused when the same instruction appears again.  The least recently
+    used entry is dropped once the memo holds ENCODE_MEMO_SIZE instructions.  Branches and jumps are never memoized,
+    and neither are expanded instructions using $at (the same tokens are invalid in a source instruction).
+    :param line_type: LineType of the (instructional) line
+    :param tokenized_instr_list: tokenized instruction list (list)
+    :param symbol_table: dictionary mapping symbols/labels to their respective addresses
+    :param current_instruction_address: memory address of the instruction (int)
+    :return: the final 32 bit instruction word (int)
+    :raises InvalidInstructionError if the instruction is invalid
+    """
+    if tokenized_instr_list[0] not in POSITION_INDEPENDENT_MNEMONICS:
+        encode_memo_stats["uncached"] += 1
+        instr_format_dict = verify_instruction_tokens(tokenized_instr_list, symbol_table)
+        return assemble_instruction(line_type, tokenized_instr_list, instr_format_dict, symbol_table,
+                                    current_instruction_address)
+
+    key = tuple(tokenized_instr_list)
+    word = encode_memo.get(key)
+    if word is not None:
+        encode_memo_stats["hits"] += 1
+        encode_memo.move_to_end(key)
+        return word
+
+    encode_memo_stats["misses"] += 1
+    instr_format_dict = verify_instruction_tokens(tokenized_instr_list, symbol_table)
+    word = assemble_instruction(line_type, tokenized_instr_list, instr_format_dict, symbol_table,
+                                current_instruction_address)
+    if "$at" in key and isinstance(tokenized_instr_list, ExpandedInstruction):
+        return word
+    encode_memo[key] = word
+    if len(encode_memo) > ENCODE_MEMO_SIZE:
+        encode_memo.popitem(last=False)
+    return word
+
+
+def get_encode_memo_stats():
+    """
+    Reports how effective the encode memo has been (see encode_instruction(...))
+    :return: dictionary with the hits, misses, uncached (branches and jumps), hit_rate (of the memoizable
+        instructions), size, and size_limit
+    """
+    lookups = encode_memo_stats["hits"] + encode_memo_stats["misses"]
+    return {**encode_memo_stats, "hit_rate": encode_memo_stats["hits"] / lookups if lookups else 0.0,
+            "size": len(encode_memo), "size_limit": ENCODE_MEMO_SIZE}
+
+
+def clear_encode_memo():
+    """
+    Empties the encode memo and resets its counters
+    """
+    encode_memo.clear()
+    for key in encode_memo_stats:
+        encode_memo_stats[key] = 0
+
+
+def encode_instructions(line_type_list, symbol_table, first_line_number=0):
+    """
+    Verifies and assembles every instruction line of the line type list
+    :param line_type_list: line type list (or a slice of it) (from the first pass)
+    :param symbol_table: dictionary mapping labels to their byte addresses (from the first pass)
+    :param first_line_number: line number of the first entry when passing a slice (starting with 0 as first line)
+    :return: assembled instruction words in address order (array)
+    :raises InvalidInstructionError if an instruction is invalid (with the line number filled in)
+    """
+    # Assembled instruction words in address order
+    assembled_instr_array = output_formats.get_word_array()
 
     # Read through line_type_list in order to only operate on lines that contain instructions
-    for line_number, (line_type, current_instruction_address) in enumerate(line_type_list):
+    for line_number, (line_type, current_instruction_address, tokenized_instr_list) in \
+            enumerate(line_type_list, first_line_number):
         # For every instruction line...
         if line_type in custom_types.ALL_INSTRUCTIONAL_TYPES:
-            # Grab the line from the file
-            line = i_file_data[line_number]
-            # Set a flag indicating if the instruction starts with a label on the same line
-            with_label = line_type in custom_types.ALL_INSTRUCTIONAL_LABEL_TYPES
-            # Tokenize instruction
-            tokenized_instr_list = tokenize_instruction(line, with_label)
-            # Verify instruction
-            instr_format_dict = verify_instruction_tokens(tokenized_instr_list, symbol_table)
-
-            # Call appropriate instruction assembler
-            assembled_instr_str = "ERROR"
-            if line_type in [LineType.R_INSTRUCTION, LineType.LABEL_WITH_R_INSTR]:
-                assembled_instr_str = assemble_r_instruction(tokenized_instr_list, instr_format_dict)
-            if line_type in [LineType.I_INSTRUCTION, LineType.LABEL_WITH_I_INSTR]:
-                assembled_instr_str = assemble_i_instruction(tokenized_instr_list, instr_format_dict, symbol_table,
-                                                             current_instruction_address)
-            if line_type in [LineType.J_INSTRUCTION, LineType.LABEL_WITH_J_INSTR]:
-                assembled_instr_str = assemble_j_instruction(tokenized_instr_list, instr_format_dict, symbol_table)
-
-            # Write to output file(s)
-            o_file.write(assembled_instr_str + "\n")
-
-
-def assemble(assembly_filename, assembled_filename):
+            # Verify instruction and call appropriate instruction assembler
+            try:
+                assembled_instr = encode_instruction(line_type, tokenized_instr_list, symbol_table,
+                                                     current_instruction_address)
+            except AssemblerError as error:
+                error.line_number = line_number+1                       # +1 since first line is 0
+                raise
+
+            assembled_instr_array.append(assembled_instr)
+
+    return assembled_instr_array
+
+
+# Symbol table of the program being encoded by a worker process (see encode_instructions_parallel(...))
+_worker_symbol_table = None
+
+
+def _init_encode_worker(symbol_table):
+    """
+    Worker process initializer, receives the symbol table once instead of with every chunk
+    """
+    global _worker_symbol_table
+    _worker_symbol_table = symbol_table
+
+
+def _encode_chunk(chunk):
+    """
+    Encodes a chunk of the line type list in a worker process
+    :param chunk: tuple (line number of the first entry, slice of the line type list)
+    """
+    first_line_number, line_type_chunk = chunk
+    return encode_instructions(line_type_chunk, _worker_symbol_table, first_line_number)
+
+
+def encode_instructions_parallel(line_type_list, symbol_table, workers):
+    """
+    Same as encode_instructions(...), but the line type list is split into chunks of PARALLEL_CHUNK_SIZE lines which
+    are encoded across worker processes
+    After the first pass every instruction can be encoded independently of the others, so the chunks only need to be
+    merged back in address order.  If an instruction is invalid, the error of the first invalid instruction is raised
+    just like the serial version.
+    :param line_type_list: line type list (from the first pass)
+    :param symbol_table: dictionary mapping labels to their byte addresses (from the first pass)
+    :param workers: number of worker processes (int)
+    :return: assembled instruction words in address order (array)
+    :raises InvalidInstructionError if an instruction is invalid
+    """
+    chunks = [(i, line_type_list[i:i+PARALLEL_CHUNK_SIZE]) for i in range(0, len(line_type_list), PARALLEL_CHUNK_SIZE)]
+
+    assembled_instr_array = output_formats.get_word_array()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_encode_worker,
+                             initargs=(symbol_table,)) as executor:
+        # map(...) returns the chunks in order
+        for chunk_array in executor.map(_encode_chunk, chunks):
+            assembled_instr_array.extend(chunk_array)
+    return assembled_instr_array
+
+
+def encode_program(line_type_list, symbol_table, workers=None, profile=None, start_address=None, schedule=None):
+    """
+    Verifies and assembles every instruction of the line type list (the second pass without the output)
+    The instructions are encoded through the encode memo (see encode_instructions(...)), across worker processes if
+    requested (see encode_instructions_parallel(...))
+    :param line_type_list: line type list (from the first pass)
+    :param symbol_table: dictionary mapping labels to their byte addresses (from the first pass)
+    :param workers: number of worker processes to encode the instructions with, None or 1 encodes them in this process
+    :param profile: profile dictionary to add the encode and schedule phases to (see profiler.py), None to not profile
+        (verification is part of encoding, since memoized instructions aren't verified again)
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+        (must match the start address used by the first pass, only needed for scheduling)
+    :param schedule: list to fill out with the reordered blocks (see scheduler.schedule_words(...)), None to not
+        reorder the instructions
+    :return: assembled instruction words in address order (array)
+    :raises InvalidInstructionError if an instruction is invalid (with the line number filled in)
+    """
+    with profiler.measure_phase(profile, "encode"):
+        if workers is not None and workers > 1:
+            assembled_instr_array = encode_instructions_parallel(line_type_list, symbol_table, workers)
+        else:
+            assembled_instr_array = encode_instructions(line_type_list, symbol_table)
+    if profile is not None:
+        profile["instructions"] += len(assembled_instr_array)
+
+    # Optionally reorder the instructions within basic blocks to hide latencies
+    if schedule is not None:
+        import scheduler        # Only imported when needed since it pulls in the pipeline model and the simulator
+        with profiler.measure_phase(profile, "schedule"):
+            assembled_instr_array = scheduler.schedule_words(
+                assembled_instr_array, symbol_table, START_ADDRESS if start_address is None else start_address,
+                schedule)
+    return assembled_instr_array
+
+
+def process_second_pass(i_file, o_file, symbol_table, variable_table, line_type_list, output_format="text",
+                        workers=None, start_address=None, schedule=None, profile=None):
+    """
+    Assembles every instruction line using the tokens and addresses found during the first pass
+    and writes them to the output file
+    The instructions are encoded (and optionally scheduled) by encode_program(...) and the words are written in the
+    selected output format with one write
+    Note: the input file is not read again since the first pass already tokenized every instruction
+    :param i_file: assembly language input file handle
+    :param o_file: output file handle (previously opened and ready to write to)
+    :param symbol_table: dictionary mapping labels to their byte addresses (from the first pass)
+    :param variable_table: dictionary mapping variables to their byte addresses (from the first pass)
+    :param line_type_list: line type list (from the first pass)
+    :param output_format: name of the output format (see OUTPUT_FORMAT_DICT in output_formats.py)
+    :param workers: number of worker processes to encode the instructions with (see encode_instructions_parallel(...))
+        None or 1 encodes them in this process
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+        (must match the start address used by the first pass, only written to output formats containing addresses)
+    :param schedule: list to fill out with the reordered blocks (see scheduler.schedule_words(...)), None to not
+        reorder the instructions
+    :param profile: profile dictionary to add the verify, encode, schedule, and output phases to (see profiler.py),
+        None to not profile
+    :return: None
+    :raises InvalidInstructionError if an instruction is invalid
+    """
+    assembled_instr_array = encode_program(line_type_list, symbol_table, workers, profile, start_address, schedule)
+
+    # Render the words and write to output file(s)
+    with profiler.measure_phase(profile, "output"):
+        output_formats.write_words(o_file, assembled_instr_array, output_format,
+                                   START_ADDRESS if start_address is None else start_address)
+
+
+def read_source_lines(i_file):
+    """
+    Generator yielding the lines of the input file one at a time
+    :param i_file: assembly language input file handle (previously opened and ready to read from)
+        (or any other iterable of lines)
+    :return: yields tuples (line number, line) (line numbers start with 0 as first line)
+    """
+    helpers.rewind(i_file)  # Reset read pointer to top of file
+    yield from enumerate(i_file)
+
+
+def classify_source_lines(numbered_lines, clock=None):
+    """
+    Generator determining the type of each line
+    :param numbered_lines: iterable of tuples (line number, line)
+    :param clock: lap clock to add the classify phase to (see profiler.get_lap_clock(...)), None to not profile
+    :return: yields tuples (line number, line, ClassifiedLine)
+    :raises InvalidLineError if a line is invalid
+    """
+    for line_number, line in numbered_lines:
+        # Determine line type (along with its label, mnemonic and operands)
+        classified_line = helpers.classify_line(line)
+        line_type = classified_line.line_type
+        if clock is not None:
+            profiler.lap_classified(clock, line_number, line_type)
+
+        # Catch and report invalid lines at this stage
+        if line_type == LineType.INVALID:
+            raise InvalidLineError("Error invalid line encountered in assembly file",
+                                   line_number+1, line)                         # +1 since first line is 0
+
+        yield line_number, line, classified_line
+
+
+def encode_source_lines(classified_lines, symbol_table, fixup_table, start_address=None, data_layout=None,
+                        variable_table=None, clock=None):
+    """
+    Generator encoding each instruction as soon as it is read
+    Fills out the symbol table as labels are encountered.  Instructions referencing a label which has not been defined
+    yet are added to the fixup table and yielded with a placeholder word (the label field is left as 0).  Once the label
+    appears, the final word is yielded again under the same instruction index.
+    :param classified_lines: iterable of tuples (line number, line, ClassifiedLine)
+    :param symbol_table: dictionary mapping labels to their byte addresses (filled out by this function)
+    :param fixup_table: dictionary mapping labels which have not been defined yet to a list of the instructions
+        referencing them (filled out and emptied by this function)
+        Each entry is a tuple (instruction index, line type, tokenized instruction list,
+                               instruction format dict, instruction address, line number)
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+    :param data_layout: data layout filled out with the data segment (see process_first_pass(...))
+    :param variable_table: dictionary mapping variables to their byte addresses (filled out by this function)
+    :param clock: lap clock to add the tokenize, verify, and encode phases to (see profiler.get_lap_clock(...)), None to
+        not profile (instructions in the encode memo aren't verified again, so encode_instruction(...) is measured as
+        encoding as a whole)
+    :return: yields tuples (instruction index, word, final)
+        final is False for placeholder words which will be yielded again once patched
+    :raises InvalidInstructionError if an instruction is invalid or an la references a label (UndefinedLabelError if a
+        referenced label is never defined)
+    """
+    # Index of the current instruction (instructions are numbered in address order starting with 0)
+    instruction_index = -1
+
+    # Initialize current instruction address counter variable (in bytes, each instruction is 4 bytes)
+    # (less 4 because it will be incremented upon reaching the first valid instruction)
+    current_instruction_address = (START_ADDRESS if start_address is None else start_address) - 4
+    if data_layout is None:
+        data_layout = data_segment.get_empty_data_layout()
+    if variable_table is None:
+        variable_table = {}
+    for line_number, line, classified_line in classified_lines:
+        line_type = classified_line.line_type
+
+        # Increment current instruction address if valid instruction
+        # (pseudo instructions start at this address, the following instructions of their expansion are counted below)
+        if line_type in custom_types.ALL_INSTRUCTIONAL_TYPES or line_type in custom_types.ALL_PSEUDO_TYPES:
+            if data_layout["in_data"]:
+                raise InvalidLineError(DATA_INSTRUCTION_MESSAGE, line_number+1, line)
+            current_instruction_address += 4
+            instruction_index += 1
+
+        # Lay out data and fill out variable table
+        if line_type in data_segment.DATA_LINE_TYPES and \
+                data_segment.process_line(data_layout, line_type, classified_line.label, line, line_number,
+                                          variable_table):
+            continue
+
+        # Fill out symbol/label table and patch the instructions that were waiting on this label
+        if line_type in custom_types.ALL_LABEL_TYPES:
+            label = classified_line.label
+            if line_type == LineType.LABEL_ONLY:
+                symbol_table[label] = current_instruction_address + 4
+            else:
+                symbol_table[label] = current_instruction_address
+
+            for index, fixup_line_type, tokenized_instr_list, instr_format_dict, address, _ in \
+                    fixup_table.pop(label, []):
+                yield index, assemble_instruction(fixup_line_type, tokenized_instr_list, instr_format_dict,
+                                                  symbol_table, address), True
+
+        # Lower pseudo instructions on their own, since a stream can't relax their sizes (see pseudo.py)
+        if line_type in custom_types.ALL_PSEUDO_TYPES:
+            try:
+                instruction_lines = pseudo.get_expanded_lines(line_type, pseudo.get_fixed_size_expansion(
+                    tokenize_classified_line(line, classified_line), variable_table))
+            except AssemblerError as error:
+                error.line_number, error.line = line_number+1, line      # +1 since first line is 0
+                raise
+        elif line_type in custom_types.ALL_INSTRUCTIONAL_TYPES:
+            instruction_lines = [(line_type, tokenize_classified_line(line, classified_line))]
+        else:
+            continue
+        if clock is not None:
+            profiler.lap(clock, "tokenize", line_number)
+
+        # Assemble instructions
+        for position, (line_type, tokenized_instr_list) in enumerate(instruction_lines):
+            if position:
+                current_instruction_address += 4
+                instruction_index += 1
+            try:
+                if tokenized_instr_list[0] in POSITION_INDEPENDENT_MNEMONICS:
+                    word = encode_instruction(line_type, tokenized_instr_list, symbol_table,
+                                              current_instruction_address)
+                    if clock is not None:
+                        profiler.lap(clock, "encode", line_number)
+                    yield instruction_index, word, True
+                    continue
+
+                instr_format_dict = verify_instruction_tokens(tokenized_instr_list, symbol_table,
+                                                              allow_undefined_labels=True)
+            except AssemblerError as error:
+                error.line_number, error.line = line_number+1, line      # +1 since first line is 0
+                raise
+            if clock is not None:
+                profiler.lap(clock, "verify", line_number)
+
+            # Defer instructions referencing a label which has not been defined yet
+            label = get_label_token(tokenized_instr_list, instr_format_dict)
+            if label is not None and label not in symbol_table:
+                fixup_table.setdefault(label, []).append((instruction_index, line_type, tokenized_instr_list,
+                                                          instr_format_dict, current_instruction_address,
+                                                          line_number))
+                word, final = INSTRUCTION_PREFIX_DICT[tokenized_instr_list[0]], False
+            else:
+                word, final = assemble_instruction(line_type, tokenized_instr_list, instr_format_dict, symbol_table,
+                                                   current_instruction_address), True
+            if clock is not None:
+                profiler.lap(clock, "encode", line_number)
+            yield instruction_index, word, final
+
+    data_segment.finish_layout(data_layout, variable_table)
+
+    # Any fixups left over reference labels which were never defined
+    if fixup_table:
+        label, fixup_list = next(iter(fixup_table.items()))
+        raise UndefinedLabelError(f"Label \"{label}\" could not be located in symbol table", label,
+                                  fixup_list[0][5]+1)                   # +1 since first line is 0
+
+
+def write_instruction_stream(o_file, encoded_instrs, output_format="text", clock=None):
+    """
+    Writes the encoded instructions to the output file as they arrive
+    Words are buffered in a compact array and written STREAM_CHUNK_SIZE at a time.  Placeholder words which have
+    already been written when their final word arrives are patched in place (the rendered record has the same length
+    since the opcode is already known), so the output file must be seekable.
+    :param o_file: output file handle (previously opened and ready to write to)
+    :param encoded_instrs: iterable of tuples (instruction index, word, final) as yielded by encode_source_lines(...)
+    :param output_format: name of the output format (see OUTPUT_FORMAT_DICT in output_formats.py)
+    :param clock: lap clock to add the output phase to (see profiler.get_lap_clock(...)), None to not profile
+    :return: number of instructions written (int)
+    :raises ValueError if the output format can't be written as a stream
+    """
+    output_format_dict = output_formats.get_output_format_dict(output_format)
+    render = output_format_dict["render"]
+    if render is None:
+        raise ValueError(f"Output format \"{output_format}\" is not supported in single pass mode")
+    o_file.write(output_format_dict["header"])
+
+    # Words which have not been written yet and the instruction index of the first one
+    buffer = output_formats.get_word_array()
+    buffer_start = 0
+
+    # Indices of the placeholder words still in the buffer
+    buffered_placeholders = set()
+
+    # Dictionary mapping indices of placeholder words already written to their position in the output file
+    written_placeholders = {}
+
+    def flush():
+        nonlocal buffer, buffer_start
+        # Write everything in one go unless the position of a placeholder has to be recorded
+        segment_start = 0
+        for index in sorted(buffered_placeholders):
+            o_file.write(render(buffer[segment_start:index-buffer_start]))
+            written_placeholders[index] = o_file.tell()
+            segment_start = index-buffer_start
+        o_file.write(render(buffer[segment_start:]))
+        buffered_placeholders.clear()
+        buffer_start += len(buffer)
+        buffer = output_formats.get_word_array()
+
+    for index, word, final in encoded_instrs:
+        # New instruction
+        if index == buffer_start + len(buffer):
+            buffer.append(word)
+            if not final:
+                buffered_placeholders.add(index)
+            if len(buffer) >= STREAM_CHUNK_SIZE:
+                flush()
+        # Patched instruction which is still in the buffer
+        elif index >= buffer_start:
+            buffer[index-buffer_start] = word
+            buffered_placeholders.discard(index)
+        # Patched instruction which has already been written
+        else:
+            end_position = o_file.tell()
+            o_file.seek(written_placeholders.pop(index))
+            o_file.write(render((word,)))
+            o_file.seek(end_position)
+        if clock is not None:
+            profiler.lap(clock, "output")
+    flush()
+    if clock is not None:
+        profiler.lap(clock, "output")
+    return buffer_start
+
+
+def read_lines_for_profile(i_file, profile):
+    """
+    Reads the whole file up front when profiling, so reading is measured on its own
+    :param i_file: assembly language input file handle (or any other iterable of lines)
+    :param profile: profile dictionary to add the read phase to (see profiler.py), None to not profile
+    :return: list of lines when profiling, i_file otherwise
+    """
+    if profile is None:
+        return i_file
+    with profiler.measure_phase(profile, "read"):
+        helpers.rewind(i_file)
+        return list(i_file)
+
+
+def encode_single_pass(i_file, symbol_table, variable_table, start_address=None, data_layout=None, clock=None):
+    """
+    Generator assembling the file while reading it only once (see encode_source_lines(...))
+    :param i_file: assembly language input file handle (previously opened and ready to read from)
+        (or any other iterable of lines, a list of lines when profiling, see read_lines_for_profile(...))
+    :param symbol_table: empty dictionary filled out with the labels mapped to their byte addresses
+    :param variable_table: empty dictionary filled out with the variables mapped to their byte addresses
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+    :param data_layout: data layout filled out with the data segment (see process_first_pass(...))
+    :param clock: lap clock to add the classify, tokenize, verify, and encode phases to (see
+        profiler.get_lap_clock(...)), None to not profile (the instruction count and the slowest lines are added to
+        its profile once the generator is exhausted)
+    :return: yields tuples (instruction index, word, final) (see encode_source_lines(...))
+    :raises AssemblerError if a line is invalid or a referenced label is never defined
+    """
+    # Dictionary mapping labels which have not been defined yet to the instructions referencing them
+    fixup_table = {}
+
+    encoded_instrs = encode_source_lines(classify_source_lines(read_source_lines(i_file), clock), symbol_table,
+                                         fixup_table, start_address, data_layout, variable_table, clock)
+    if clock is None:
+        yield from encoded_instrs
+        return
+
+    instruction_count = 0
+    for index, word, final in encoded_instrs:
+        instruction_count = max(instruction_count, index+1)
+        yield index, word, final
+    clock["profile"]["instructions"] += instruction_count
+    profiler.record_slowest_lines(clock["profile"], clock["line_seconds"], i_file.__getitem__)
+
+
+def collect_instruction_stream(encoded_instrs):
+    """
+    Collects the encoded instructions into one array (placeholder words are replaced once their final word arrives)
+    :param encoded_instrs: iterable of tuples (instruction index, word, final) as yielded by encode_source_lines(...)
+    :return: assembled instruction words in address order (array)
+    """
+    words = output_formats.get_word_array()
+    for index, word, _ in encoded_instrs:
+        if index == len(words):
+            words.append(word)
+        else:
+            words[index] = word
+    return words
+
+
+def process_single_pass(i_file, o_file, output_format="text", start_address=None, data_layout=None, profile=None):
+    """
+    Assembles the file while reading it only once
+    The input is streamed through generators from reading the lines through writing the output, so memory use does
+    not grow with the size of the file (only the symbol table and the pending fixups are kept).
+    Each instruction is encoded as soon as it is read.  Branches and jumps to labels that have not been defined yet
+    are placed on a fixup list and patched in the output once the label appears.
+    The output is identical to performing the first and second pass.
+    :param i_file: assembly language input file handle (previously opened and ready to read from)
+    :param o_file: output file handle (previously opened and ready to write to, must be seekable)
+    :param output_format: name of the output format (see OUTPUT_FORMAT_DICT in output_formats.py)
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+    :param data_layout: data layout filled out with the data segment (see process_first_pass(...))
+    :param profile: profile dictionary to fill out (see profiler.py), None to not profile (the file is read up front
+        when profiling, so reading is measured on its own)
+    :return: Tuple (symbol table, variable table)
+    :raises AssemblerError if a line is invalid or a referenced label is never defined
+    """
+    # Dictionary mapping labels to their corresponding byte addresses
+    symbol_table = {}
+
+    # Dictionary mapping variables to their byte addresses
+    variable_table = {}
+
+    i_file = read_lines_for_profile(i_file, profile)
+    clock = profiler.get_lap_clock(profile)
+    encoded_instrs = encode_single_pass(i_file, symbol_table, variable_table, start_address, data_layout, clock)
+    write_instruction_stream(o_file, encoded_instrs, output_format, clock)
+    return symbol_table, variable_table
+
+
+def get_word_line_numbers(line_type_list, line_numbers=None):
+    """
+    Finds the source line every word was assembled from (every word of an expanded pseudo instruction comes from the
+    line of the pseudo instruction, and lines removed by the optimizer have no word)
+    :param line_type_list: line type list the words were encoded from (see pseudo.expand_lines(...))
+    :param line_numbers: source line number of every entry of the line type list (see pseudo.expand_lines(...)), None
+        if its entries are the source lines
+    :return: array of line numbers starting with 0 as first line, one per word
+    """
+    return array("L", (line_number if line_numbers is None else line_numbers[line_number]
+                       for line_number, (line_type, _, _) in enumerate(line_type_list)
+                       if line_type in custom_types.ALL_INSTRUCTIONAL_TYPES))
+
+
+def assemble_program(i_file, single_pass=False, workers=None, start_address=None, profile=None, schedule=None,
+                     optimize=None, data_layout=None, line_numbers=False):
+    """
+    Assembles the input into its words (the passes of process_file(...) and api.assemble_source(...) without the
+    output)
+    Regular files are memory mapped so the first pass can scan them in place (see mapped_source.py), the pseudo
+    instructions are lowered (see pseudo.expand_lines(...)), and the instructions are optionally optimized (see
+    peephole.optimize_lines(...)), encoded, and scheduled (see encode_program(...))
+    :param i_file: assembly language input file handle (previously opened and ready to read from)
+        (or any other iterable of lines)
+    :param single_pass: read the input only once (see encode_single_pass(...)), ignored when scheduling or optimizing
+    :param workers: number of worker processes used by the second pass (see encode_program(...))
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+    :param profile: profile dictionary to fill out (see profiler.get_empty_profile(...)), None to not profile
+    :param schedule: list to fill out with the reordered blocks (see scheduler.schedule_words(...)), None to not
+        reorder the instructions
+    :param optimize: dictionary to fill out with the instruction count reduction (see peephole.optimize_lines(...)),
+        None to not optimize
+    :param data_layout: data layout filled out with the data segment (see process_first_pass(...))
+    :param line_numbers: also find the source line of every word (see get_word_line_numbers(...)), not supported in
+        single pass mode
+    :return: Tuple (words (array), symbol table, variable table, line numbers (array, None unless requested))
+        (line numbers are the lines of the words before they were scheduled when scheduling)
+    :raises AssemblerError if the input is invalid (line_number is filled in, and line whenever it is known)
+    """
+    start_address = START_ADDRESS if start_address is None else start_address
+    if single_pass and schedule is None and optimize is None:
+        symbol_table, variable_table = {}, {}
+        i_file = read_lines_for_profile(i_file, profile)
+        clock = profiler.get_lap_clock(profile)
+        words = collect_instruction_stream(encode_single_pass(i_file, symbol_table, variable_table, start_address,
+                                                              data_layout, clock))
+        return words, symbol_table, variable_table, None
+
+    # Regular files are memory mapped so the first pass can scan them in place (see mapped_source.py)
+    with profiler.measure_phase(profile, "read"):
+        source = mapped_source.open_mapped_source(i_file)
+    expanded_line_numbers = None
+    try:
+        # Perform first pass (build symbol table, determine line types, etc.)
+        if source is None:
+            symbol_table, variable_table, line_type_list = process_first_pass(i_file, start_address, data_layout,
+                                                                              profile)
+        else:
+            symbol_table, variable_table, line_type_list = process_first_pass_mapped(source, start_address,
+                                                                                     data_layout, profile)
+
+        # Lower the pseudo instructions (the line type list gains an entry for every additional instruction)
+        with profiler.measure_phase(profile, "tokenize"):
+            symbol_table, line_type_list, expanded_line_numbers = pseudo.expand_lines(
+                symbol_table, variable_table, line_type_list, start_address)
+
+        # Optionally remove or rewrite redundant instructions (recomputes the symbol table)
+        if optimize is not None:
+            with profiler.measure_phase(profile, "optimize"):
+                symbol_table, line_type_list = peephole.optimize_lines(symbol_table, line_type_list, start_address,
+                                                                       optimize)
+
+        # Perform second pass (assemble the instructions)
+        words = encode_program(line_type_list, symbol_table, workers, profile, start_address, schedule)
+    except AssemblerError as error:
+        # Errors found in the second pass only know their position in the (expanded) line type list
+        if expanded_line_numbers is not None and error.line is None and error.line_number is not None:
+            error.line_number = expanded_line_numbers[error.line_number-1]+1    # +-1 since first line is 0
+        # The line offset index gives the line itself
+        if source is not None and error.line is None and error.line_number is not None:
+            error.line = source.get_line(error.line_number-1)                  # -1 since first line is 0
+        raise
+    finally:
+        if source is not None:
+            source.close()
+
+    word_line_numbers = get_word_line_numbers(line_type_list, expanded_line_numbers) if line_numbers else None
+    return words, symbol_table, variable_table, word_line_numbers
+
+
+def process_file(i_file, o_file, single_pass=False, output_format="text", workers=None, start_address=None,
+                 profile=None, schedule=None, optimize=None, data=None):
+    """
+    Assembles the already opened input file into the already opened output file
+    :param i_file: assembly language input file handle (previously opened and ready to read from)
+    :param o_file: output file handle (previously opened with the mode given by output_formats.get_output_mode(...))
+    :param single_pass: read the input file only once (see process_single_pass(...))
+    :param output_format: name of the output format (see OUTPUT_FORMAT_DICT in output_formats.py)
+    :param workers: number of worker processes used by the second pass (see process_second_pass(...))
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+    :param profile: profile dictionary to fill out (see profiler.get_empty_profile(...)), None to not profile
+        (the passes which run anyway measure their phases, see profiler.py)
+    :param schedule: list to fill out with the reordered blocks (see scheduler.schedule_words(...)), None to not
+        reorder the instructions (scheduling needs every word, so single_pass is ignored when scheduling)
+    :param optimize: dictionary to fill out with the instruction count reduction (see peephole.optimize_lines(...)),
+        None to not optimize (the optimizer needs the whole first pass, so single_pass is ignored when optimizing)
+    :param data: dictionary to fill out with the data segment, None to only lay it out (for the variable table)
+        start_address - byte address of the data segment
+        image - memory image of the data segment (bytearray, see data_segment.build_data_image(...))
+    :return: Tuple (symbol table, variable table)
+    :raises AssemblerError if the assembly file is invalid
+    """
+    data_layout = data_segment.get_empty_data_layout()
+    symbol_table, variable_table = _process_file(i_file, o_file, single_pass, output_format, workers, start_address,
+                                                 profile, schedule, optimize, data_layout)
+    if data is not None:
+        data.update(start_address=data_layout["start_address"],
+                    image=data_segment.build_data_image(data_layout, symbol_table, variable_table))
+    return symbol_table, variable_table
+
+
+def _process_file(i_file, o_file, single_pass, output_format, workers, start_address, profile, schedule, optimize,
+                  data_layout):
+    """
+    Assembles the instructions for process_file(...) and lays out the data segment
+    :return: Tuple (symbol table, variable table)
+    """
+    if single_pass and schedule is None and optimize is None:
+        # Assemble file reading it only once (streamed to the output file)
+        return process_single_pass(i_file, o_file, output_format, start_address, data_layout, profile)
+
+    words, symbol_table, variable_table, _ = assemble_program(i_file, False, workers, start_address, profile,
+                                                              schedule, optimize, data_layout)
+
+    # Render the words and write to output file(s)
+    with profiler.measure_phase(profile, "output"):
+        output_formats.write_words(o_file, words, output_format, START_ADDRESS if start_address is None else
+                                   start_address)
+    return symbol_table, variable_table
+
+
+def get_data_filename(assembled_filename):
+    """
+    :param assembled_filename: output filename of the instructions
+    :return: default output filename of the data segment image (".data" inserted in front of the extension)
+    """
+    stem, extension = os.path.splitext(assembled_filename)
+    return stem + ".data" + extension
+
+
+def assemble(assembly_filename, assembled_filename, single_pass=False, output_format="text", workers=None,
+             start_address=None, log=print, profile=None, schedule=None, optimize=None, data_filename=None):
     """
     This function is primarily responsible for the file handling aspects surrounding the assembly process.
     It verifies the input file can be read and output file can be written to etc.
@@ -122,31 +887,61 @@ def assemble(assembly_filename, assembled_filename):
     It also catches the exceptions that may occur during the assembly process and prints them
     :param assembly_filename: input filename (or full path if not in the same directory) (include file extension)
     :param assembled_filename: output filename (or full path if not in the same directory) (don't include extension)
-    :return: None
+    :param single_pass: read the input file only once and backpatch forward references instead of performing
+        separate first and second passes (the output is identical)
+    :param output_format: name of the output format (see OUTPUT_FORMAT_DICT in output_formats.py)
+        "text" (binary represented in ascii), "bin" (raw big endian), "bin_le" (raw little endian), "ihex" (Intel HEX),
+        "readmemh" (Verilog $readmemh image), or "logisim" (Logisim memory image)
+    :param workers: number of worker processes to encode the instructions with in the second pass
+        (None or 1 encodes them in this process, the output is identical either way)
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+    :param log: function called with the error messages (defaults to print)
+    :param profile: profile dictionary to fill out with per phase timings (see profiler.get_empty_profile(...)),
+        None to not profile
+    :param schedule: list to fill out with the blocks reordered to hide latencies (see scheduler.schedule_words(...)),
+        None to keep the instructions in source order
+    :param optimize: dictionary to fill out with the instruction count reduction of the peephole optimizer
+        (see peephole.optimize_lines(...)), None to not optimize
+    :param data_filename: output filename of the data segment image (written in the same output format, only if the
+        program has data), defaults to the output filename with ".data" in front of its extension
+    :return: True if the file was assembled, False if an error occurred
     """
     # Open input file
     with helpers.open_with_error(assembly_filename, "r") as (i_file, i_error):
         # Check for error opening input file
         if i_error:
-            print("Error occurred opening input file.")
-            print("Error: ", i_error)
-        else:
+            log("Error occurred opening input file.")
+            log("Error: ", i_error)
+            return False
+
+        # Create output file
+        # Note: If you want to prevent overwriting files change mode to "x"
+        with helpers.open_with_error(assembled_filename, output_formats.get_output_mode(output_format)) \
+                as (o_file, o_error):
+            # Check for error creating output file
+            if o_error:
+                log("Error occurred creating output file.")
+                log("Error: ", o_error)
+                return False
+
+            # Begin assembly process
+            data = {}
+            try:
+                process_file(i_file, o_file, single_pass, output_format, workers, start_address, profile, schedule,
+                             optimize, data)
+            except Exception as error:
+                log(error)
+                return False
 
-            # Create output file
-            # Note: If you want to prevent overwriting files change mode to "x"
-            with helpers.open_with_error(assembled_filename, "w") as (o_file, o_error):
-                # Check for error creating output file
-                if o_error:
-                    print("Error occurred creating output file.")
-                    print("Error: ", o_error)
-                else:
-                    # Begin assembly process
-                    try:
-                        # Perform first pass (build symbol table, determine line types, etc.)
-                        symbol_table, variable_table, line_type_list = process_first_pass(i_file)
-
-                        # Perform second pass (assemble file)
-                        process_second_pass(i_file, o_file, symbol_table, variable_table, line_type_list)
-                    except Exception as error:
-                        print(error)
-    return
+    # Write the data segment image (if any)
+    if data["image"]:
+        if data_filename is None:
+            data_filename = get_data_filename(assembled_filename)
+        with helpers.open_with_error(data_filename, output_formats.get_output_mode(output_format)) \
+                as (d_file, d_error):
+            if d_error:
+                log("Error occurred creating data output file.")
+                log("Error: ", d_error)
+                return False
+            data_segment.write_data_image(d_file, data["image"], output_format, data["start_address"])
+    return True
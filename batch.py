@@ -0,0 +1,177 @@
+from concurrent.futures import ProcessPoolExecutor
+import output_formats
+import data_segment
+import assembler
+import argparse
+import glob
+import json
+import time
+import sys
+import os
+
+
+def get_input_filenames(source):
+    """
+    Determines the assembly files to assemble from a directory, glob pattern, or manifest
+    :param source: one of the following (string)
+        directory - every *.asm file in the directory
+        manifest - a file (not ending in .asm) listing one assembly file per line (blank lines and lines starting with
+                   "#" are ignored, relative paths are relative to the manifest)
+        glob pattern - every file matching the pattern (i.e. "Assembly Files/*.asm")
+    :return: list of assembly filenames (list)
+    """
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "*.asm")))
+
+    if os.path.isfile(source) and not source.endswith(".asm"):
+        manifest_directory = os.path.dirname(source)
+        with open(source) as manifest:
+            return [os.path.join(manifest_directory, line.strip()) for line in manifest
+                    if line.strip() != "" and not line.strip().startswith("#")]
+
+    return sorted(glob.glob(source, recursive=True))
+
+
+def assemble_job(job):
+    """
+    Assembles a single file of a batch (runs in a worker process)
+    Errors are returned instead of printed so they can be collected in the batch report
+    :param job: tuple (assembly filename, assembled filename, single pass, output format, optimize)
+    :return: result dictionary with the keys input, output, data_output (the data segment image, written next to the
+        output like assembler.assemble(...) does, None if the program has no data), success, error, and seconds
+        (and instructions_before and instructions_after if optimizing, see peephole.optimize_lines(...))
+    """
+    assembly_filename, assembled_filename, single_pass, output_format, optimize = job
+    result = {"input": assembly_filename, "output": assembled_filename, "data_output": None, "success": False,
+              "error": None}
+    optimize_report = {} if optimize else None
+    data = {}
+    start_time = time.perf_counter()
+    try:
+        with open(assembly_filename, "r") as i_file, \
+                open(assembled_filename, output_formats.get_output_mode(output_format)) as o_file:
+            assembler.process_file(i_file, o_file, single_pass, output_format, optimize=optimize_report, data=data)
+        if data["image"]:
+            result["data_output"] = assembler.get_data_filename(assembled_filename)
+            with open(result["data_output"], output_formats.get_output_mode(output_format)) as d_file:
+                data_segment.write_data_image(d_file, data["image"], output_format, data["start_address"])
+        result["success"] = True
+        if optimize:
+            result["instructions_before"] = optimize_report["instructions_before"]
+            result["instructions_after"] = optimize_report["instructions_after"]
+    except Exception as error:
+        result["error"] = str(error)
+    result["seconds"] = time.perf_counter() - start_time
+    return result
+
+
+def get_output_filenames(input_filenames, output_directory, extension):
+    """
+    Names the output file of every input file of a batch
+    The directories of the inputs are kept relative to the deepest directory containing all of them, so inputs with
+    the same name in different directories (i.e. from a recursive glob) don't overwrite each other
+    :param input_filenames: list of assembly filenames (list)
+    :param output_directory: directory the assembled files are written to (string)
+    :param extension: extension of the output format (string)
+    :return: list of assembled filenames in the same order as the input filenames (list)
+    :raises ValueError if two inputs would still be written to the same output file (i.e. the same file listed twice)
+    """
+    if not input_filenames:
+        return []
+    input_directories = [os.path.dirname(os.path.abspath(filename)) for filename in input_filenames]
+    root = os.path.commonpath(input_directories)
+
+    output_filenames = []
+    inputs_by_output = {}
+    for assembly_filename, input_directory in zip(input_filenames, input_directories):
+        assembled_filename = os.path.normpath(os.path.join(
+            output_directory, os.path.relpath(input_directory, root),
+            os.path.splitext(os.path.basename(assembly_filename))[0] + extension))
+        if assembled_filename in inputs_by_output:
+            raise ValueError(f"\"{inputs_by_output[assembled_filename]}\" and \"{assembly_filename}\" would both be "
+                             f"assembled to \"{assembled_filename}\"")
+        inputs_by_output[assembled_filename] = assembly_filename
+        output_filenames.append(assembled_filename)
+    return output_filenames
+
+
+def assemble_batch(input_filenames, output_directory, single_pass=False, output_format="text", workers=None,
+                   optimize=False):
+    """
+    Assembles many assembly files across a pool of worker processes
+    Each output file is named after its input file with the extension of the output format, in the same subdirectory
+    of the output directory as the input is of the directory containing every input (see get_output_filenames(...))
+    :param input_filenames: list of assembly filenames (list)
+    :param output_directory: directory the assembled files are written to (created if needed) (string)
+    :param single_pass: read each input file only once (see assembler.process_single_pass(...))
+    :param output_format: name of the output format (see OUTPUT_FORMAT_DICT in output_formats.py)
+    :param workers: number of worker processes (defaults to the number of cores)
+    :param optimize: run the peephole optimizer on every file and report the instruction counts
+        (see peephole.optimize_lines(...))
+    :return: list of result dictionaries in the same order as the input filenames (see assemble_job(...))
+    :raises ValueError if two inputs would be assembled to the same output file (nothing is assembled in that case)
+    """
+    extension = output_formats.get_output_format_dict(output_format)["extension"]
+    output_filenames = get_output_filenames(input_filenames, output_directory, extension)
+    for directory in {os.path.dirname(assembled_filename) for assembled_filename in output_filenames} \
+            | {output_directory}:
+        os.makedirs(directory, exist_ok=True)
+    jobs = [(assembly_filename, assembled_filename, single_pass, output_format, optimize)
+            for assembly_filename, assembled_filename in zip(input_filenames, output_filenames)]
+
+    workers = workers or os.cpu_count() or 1
+    # Hand out several small files per task so the pool overhead doesn't dominate
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(assemble_job, jobs, chunksize=chunksize))
+
+
+def write_report(results, report_filename):
+    """
+    Writes a JSON summary report of a batch
+    :param results: list of result dictionaries (see assemble_job(...))
+    :param report_filename: report filename (string)
+    :return: summary dictionary with the keys total, succeeded, and failed
+    """
+    summary = {"total": len(results),
+               "succeeded": sum(result["success"] for result in results),
+               "failed": sum(not result["success"] for result in results)}
+    with open(report_filename, "w") as report_file:
+        json.dump({"summary": summary, "results": results}, report_file, indent=2)
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Assemble many MIPS assembly files in parallel")
+    parser.add_argument("source", help="directory, glob pattern, or manifest file listing the .asm files")
+    parser.add_argument("-o", "--output-directory", default="Assembled Files",
+                        help="directory for the assembled files (default: %(default)s)")
+    parser.add_argument("-f", "--format", default="text", choices=output_formats.OUTPUT_FORMAT_DICT,
+                        help="output format (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument("--single-pass", action="store_true", help="read each input file only once")
+    parser.add_argument("--optimize", action="store_true",
+                        help="remove redundant instructions and print the instruction count reduction of every file")
+    parser.add_argument("--report", default=None,
+                        help="summary report filename (default: batch_report.json in the output directory)")
+    args = parser.parse_args()
+
+    try:
+        batch_results = assemble_batch(get_input_filenames(args.source), args.output_directory, args.single_pass,
+                                       args.format, args.workers, args.optimize)
+    except ValueError as batch_error:
+        print(batch_error)
+        sys.exit(1)
+    batch_summary = write_report(batch_results,
+                                 args.report or os.path.join(args.output_directory, "batch_report.json"))
+
+    for batch_result in batch_results:
+        if not batch_result["success"]:
+            print(f"FAILED {batch_result['input']}: {batch_result['error']}")
+        elif args.optimize:
+            print(f"{batch_result['input']}: {batch_result['instructions_before']:,} -> "
+                  f"{batch_result['instructions_after']:,} instructions")
+    print(f"{batch_summary['succeeded']} of {batch_summary['total']} files assembled, "
+          f"{batch_summary['failed']} failed")
+    sys.exit(1 if batch_summary["failed"] else 0)
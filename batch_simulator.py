@@ -0,0 +1,415 @@
+"""
+Lockstep batch simulation of many copies of one program with NumPy
+
+For grading and fuzzing the same program is run against many different initial states.  Instead of running each copy
+separately (see simulator.py), N copies ("lanes") are held in NumPy arrays and stepped together:
+    registers - (N, 32) array of unsigned 32 bit registers, plus (N,) arrays for HI and LO
+    memory - (N, memory_size) array of bytes (big endian), every lane has its own memory
+    index - (N,) array with the instruction index each lane executes next
+
+Every step the lowest instruction index among the running lanes is executed for all lanes at that index (a mask), so
+lanes which took a different branch wait and join again once the others catch up (i.e. after an if/else or when the
+remaining lanes leave a loop).  When all lanes agree, which is the common case for data parallel work, every step runs
+on whole columns without masking.
+
+Each lane follows exactly the same semantics as simulator.run(...) (same registers, memory, step counts, and errors).
+Differences:
+    lanes don't raise, a lane which fails stops and its SimulationError is stored in the errors list
+    the text segment is decoded once for all lanes, so writing to it is an error in batch mode
+
+NumPy is optional for the rest of the assembler, it is only needed to use this module.
+"""
+from custom_types import SimulationError
+from instruction_assemblers import J_TYPE_OPCODES, IMM_MASK, ADDRESS_MASK
+import output_formats
+import simulator
+import assembler
+import api
+
+try:
+    import numpy as np
+except ImportError:     # NumPy is only required for batch simulation
+    np = None
+
+# Default size of the memory of each lane in bytes (every lane has its own copy, so keep it small)
+DEFAULT_BATCH_MEMORY_SIZE = 1 << 16
+
+# Lane status values
+RUNNING = 0
+HALTED = 1          # Control left the text segment
+FAULTED = 2         # An instruction failed (see the errors list)
+STEP_LIMIT = 3      # max_steps instructions were executed
+
+# Instruction index of lanes which stopped (larger than any real index, so they are never scheduled)
+STOPPED_INDEX = 2**62
+
+
+def require_numpy():
+    """
+    :raises ImportError if NumPy is not installed
+    """
+    if np is None:
+        raise ImportError("Batch simulation requires NumPy (pip install numpy)")
+
+
+def load_batch(words, count, start_address=None, memory_size=DEFAULT_BATCH_MEMORY_SIZE, data_image=None,
+               data_address=None):
+    """
+    Creates a batch of lanes with the same program loaded
+    The batch is a dictionary with the keys
+        registers - (count, 32) uint32 array (set initial inputs here before running)
+        hi, lo - (count,) uint32 arrays
+        memory - (count, memory_size) uint8 array
+        index - (count,) int64 array of the instruction index each lane executes next
+        stop_address - (count,) int64 array of the address control went to when a lane halted
+        steps - (count,) int64 array of executed instructions
+        status - (count,) int8 array (RUNNING, HALTED, FAULTED, or STEP_LIMIT)
+        errors - list with the SimulationError of each lane which faulted (None otherwise)
+        text_start, text_end, instruction_count, words - the program
+    Registers start out like simulator.load_program(...) ($sp at the top of memory, $ra just past the program)
+    :param words: assembled instruction words (iterable of int)
+    :param count: number of lanes (int)
+    :param start_address: byte address of the first instruction (defaults to assembler.START_ADDRESS)
+    :param memory_size: size of the memory of each lane in bytes (int)
+    :param data_image: memory image of the data segment copied into every lane (see simulator.load_program(...))
+    :param data_address: byte address of the data segment (see simulator.get_data_address(...))
+    :return: batch dictionary
+    :raises SimulationError if the program or its data segment doesn't fit in memory, ImportError if NumPy is not
+        installed
+    """
+    require_numpy()
+    start_address = assembler.START_ADDRESS if start_address is None else start_address
+    words = output_formats.get_word_array(words)
+    text = output_formats.render_big_endian(words)
+    if start_address & 3:
+        raise SimulationError("Start address is not word aligned", start_address)
+    if start_address + len(text) > memory_size:
+        raise SimulationError("Program does not fit in memory", start_address)
+
+    if data_image:
+        simulator.check_data_segment(start_address, len(text), memory_size, data_image, data_address)
+
+    memory = np.zeros((count, memory_size), dtype=np.uint8)
+    memory[:, start_address:start_address+len(text)] = np.frombuffer(text, dtype=np.uint8)
+    if data_image:
+        memory[:, data_address:data_address+len(data_image)] = np.frombuffer(bytes(data_image), dtype=np.uint8)
+    registers = np.zeros((count, 32), dtype=np.uint32)
+    registers[:, 29] = memory_size & ~7
+    registers[:, 31] = start_address + len(text)
+
+    return {"registers": registers, "hi": np.zeros(count, dtype=np.uint32), "lo": np.zeros(count, dtype=np.uint32),
+            "memory": memory, "index": np.zeros(count, dtype=np.int64),
+            "stop_address": np.zeros(count, dtype=np.int64), "steps": np.zeros(count, dtype=np.int64),
+            "status": np.zeros(count, dtype=np.int8), "errors": [None] * count,
+            "text_start": start_address, "text_end": start_address + len(text), "instruction_count": len(words),
+            "words": words}
+
+
+def get_pc(batch):
+    """
+    :param batch: batch dictionary (see load_batch(...))
+    :return: (count,) int64 array with the byte address of each lane's next instruction (or where it halted)
+    """
+    pc = batch["text_start"] + 4 * batch["index"]
+    return np.where(batch["status"] == HALTED, batch["stop_address"], pc)
+
+
+def decode_program(batch):
+    """
+    Decodes every instruction of the text segment once for all lanes
+    :param batch: batch dictionary (see load_batch(...))
+    :return: list of tuples (mnemonic, rs, rt, rd, shamt, imm, simm, target address) (mnemonic is None for words
+        which are not supported instructions, target address is None for instructions which aren't branches or jumps)
+    """
+    decoded_program = []
+    for index, word in enumerate(batch["words"]):
+        address = batch["text_start"] + 4 * index
+        opcode = word >> 26
+        mnemonic = simulator.DECODE_DICT.get((opcode, word & 0x3F if opcode == 0 else None))
+        imm = word & IMM_MASK
+        simm = imm - ((imm & 0x8000) << 1)
+        target = None
+        if opcode in J_TYPE_OPCODES:
+            target = ((address + 4) & 0xF0000000) | ((word & ADDRESS_MASK) << 2)
+        elif mnemonic in ["beq", "bne", "bgtz", "blez"]:
+            target = address + 4 + 4 * simm
+        decoded_program.append((mnemonic, (word >> 21) & 0x1F, (word >> 16) & 0x1F, (word >> 11) & 0x1F,
+                                (word >> 6) & 0x1F, imm, simm, target))
+    return decoded_program
+
+
+def run_batch(batch, max_steps=simulator.DEFAULT_MAX_STEPS):
+    """
+    Runs every lane until it leaves the text segment, fails, or has executed max_steps instructions
+    :param batch: batch dictionary (see load_batch(...)) (updated in place)
+    :param max_steps: maximum number of instructions each lane executes (int)
+    :return: number of lockstep rounds (steps executed for at least one lane) (int)
+    """
+    require_numpy()
+    registers, memory = batch["registers"], batch["memory"]
+    signed_registers = registers.view(np.int32)
+    hi, lo = batch["hi"], batch["lo"]
+    index, steps, status = batch["index"], batch["steps"], batch["status"]
+    text_start, text_end = batch["text_start"], batch["text_end"]
+    instruction_count = batch["instruction_count"]
+    memory_size = memory.shape[1]
+    decoded_program = decode_program(batch)
+
+    # Lanes which hit the step limit of a previous call continue, lanes which halted or failed never get scheduled
+    status[status == STEP_LIMIT] = RUNNING
+    stopped = status != RUNNING
+    stopped_index = index[stopped]
+    index[stopped] = STOPPED_INDEX
+    start_steps = steps.copy()
+
+    # Dictionary mapping lanes which stopped at an instruction (step limit or failure) to that instruction's index
+    parked_index = {}
+
+    def set_register(d, values, mask, full):
+        # Writes to $zero are discarded
+        if d == 0:
+            return
+        if full:
+            registers[:, d] = values
+        else:
+            registers[:, d] = np.where(mask, values, registers[:, d])
+
+    def fault(lanes, message, instruction_index, fault_address=None):
+        for lane in np.flatnonzero(lanes):
+            text = message if fault_address is None else message.format(int(fault_address[lane]))
+            batch["errors"][lane] = SimulationError(text, text_start + 4 * instruction_index)
+        status[lanes] = FAULTED
+
+    def jump(lanes, target_address):
+        # Moves lanes to a static target (stopping them if it's outside the text segment)
+        target_index = (target_address - text_start) >> 2
+        if 0 <= target_index < instruction_count:
+            index[lanes] = target_index
+        else:
+            status[lanes] = HALTED
+            batch["stop_address"][lanes] = target_address
+            index[lanes] = STOPPED_INDEX
+
+    def jump_register(lanes, target_addresses, instruction_index):
+        # Moves lanes to per lane targets (the same checks as simulator.get_target_index(...))
+        unaligned = lanes & ((target_addresses & 3) != 0)
+        if unaligned.any():
+            for lane in np.flatnonzero(unaligned):
+                batch["errors"][lane] = SimulationError("Jump to an address which is not word aligned",
+                                                        int(target_addresses[lane]))
+            status[unaligned] = FAULTED
+            lanes = lanes & ~unaligned
+        target_indexes = (target_addresses - text_start) >> 2
+        inside = (target_addresses >= text_start) & (target_indexes < instruction_count)
+        index[:] = np.where(lanes & inside, target_indexes, index)
+        outside = lanes & ~inside
+        if outside.any():
+            status[outside] = HALTED
+            batch["stop_address"][outside] = target_addresses[outside]
+            index[outside] = STOPPED_INDEX
+
+    def get_addresses(rs, simm, size, mask, instruction_index, kind):
+        # Effective addresses and the lanes which can access them (the others fault like the simulator)
+        addresses = (registers[:, rs].astype(np.int64) + simm) & 0xFFFFFFFF
+        unaligned = mask & ((addresses & (size - 1)) != 0)
+        if unaligned.any():
+            fault(unaligned, f"Unaligned {kind} {{:#010x}}", instruction_index, addresses)
+        out_of_range = mask & ~unaligned & (addresses + size > memory_size)
+        if out_of_range.any():
+            fault(out_of_range, "Memory access out of range", instruction_index)
+        return addresses, mask & ~unaligned & ~out_of_range
+
+    rounds = 0
+    while True:
+        current_index = int(index.min())
+        if current_index >= STOPPED_INDEX:
+            break
+        mask = index == current_index
+
+        # Lanes which ran past the last instruction halt at the end of the text segment
+        if current_index == instruction_count:
+            status[mask] = HALTED
+            batch["stop_address"][mask] = text_end
+            index[mask] = STOPPED_INDEX
+            continue
+
+        # Lanes are at most rounds steps in, so the limit only needs checking once rounds reaches it
+        if rounds >= max_steps:
+            limited = mask & (steps - start_steps >= max_steps)
+            if limited.any():
+                status[limited] = STEP_LIMIT
+                index[limited] = STOPPED_INDEX
+                parked_index.update((lane, current_index) for lane in np.flatnonzero(limited))
+                continue
+        rounds += 1
+
+        full = bool(mask.all())
+        mnemonic, rs, rt, rd, shamt, imm, simm, target = decoded_program[current_index]
+        next_index = current_index + 1
+        d_rt = rt   # Destination of I type instructions
+
+        # Instructions are counted before they run, lanes which fail are corrected below
+        steps[mask] += 1
+        advance = True
+
+        if mnemonic is None:
+            word = int(batch["words"][current_index])
+            fault(mask, f"Unknown instruction word {word:#010x}", current_index)
+        elif mnemonic in ["add", "addu"]:
+            set_register(rd, registers[:, rs] + registers[:, rt], mask, full)
+        elif mnemonic in ["sub", "subu"]:
+            set_register(rd, registers[:, rs] - registers[:, rt], mask, full)
+        elif mnemonic == "and":
+            set_register(rd, registers[:, rs] & registers[:, rt], mask, full)
+        elif mnemonic == "or":
+            set_register(rd, registers[:, rs] | registers[:, rt], mask, full)
+        elif mnemonic == "xor":
+            set_register(rd, registers[:, rs] ^ registers[:, rt], mask, full)
+        elif mnemonic == "nor":
+            set_register(rd, ~(registers[:, rs] | registers[:, rt]), mask, full)
+        elif mnemonic == "slt":
+            set_register(rd, signed_registers[:, rs] < signed_registers[:, rt], mask, full)
+        elif mnemonic == "sltu":
+            set_register(rd, registers[:, rs] < registers[:, rt], mask, full)
+        elif mnemonic == "sll":
+            set_register(rd, registers[:, rt] << np.uint32(shamt), mask, full)
+        elif mnemonic == "srl":
+            set_register(rd, registers[:, rt] >> np.uint32(shamt), mask, full)
+        elif mnemonic == "sra":
+            set_register(rd, (signed_registers[:, rt] >> shamt).view(np.uint32), mask, full)
+        elif mnemonic == "mfhi":
+            set_register(rd, hi, mask, full)
+        elif mnemonic == "mflo":
+            set_register(rd, lo, mask, full)
+        elif mnemonic == "mthi":
+            hi[mask] = registers[mask, rs]
+        elif mnemonic == "mtlo":
+            lo[mask] = registers[mask, rs]
+        elif mnemonic in ["mult", "multu"]:
+            if mnemonic == "mult":
+                product = signed_registers[:, rs].astype(np.int64) * signed_registers[:, rt].astype(np.int64)
+            else:
+                product = registers[:, rs].astype(np.uint64) * registers[:, rt].astype(np.uint64)
+            hi[mask] = (product >> 32).astype(np.uint32)[mask]
+            lo[mask] = product.astype(np.uint32)[mask]
+            set_register(rd, lo, mask, full)
+        elif mnemonic in ["div", "divu"]:
+            if mnemonic == "div":
+                dividend = signed_registers[:, rs].astype(np.int64)
+                divisor = signed_registers[:, rt].astype(np.int64)
+            else:
+                dividend = registers[:, rs].astype(np.int64)
+                divisor = registers[:, rt].astype(np.int64)
+            # Division by zero leaves HI and LO unchanged (like the simulator)
+            divides = mask & (divisor != 0)
+            divisor = np.where(divisor != 0, divisor, 1)
+            # Round toward zero like C
+            quotient = np.abs(dividend) // np.abs(divisor)
+            quotient = np.where((dividend < 0) != (divisor < 0), -quotient, quotient)
+            hi[divides] = (dividend - quotient * divisor).astype(np.uint32)[divides]
+            lo[divides] = quotient.astype(np.uint32)[divides]
+            set_register(rd, lo, mask, full)
+        elif mnemonic in ["jr", "jalr"]:
+            jump_register(mask, registers[:, rs].astype(np.int64), current_index)
+            if mnemonic == "jalr":
+                registers[mask & (status != FAULTED), 31] = text_start + 4 * next_index
+            advance = False
+        elif mnemonic in ["addi", "addiu"]:
+            set_register(d_rt, registers[:, rs] + np.uint32(simm & 0xFFFFFFFF), mask, full)
+        elif mnemonic == "andi":
+            set_register(d_rt, registers[:, rs] & np.uint32(imm), mask, full)
+        elif mnemonic == "ori":
+            set_register(d_rt, registers[:, rs] | np.uint32(imm), mask, full)
+        elif mnemonic == "slti":
+            set_register(d_rt, signed_registers[:, rs] < simm, mask, full)
+        elif mnemonic == "sltiu":
+            set_register(d_rt, registers[:, rs] < np.uint32(simm & 0xFFFFFFFF), mask, full)
+        elif mnemonic == "lui":
+            set_register(d_rt, np.uint32(imm << 16), mask, full)
+        elif mnemonic in ["beq", "bne", "bgtz", "blez"]:
+            if mnemonic == "beq":
+                taken = registers[:, rs] == registers[:, rt]
+            elif mnemonic == "bne":
+                taken = registers[:, rs] != registers[:, rt]
+            elif mnemonic == "bgtz":
+                taken = signed_registers[:, rs] > 0
+            else:
+                taken = signed_registers[:, rs] <= 0
+            taken &= mask
+            index[mask & ~taken] = next_index
+            if taken.any():
+                jump(taken, target)
+            advance = False
+        elif mnemonic in ["j", "jal"]:
+            if mnemonic == "jal":
+                registers[mask, 31] = text_start + 4 * next_index
+            jump(mask, target)
+            advance = False
+        elif mnemonic in ["lw", "lhu", "lbu", "lb"]:
+            size = {"lw": 4, "lhu": 2, "lbu": 1, "lb": 1}[mnemonic]
+            kind = {"lw": "word load from", "lhu": "halfword load from"}.get(mnemonic, "load from")
+            addresses, lanes = get_addresses(rs, simm, size, mask, current_index, kind)
+            rows = np.flatnonzero(lanes)
+            row_addresses = addresses[rows]
+            values = np.zeros(len(rows), dtype=np.uint32)
+            for offset in range(size):
+                values = (values << np.uint32(8)) | memory[rows, row_addresses + offset]
+            if mnemonic == "lb":
+                values = values.astype(np.uint8).view(np.int8).astype(np.int32).view(np.uint32)
+            if rt != 0:
+                registers[rows, rt] = values
+        elif mnemonic in ["sw", "sh", "sb"]:
+            size = {"sw": 4, "sh": 2, "sb": 1}[mnemonic]
+            addresses, lanes = get_addresses(rs, simm, size, mask, current_index, "store to")
+            into_text = lanes & (addresses + size > text_start) & (addresses < text_end)
+            if into_text.any():
+                fault(into_text, "Writing to the text segment is not supported in batch mode", current_index)
+                lanes &= ~into_text
+            rows = np.flatnonzero(lanes)
+            row_addresses = addresses[rows]
+            values = registers[rows, rt]
+            for offset in range(size):
+                memory[rows, row_addresses + offset] = (values >> np.uint32(8 * (size - 1 - offset))) & 0xFF
+        else:
+            raise SimulationError(f"No batch handler for instruction \"{mnemonic}\"")
+
+        if advance:
+            index[mask] = next_index
+
+        # Lanes which failed don't count the failing instruction and stay at it
+        faulted = mask & (status == FAULTED)
+        if faulted.any():
+            steps[faulted] -= 1
+            index[faulted] = STOPPED_INDEX
+            parked_index.update((lane, current_index) for lane in np.flatnonzero(faulted))
+
+    # Put lanes which stopped at an instruction back at that instruction
+    index[stopped] = stopped_index
+    for lane, lane_index in parked_index.items():
+        index[lane] = lane_index
+    return rounds
+
+
+def simulate_batch(source, initial_registers, start_address=None, memory_size=DEFAULT_BATCH_MEMORY_SIZE,
+                   max_steps=simulator.DEFAULT_MAX_STEPS):
+    """
+    Assembles a program and runs it once for every row of initial registers
+    :param source: the assembly program (see api.get_source_lines(...) for the supported types)
+    :param initial_registers: (N, 32) array of initial register values, one row per lane ($sp and $ra are only set
+        from the defaults where the row has 0)
+    :param start_address: byte address of the first instruction (defaults to assembler.START_ADDRESS)
+    :param memory_size: size of the memory of each lane in bytes (int)
+    :param max_steps: maximum number of instructions each lane executes (int)
+    :return: batch dictionary after running (see load_batch(...))
+    :raises AssemblerError if the program is invalid, ImportError if NumPy is not installed
+    """
+    require_numpy()
+    program = api.assemble_source(source, start_address, data_address=simulator.get_data_address(memory_size))
+    initial_registers = np.asarray(initial_registers, dtype=np.uint32)
+    batch = load_batch(program.words, initial_registers.shape[0], program.start_address, memory_size,
+                       program.data_image, program.data_address)
+    registers = batch["registers"]
+    registers[:] = np.where(initial_registers != 0, initial_registers, registers)
+    registers[:, 0] = 0
+    run_batch(batch, max_steps)
+    return batch
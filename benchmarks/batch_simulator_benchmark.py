@@ -0,0 +1,126 @@
+"""
+Benchmark of lockstep batch simulation (batch_simulator.py) against running every input separately (simulator.py)
+
+Two programs are run: a data parallel kernel whose trip count and branches depend on the input in $a0, and the real
+Assembly Files/advanced.asm whose outer loop count (varA in its data segment) is set from the input in every lane's
+memory.  The lanes diverge and join again in both.  Reports the total simulated instructions per second of both ways
+for a few batch sizes.
+
+Usage (from the repository root):
+    python benchmarks/batch_simulator_benchmark.py [batch size] [batch size] ...
+"""
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np          # noqa: E402
+import batch_simulator      # noqa: E402
+import simulator            # noqa: E402
+import api                  # noqa: E402
+
+# Sums the bytes of $a0 with a few odd/even dependent steps for 100 + ($a0 & 63) iterations
+KERNEL = """
+    main:   andi $t0, $a0, 63
+            addi $t0, $t0, 100
+            addi $s0, $sp, -256
+    loop:   andi $t1, $t0, 1
+            beq $t1, $0, even
+            xor $v0, $v0, $t0
+            j next
+    even:   add $v0, $v0, $a0
+            srl $a0, $a0, 1
+    next:   andi $t2, $t0, 63
+            sll $t2, $t2, 2
+            add $t3, $s0, $t2
+            sw $v0, 0($t3)
+            lw $t4, 0($t3)
+            add $v1, $v1, $t4
+            addi $t0, $t0, -1
+            bne $t0, $0, loop
+"""
+
+ADVANCED_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Assembly Files", "advanced.asm")
+
+DEFAULT_BATCH_SIZES = [100, 1000, 10000]
+
+# Memory of every lane in bytes (the programs start at 7996, the kernel only uses 256 bytes below $sp, and the data
+# segment of advanced.asm is assembled at simulator.get_data_address(KERNEL_MEMORY_SIZE))
+KERNEL_MEMORY_SIZE = 16384
+
+
+def get_advanced_program():
+    """
+    Assembles advanced.asm with its data segment inside the memory of every lane
+    :return: Tuple (api.AssembledProgram, byte address of varA)
+    """
+    with open(ADVANCED_FILENAME) as i_file:
+        program = api.assemble_source(i_file.read(), data_address=simulator.get_data_address(KERNEL_MEMORY_SIZE))
+    return program, program.variable_table["varA"]
+
+
+def get_advanced_inputs(inputs):
+    """
+    :param inputs: uint32 array of random inputs
+    :return: uint32 array of outer loop counts (1 to 64) for advanced.asm
+    """
+    return (inputs & 63) + 1
+
+
+def benchmark_separately(program, inputs, input_address=None):
+    """
+    Runs one simulator.run(...) per input
+    :param input_address: byte address of the memory word holding the input, None to pass it in $a0
+    :return: Tuple (instructions executed, seconds)
+    """
+    total_steps = 0
+    start_time = time.perf_counter()
+    for value in inputs:
+        machine = simulator.load_program(program.words, program.start_address, KERNEL_MEMORY_SIZE,
+                                         program.data_image, program.data_address)
+        if input_address is None:
+            machine["registers"][4] = int(value)
+        else:
+            machine["memory"][input_address:input_address+4] = int(value).to_bytes(4, "big")
+        total_steps += simulator.run(machine, simulator.DEFAULT_MAX_STEPS)
+    return total_steps, time.perf_counter() - start_time
+
+
+def benchmark_batch(program, inputs, input_address=None):
+    """
+    Runs all inputs as one batch
+    :param input_address: byte address of the memory word holding the input, None to pass it in $a0
+    :return: Tuple (instructions executed, seconds)
+    """
+    start_time = time.perf_counter()
+    batch = batch_simulator.load_batch(program.words, len(inputs), program.start_address, KERNEL_MEMORY_SIZE,
+                                       program.data_image, program.data_address)
+    if input_address is None:
+        batch["registers"][:, 4] = inputs
+    else:
+        # (memory is big endian)
+        batch["memory"][:, input_address:input_address+4] = inputs.astype(">u4").view(np.uint8).reshape(-1, 4)
+    batch_simulator.run_batch(batch)
+    return int(batch["steps"].sum()), time.perf_counter() - start_time
+
+
+if __name__ == '__main__':
+    batch_sizes = [int(argument) for argument in sys.argv[1:]] or DEFAULT_BATCH_SIZES
+    advanced_program, var_a_address = get_advanced_program()
+    # Program, byte address of its input (None for $a0), and conversion of the random inputs
+    benchmark_programs = {"kernel": (api.assemble_source(KERNEL), None, lambda inputs: inputs),
+                          "advanced.asm": (advanced_program, var_a_address, get_advanced_inputs)}
+    for program_name, (benchmark_program, program_input_address, get_inputs) in benchmark_programs.items():
+        random_generator = np.random.default_rng(0)
+        for batch_size in batch_sizes:
+            batch_inputs = get_inputs(random_generator.integers(0, 1 << 32, size=batch_size, dtype=np.uint32))
+            separate_steps, separate_seconds = benchmark_separately(benchmark_program, batch_inputs,
+                                                                    program_input_address)
+            batch_steps, batch_seconds = benchmark_batch(benchmark_program, batch_inputs, program_input_address)
+            if separate_steps != batch_steps:
+                raise RuntimeError(f"Instruction counts differ: {separate_steps} separately, {batch_steps} in batch")
+            separate_rate = separate_steps / separate_seconds / 1e6
+            batch_rate = batch_steps / batch_seconds / 1e6
+            print(f"{program_name:<14}{batch_size:>8,} inputs, {batch_steps:>12,} instructions: separately "
+                  f"{separate_rate:6.2f}, batch {batch_rate:6.2f} M instructions/s ({batch_rate / separate_rate:.1f}x)")
@@ -0,0 +1,213 @@
+"""
+Benchmark harness for the assembler
+
+Generates synthetic programs (see generate_program.py) of each requested size and times the first pass, the second
+pass, and end to end assembly (assembler.assemble(...)) separately.  The first pass is timed the way
+assembler.process_file(...) runs it: the file is memory mapped and scanned in place (see
+assembler.process_first_pass_mapped(...)) and the pseudo instructions are lowered (see pseudo.expand_lines(...)).
+Results are saved as JSON together with the current commit so regressions can be compared across commits.
+
+With --workers, the second pass is also timed with each number of worker processes (see
+assembler.encode_instructions_parallel(...)) to find the program size where the parallel second pass pays off.
+
+Usage (from the repository root):
+    python benchmarks/benchmark.py --sizes 1K,10K,100K -o results.json
+    python benchmarks/benchmark.py --sizes 1K,10K,100K --compare results.json
+    python benchmarks/benchmark.py --sizes 100K,1M --workers 1,2,4,N
+"""
+import subprocess
+import argparse
+import platform
+import tempfile
+import time
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import generate_program     # noqa: E402
+import mapped_source        # noqa: E402
+import custom_types         # noqa: E402
+import assembler            # noqa: E402
+import pseudo               # noqa: E402
+
+
+def get_commit():
+    """
+    :return: hash of the current git commit (string) or None if it can't be determined
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_corpus_file(line_count, corpus_directory, seed=0):
+    """
+    Generates the synthetic program for a size (reused if it was already generated)
+    :return: filename of the program (string)
+    """
+    filename = os.path.join(corpus_directory, f"synthetic_{line_count}_{seed}.asm")
+    if not os.path.exists(filename):
+        generate_program.generate_program(line_count, filename, seed)
+    return filename
+
+
+def run_first_pass(i_file):
+    """
+    Runs the first pass like assembler.process_file(...): memory mapped when possible, pseudo instructions lowered
+    :param i_file: assembly language input file handle
+    :return: Tuple (symbol table, variable table, line type list) ready for the second pass
+    """
+    source = mapped_source.open_mapped_source(i_file)
+    try:
+        if source is None:
+            symbol_table, variable_table, line_type_list = assembler.process_first_pass(i_file)
+        else:
+            symbol_table, variable_table, line_type_list = assembler.process_first_pass_mapped(source)
+    finally:
+        if source is not None:
+            source.close()
+    symbol_table, line_type_list, _ = pseudo.expand_lines(symbol_table, variable_table, line_type_list,
+                                                          assembler.START_ADDRESS)
+    return symbol_table, variable_table, line_type_list
+
+
+def benchmark_file(filename, repeat=1):
+    """
+    Times the phases of assembling a file (best of repeat runs)
+    The encode memo is cleared before every run so each run starts cold
+    :param filename: assembly filename (string)
+    :param repeat: number of runs (int)
+    :return: dictionary of timings in seconds and counts
+    """
+    best = {}
+    for _ in range(repeat):
+        assembler.clear_encode_memo()
+        with open(filename) as i_file, open(os.devnull, "w") as o_file:
+            start_time = time.perf_counter()
+            symbol_table, variable_table, line_type_list = run_first_pass(i_file)
+            first_pass_time = time.perf_counter()
+            assembler.process_second_pass(i_file, o_file, symbol_table, variable_table, line_type_list)
+            second_pass_time = time.perf_counter()
+
+        assembler.clear_encode_memo()
+        start_assemble_time = time.perf_counter()
+        if not assembler.assemble(filename, os.devnull):
+            raise RuntimeError(f"Benchmark program {filename} failed to assemble")
+        end_time = time.perf_counter()
+
+        timings = {"first_pass_s": first_pass_time - start_time,
+                   "second_pass_s": second_pass_time - first_pass_time,
+                   "assemble_s": end_time - start_assemble_time}
+        for key, value in timings.items():
+            best[key] = min(best.get(key, value), value)
+
+    best["lines"] = len(line_type_list)
+    best["instructions"] = sum(entry[0] in custom_types.ALL_INSTRUCTIONAL_TYPES for entry in line_type_list)
+    best["lines_per_s"] = best["lines"] / best["assemble_s"]
+    return best
+
+
+def parse_worker_counts(worker_counts):
+    """
+    :param worker_counts: comma separated numbers of worker processes, N is the number of cores (string, i.e. "1,2,N")
+    :return: list of distinct worker counts in the given order (list of ints)
+    """
+    counts = []
+    for count in worker_counts.split(","):
+        count = (os.cpu_count() or 1) if count.strip().upper() == "N" else int(count)
+        if count < 1:
+            raise ValueError(f"Worker count \"{count}\" is not positive")
+        if count not in counts:
+            counts.append(count)
+    return counts
+
+
+def benchmark_workers(filename, worker_counts, repeat=1):
+    """
+    Times the second pass of a file with each number of worker processes (best of repeat runs)
+    A single worker encodes in this process, more workers start a new pool for every run, so the time includes
+    starting the workers and sending them the symbol table and the chunks, just like assembler.assemble(..., workers=N)
+    :param filename: assembly filename (string)
+    :param worker_counts: numbers of worker processes (list of ints, see parse_worker_counts(...))
+    :param repeat: number of runs (int)
+    :return: dictionary mapping each worker count to the second pass time in seconds
+    """
+    best = {}
+    with open(filename) as i_file:
+        symbol_table, variable_table, line_type_list = run_first_pass(i_file)
+        for workers in worker_counts:
+            for _ in range(repeat):
+                assembler.clear_encode_memo()
+                with open(os.devnull, "w") as o_file:
+                    start_time = time.perf_counter()
+                    assembler.process_second_pass(i_file, o_file, symbol_table, variable_table, line_type_list,
+                                                  workers=workers)
+                    seconds = time.perf_counter() - start_time
+                best[workers] = min(best.get(workers, seconds), seconds)
+    return best
+
+
+def compare_results(results, baseline):
+    """
+    Prints the change in every timing relative to a previous run
+    :param results: results dictionary of this run
+    :param baseline: results dictionary of a previous run
+    :return: None
+    """
+    baseline_by_size = {result["size"]: result for result in baseline["results"]}
+    print(f"Compared to commit {baseline.get('commit')}: (ratio new/old, < 1 is faster)")
+    for result in results["results"]:
+        old = baseline_by_size.get(result["size"])
+        if old is None:
+            continue
+        ratios = ", ".join(f"{key} {result[key] / old[key]:.2f}x"
+                           for key in ["first_pass_s", "second_pass_s", "assemble_s"])
+        print(f"  {result['size']:>10,} lines: {ratios}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the assembler on synthetic programs")
+    parser.add_argument("--sizes", default="1K,10K,100K",
+                        help="comma separated program sizes in lines, up to 10M (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size, best is kept (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the programs (default: %(default)s)")
+    parser.add_argument("--corpus-directory", default=os.path.join(tempfile.gettempdir(), "mipsy_benchmark_corpus"),
+                        help="where generated programs are kept between runs (default: %(default)s)")
+    parser.add_argument("--workers", default=None,
+                        help="comma separated numbers of worker processes to time the second pass with, N is the "
+                             "number of cores (i.e. 1,2,4,N)")
+    parser.add_argument("-o", "--output", default=None, help="save the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="compare against results saved by a previous run")
+    args = parser.parse_args()
+
+    os.makedirs(args.corpus_directory, exist_ok=True)
+    benchmark_results = {"commit": get_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                         "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": []}
+    benchmark_worker_counts = parse_worker_counts(args.workers) if args.workers else []
+    for size in [generate_program.parse_size(size) for size in args.sizes.split(",")]:
+        corpus_file = get_corpus_file(size, args.corpus_directory, args.seed)
+        result = {"size": size, **benchmark_file(corpus_file, args.repeat)}
+        benchmark_results["results"].append(result)
+        print(f"{size:>10,} lines: first pass {result['first_pass_s']:.3f} s, "
+              f"second pass {result['second_pass_s']:.3f} s, assemble {result['assemble_s']:.3f} s "
+              f"({result['lines_per_s']:,.0f} lines/s)")
+        if benchmark_worker_counts:
+            # (JSON keys are strings)
+            result["workers_second_pass_s"] = {str(workers): seconds for workers, seconds
+                                               in benchmark_workers(corpus_file, benchmark_worker_counts,
+                                                                    args.repeat).items()}
+            print(f"{'':>17}second pass with " + ", ".join(f"{workers} workers {seconds:.3f} s" for workers, seconds
+                                                          in result["workers_second_pass_s"].items()))
+    benchmark_results["cpu_count"] = os.cpu_count()
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(benchmark_results, output_file, indent=2)
+    if args.compare:
+        with open(args.compare) as compare_file:
+            compare_results(benchmark_results, json.load(compare_file))
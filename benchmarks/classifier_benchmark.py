@@ -0,0 +1,102 @@
+"""
+Micro-benchmark comparing the line classifier (helpers.classify_line) against the previous regex cascade
+
+The previous implementation ran up to six separate regex searches per line (get_line_type), searched again and split
+the line to look up the mnemonic (get_instruction_type), and then split the line a third time when tokenizing it
+(tokenize_instruction).  It is kept below as legacy_get_line_type(...) for comparison.
+
+Usage (from the repository root):
+    python benchmarks/classifier_benchmark.py [number of lines]
+"""
+import glob
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from custom_types import LineType                                   # noqa: E402
+import custom_types                                                 # noqa: E402
+import dicts                                                        # noqa: E402
+import helpers                                                      # noqa: E402
+from instruction_assemblers import tokenize_instruction, tokenize_classified_line    # noqa: E402
+
+
+def legacy_get_line_type(line):
+    """
+    Previous regex cascade used by get_line_type(...) (including the lookup done by get_instruction_type(...))
+    """
+    if line.strip() == "":
+        return LineType.BLANK
+    if re.search(dicts.REGEX_DICT["comment"], line):
+        return LineType.COMMENT
+    if re.search(dicts.REGEX_DICT["label_only"], line):
+        return LineType.LABEL_ONLY
+    if re.search(dicts.REGEX_DICT["variable"], line):
+        return LineType.VARIABLE
+    if re.search(dicts.REGEX_DICT["label_and_instr"], line) or re.search(dicts.REGEX_DICT["instruction"], line):
+        instruction = line
+        with_label = False
+        if re.search(dicts.REGEX_DICT["label_and_instr"], line):
+            with_label = True
+            instruction = instruction.split(":", 1)[1]
+        elif not re.search(dicts.REGEX_DICT["instruction"], line):
+            return None
+        mnemonic = instruction.split("#", 1)[0].split()[0]
+        return helpers._MNEMONIC_LINE_TYPE_DICT.get(mnemonic, (LineType.INVALID_INSTRUCTION,) * 2)[with_label]
+    if re.search(dicts.REGEX_DICT["directive"], line):
+        return LineType.ASSM_DIRECTIVE
+    return LineType.INVALID
+
+
+def legacy_classify_and_tokenize(lines):
+    for line in lines:
+        line_type = legacy_get_line_type(line)
+        if line_type in custom_types.ALL_INSTRUCTIONAL_TYPES:
+            tokenize_instruction(line, line_type in custom_types.ALL_INSTRUCTIONAL_LABEL_TYPES)
+
+
+def classify_and_tokenize(lines):
+    for line in lines:
+        classified_line = helpers.classify_line(line)
+        if classified_line.line_type in custom_types.ALL_INSTRUCTIONAL_TYPES:
+            tokenize_classified_line(line, classified_line)
+
+
+def load_corpus(line_count):
+    """
+    Builds a corpus of line_count lines by repeating the sample assembly files
+    """
+    lines = []
+    for filename in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                                                  "Assembly Files", "*.asm"))):
+        with open(filename) as file:
+            lines.extend(file.readlines())
+    return (lines * (line_count // len(lines) + 1))[:line_count]
+
+
+def time_lines_per_second(function, lines, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(lines)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best
+
+
+if __name__ == '__main__':
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    corpus = load_corpus(line_count)
+
+    # Make sure both classifiers agree before timing them
+    for corpus_line in set(corpus):
+        assert legacy_get_line_type(corpus_line) == helpers.classify_line(corpus_line).line_type, corpus_line
+
+    before = time_lines_per_second(legacy_classify_and_tokenize, corpus)
+    after = time_lines_per_second(classify_and_tokenize, corpus)
+    print(f"Lines: {line_count}")
+    print(f"Regex cascade + tokenize:     {before:12,.0f} lines/sec")
+    print(f"classify_line + tokenize:     {after:12,.0f} lines/sec")
+    print(f"Speedup: {after / before:.2f}x")
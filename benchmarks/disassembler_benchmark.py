@@ -0,0 +1,66 @@
+"""
+Benchmark of the disassembler (disassembler.py), checking that its output assembles back to the same words
+
+Generates a program (see generate_program.py), assembles it, and measures how fast the words are disassembled.  The
+text is assembled again and the words are checked to be identical.  A small program with a word which isn't a
+supported instruction in the middle of its text segment is checked to be refused by default, and to come out as a
+.word line when unknown words are allowed.
+
+Usage (from the repository root):
+    python benchmarks/disassembler_benchmark.py [number of lines]
+"""
+import tempfile
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import generate_program     # noqa: E402
+import disassembler         # noqa: E402
+import api                  # noqa: E402
+
+DEFAULT_LINES = 200000
+
+# Program whose third instruction is replaced by UNKNOWN_WORD (j L jumps past it)
+UNKNOWN_WORD_SOURCE = "addi $t0, $t0, 1\nj L\nsll $t0, $t0, 1\nL: sll $t0, $t0, 2\n"
+UNKNOWN_WORD = 0xFFFFFFFF
+
+
+def check_unknown_word():
+    """
+    :raises AssertionError if a word which isn't a supported instruction isn't refused (or isn't written as a .word
+        line when unknown words are allowed)
+    """
+    words = list(api.assemble_source(UNKNOWN_WORD_SOURCE).words)
+    words[2] = UNKNOWN_WORD
+    try:
+        disassembler.disassemble(words)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Unknown word was disassembled although the text can't assemble back to it")
+    assert f".word 0x{UNKNOWN_WORD:08x}" in disassembler.disassemble(words, allow_unknown=True), \
+        "Unknown word is missing from the disassembly"
+
+
+def run_benchmark(lines):
+    with tempfile.TemporaryDirectory() as directory:
+        assembly_filename = os.path.join(directory, "program.asm")
+        generate_program.generate_program(lines, assembly_filename, seed=0)
+        with open(assembly_filename) as i_file:
+            words = api.assemble_source(i_file.read()).words
+
+    start_time = time.perf_counter()
+    text = disassembler.disassemble(words)
+    seconds = time.perf_counter() - start_time
+    assert api.assemble_source(text).words == words, "Disassembly doesn't assemble back to the same words"
+    check_unknown_word()
+
+    print(f"{lines:,} lines, {len(words):,} words")
+    print(f"disassembled in {seconds:.3f} s ({len(words) / seconds / 1e6:.2f} million words per second), "
+          f"round trip identical, unknown word refused")
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES)
@@ -0,0 +1,154 @@
+"""
+Synthetic MIPS program generator for benchmarking the assembler at scale
+
+Generated programs always assemble and contain:
+    every mnemonic in instructions.instruction_list (R, I, and J types) with random valid operands
+    dense labels (on lines by themselves and in front of instructions)
+    long forward and backward branches (up to MAX_BRANCH_DISTANCE instructions) and jumps
+    comments (full line and trailing) and blank lines, with mixed indentation and spacing
+
+Programs are written as a stream, so memory use doesn't depend on the program size.
+
+Usage (from the repository root):
+    python benchmarks/generate_program.py <number of lines> <output file> [--seed N]
+"""
+import argparse
+import random
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import instructions     # noqa: E402
+import dicts            # noqa: E402
+
+# Average number of instructions between two labels
+LABEL_INTERVAL = 8
+
+# Maximum distance (in instructions) between a branch and its target, kept well within the 16 bit branch offset
+MAX_BRANCH_DISTANCE = 20000
+
+# Registers which may be written (rd can't be a protected/reserved register)
+WRITABLE_REGISTERS = [register for register in dicts.REGISTER_DICT
+                      if register not in ["$0", "$zero", "$at", "$k0", "$k1"]]
+ALL_REGISTERS = list(dicts.REGISTER_DICT)
+
+MNEMONICS = list(instructions.instruction_list)
+# Operands must be separated by whitespace (commas alone are not enough, see tokenize_instruction(...))
+SEPARATORS = [", ", " , ", ",\t", " "]
+INDENTS = ["", "\t", "\t\t", "    ", "  "]
+
+
+def get_immediate(rng):
+    # Mostly small values like real code, occasionally anywhere in the 16 bit range
+    if rng.random() < 0.9:
+        return rng.randint(-64, 255)
+    return rng.randint(-2**15, 2**15-1)
+
+
+def generate_lines(line_count, seed=0):
+    """
+    Generator yielding the lines of a synthetic program
+    :param line_count: number of lines to generate (a few extra label lines may be added at the end) (int)
+    :param seed: random seed, the same seed and line count always produce the same program (int)
+    :return: yields lines (strings ending in "\n")
+    """
+    rng = random.Random(seed)
+    instruction_count = 0
+    labels_defined = 0          # Labels L0 ... L(labels_defined-1) have been emitted
+    highest_label_used = -1     # Highest label referenced so far (forward references must be defined at the end)
+    max_label_distance = MAX_BRANCH_DISTANCE // LABEL_INTERVAL
+
+    def get_operand(token_type):
+        nonlocal highest_label_used
+        if token_type == "rd":
+            return rng.choice(WRITABLE_REGISTERS)
+        if token_type in ["rs", "rt"]:
+            return rng.choice(ALL_REGISTERS)
+        if token_type == "imm":
+            return str(get_immediate(rng))
+        if token_type == "shamt":
+            return str(rng.randint(0, 31))
+        if token_type == "imm(rs)":
+            return f"{get_immediate(rng)}({rng.choice(ALL_REGISTERS)})"
+        # Label: mostly nearby, sometimes far away, either direction
+        distance = rng.randint(1, 4) if rng.random() < 0.7 else rng.randint(1, max_label_distance)
+        label = labels_defined - distance if rng.random() < 0.5 else labels_defined + distance
+        label = max(label, 0)
+        highest_label_used = max(highest_label_used, label)
+        return f"L{label}"
+
+    lines_written = 0
+    while lines_written < line_count:
+        kind = rng.random()
+        if kind < 0.05:
+            line = rng.choice(INDENTS) + "# " + rng.choice(["loop body", "compute address", "TODO", "#"]) + "\n"
+        elif kind < 0.10:
+            line = rng.choice(["\n", "\t\n", "  \n"])
+        else:
+            label = ""
+            # Define the next label every LABEL_INTERVAL instructions on average
+            if rng.random() < 1 / LABEL_INTERVAL:
+                label = f"L{labels_defined}:"
+                labels_defined += 1
+                if rng.random() < 0.5:
+                    yield label + "\n"
+                    lines_written += 1
+                    label = ""
+                    if lines_written >= line_count:
+                        break
+
+            mnemonic = MNEMONICS[instruction_count % len(MNEMONICS)] if rng.random() < 0.2 else \
+                rng.choice(MNEMONICS)
+            operands = [get_operand(token_type) for token_type in instructions.instruction_list[mnemonic]["format"]]
+            separator = rng.choice(SEPARATORS)
+            line = (label + (" " if label else "") + rng.choice(INDENTS) + mnemonic + rng.choice([" ", "\t"]) +
+                    separator.join(operands))
+            if rng.random() < 0.2:
+                line += "\t# " + rng.choice(["i++", "address", "branch if done", "# lots # of #"])
+            line += "\n"
+            instruction_count += 1
+        yield line
+        lines_written += 1
+
+    # Define every label that was referenced but not reached
+    for label in range(labels_defined, highest_label_used + 1):
+        yield f"L{label}:\n"
+
+
+def generate_program(line_count, filename, seed=0):
+    """
+    Writes a synthetic program to a file
+    :param line_count: number of lines to generate (int)
+    :param filename: output filename (string)
+    :param seed: random seed (int)
+    :return: None
+    """
+    with open(filename, "w") as file:
+        buffer = []
+        for line in generate_lines(line_count, seed):
+            buffer.append(line)
+            if len(buffer) >= 65536:
+                file.write("".join(buffer))
+                buffer.clear()
+        file.write("".join(buffer))
+
+
+def parse_size(size):
+    """
+    Parses sizes like "1000", "10K", or "10M"
+    :param size: size (string)
+    :return: size (int)
+    """
+    size = size.strip().upper()
+    multiplier = {"K": 1000, "M": 1000000}.get(size[-1:], 1)
+    return int(float(size.rstrip("KM")) * multiplier)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic MIPS program")
+    parser.add_argument("lines", type=parse_size, help="number of lines (i.e. 1000, 10K, 10M)")
+    parser.add_argument("output", help="output filename")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: %(default)s)")
+    args = parser.parse_args()
+    generate_program(args.lines, args.output, args.seed)
@@ -0,0 +1,69 @@
+"""
+Benchmark of the compact IR (ir.py) against the line type list handed between the passes
+
+Generates a program (see generate_program.py), runs the first pass, and measures the memory taken by the line type list
+(tuples and token lists included) and by the IR built from it, scaled to a million instructions.  The time to encode
+the words from the line type list (assembler.encode_instructions(...)) and from the IR (ir.build_ir(...) followed by
+ir.encode_ir(...)) is reported as well, and the words are checked to be identical.
+
+Usage (from the repository root):
+    python benchmarks/ir_benchmark.py [number of lines]
+"""
+import tracemalloc
+import tempfile
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import generate_program     # noqa: E402
+import assembler            # noqa: E402
+import ir                   # noqa: E402
+
+DEFAULT_LINES = 200000
+
+
+def measure_allocation(function, *args):
+    """
+    :return: Tuple (result of function(*args), bytes still allocated by it afterwards)
+    """
+    tracemalloc.start()
+    result = function(*args)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, allocated
+
+
+def run_benchmark(lines):
+    with tempfile.TemporaryDirectory() as directory:
+        assembly_filename = os.path.join(directory, "program.asm")
+        generate_program.generate_program(lines, assembly_filename, seed=0)
+        with open(assembly_filename) as i_file:
+            (symbol_table, _, line_type_list), line_type_list_bytes = \
+                measure_allocation(assembler.process_first_pass, i_file)
+
+    start_time = time.perf_counter()
+    program_ir = ir.build_ir(line_type_list, symbol_table)
+    build_seconds = time.perf_counter() - start_time
+    instruction_count = len(program_ir["addresses"])
+    scale = 1000000 / instruction_count
+
+    start_time = time.perf_counter()
+    ir_words = ir.encode_ir(program_ir, symbol_table)
+    encode_seconds = time.perf_counter() - start_time
+    assembler.clear_encode_memo()
+    start_time = time.perf_counter()
+    words = assembler.encode_instructions(line_type_list, symbol_table)
+    line_type_list_seconds = time.perf_counter() - start_time
+    assert ir_words == words, "IR words differ from the line type list words"
+
+    print(f"{lines:,} lines, {instruction_count:,} instructions")
+    print(f"{'line type list':<16}{line_type_list_bytes * scale / 2**20:>10.1f} MB per million instructions")
+    print(f"{'IR':<16}{ir.get_ir_size(program_ir) * scale / 2**20:>10.1f} MB per million instructions")
+    print(f"encode from line type list {line_type_list_seconds:.3f} s, build IR {build_seconds:.3f} s + "
+          f"encode IR {encode_seconds:.3f} s")
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES)
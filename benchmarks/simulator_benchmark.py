@@ -0,0 +1,126 @@
+"""
+Benchmark of the instruction set simulator (simulator.py)
+
+Runs a few small kernels (arithmetic loop, array fill and sum through memory, and a call heavy loop) and the real
+Assembly Files/advanced.asm (nested loops over an array in its data segment, with the outer loop count varA raised in
+the data image), and reports the simulated instructions per second of the interpreter (simulator.run(...)) and of the
+basic block translation engine (simulator.run_blocks(...)).  For comparison every kernel is also run decoding each
+word again every time it executes (what an interpreter without the predecoded handler table does).
+
+Usage (from the repository root):
+    python benchmarks/simulator_benchmark.py [number of loop iterations]
+"""
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import simulator    # noqa: E402
+import api          # noqa: E402
+
+ADVANCED_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Assembly Files", "advanced.asm")
+
+KERNELS = {
+    "arithmetic": """
+        main:   addi $t0, $0, {iterations}
+                addi $t1, $0, 0
+        loop:   add $t1, $t1, $t0
+                xor $t2, $t1, $t0
+                sll $t3, $t2, 3
+                sra $t4, $t3, 2
+                slt $t5, $t4, $t1
+                addi $t0, $t0, -1
+                bne $t0, $0, loop
+    """,
+    "memory": """
+        main:   addi $t0, $0, {iterations}
+                addi $s0, $sp, -4096
+        loop:   andi $t1, $t0, 1023
+                sll $t1, $t1, 2
+                add $t2, $s0, $t1
+                sw $t0, 0($t2)
+                lw $t3, 0($t2)
+                add $t4, $t4, $t3
+                lbu $t5, 3($t2)
+                addi $t0, $t0, -1
+                bgtz $t0, loop
+    """,
+    "calls": """
+        main:   addi $s0, $0, {iterations}
+                add $s1, $ra, $0
+        loop:   jal leaf
+                addi $s0, $s0, -1
+                bne $s0, $0, loop
+                jr $s1
+        leaf:   addi $v0, $v0, 1
+                jr $ra
+    """,
+}
+
+
+def run_decoding_every_step(machine, max_steps):
+    """
+    Runs a machine decoding each instruction again every time it executes (baseline for comparison)
+    :return: number of instructions executed
+    """
+    index = (machine["pc"] - machine["text_start"]) >> 2
+    count = machine["instruction_count"]
+    steps = 0
+    while steps < max_steps and 0 <= index < count:
+        index = simulator.decode_word(machine, index)()
+        steps += 1
+    return steps
+
+
+def get_advanced_program(outer_iterations):
+    """
+    Assembles advanced.asm with its data segment inside the simulated memory
+    :param outer_iterations: outer loop count stored in varA (the file sets it to 3)
+    :return: api.AssembledProgram
+    """
+    with open(ADVANCED_FILENAME) as i_file:
+        program = api.assemble_source(i_file.read(), data_address=simulator.get_data_address())
+    offset = program.variable_table["varA"] - program.data_address
+    program.data_image[offset:offset+4] = outer_iterations.to_bytes(4, "big")
+    return program
+
+
+def benchmark_kernel(program, run_function):
+    """
+    :param program: api.AssembledProgram (its data segment is loaded as well)
+    :return: Tuple (instructions executed, seconds)
+    """
+    machine = simulator.load_program(program.words, program.start_address, data_image=program.data_image,
+                                     data_address=program.data_address)
+    start_time = time.perf_counter()
+    if run_function is simulator.run_blocks:
+        steps = run_function(machine, simulator.DEFAULT_MAX_STEPS, program.symbol_table)
+    else:
+        steps = run_function(machine, simulator.DEFAULT_MAX_STEPS)
+    return steps, time.perf_counter() - start_time
+
+
+if __name__ == '__main__':
+    loop_iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    # Programs and how often each one runs (the kernels set their loop count with an addi, so they are repeated,
+    # advanced.asm reads it from its data segment)
+    benchmark_programs = {}
+    for kernel_name, kernel_source in KERNELS.items():
+        source = kernel_source.format(iterations=min(loop_iterations, 32767))
+        benchmark_programs[kernel_name] = (api.assemble_source(source), max(1, loop_iterations // 32767))
+    benchmark_programs["advanced.asm"] = (get_advanced_program(loop_iterations), 1)
+    for program_name, (benchmark_program, repeats) in benchmark_programs.items():
+        rates = {}
+        for run_function in [simulator.run, simulator.run_blocks]:
+            total_steps, total_seconds = 0, 0.0
+            for _ in range(repeats):
+                kernel_steps, kernel_seconds = benchmark_kernel(benchmark_program, run_function)
+                total_steps += kernel_steps
+                total_seconds += kernel_seconds
+            rates[run_function.__name__] = total_steps / total_seconds / 1e6
+        baseline_steps, baseline_seconds = benchmark_kernel(benchmark_program, run_decoding_every_step)
+
+        print(f"{program_name:<14}{total_steps:>12,} instructions: interpreter {rates['run']:5.2f}, "
+              f"blocks {rates['run_blocks']:5.2f} ({rates['run_blocks'] / rates['run']:.1f}x), "
+              f"decoding every step {baseline_steps / baseline_seconds / 1e6:5.2f} M instructions/s")
@@ -0,0 +1,104 @@
+import profiler
+import argparse
+
+# Command line interface shared by main.py (assembles directly) and client.py (asks the assembler daemon)
+# Kept free of assembler imports so the client starts quickly
+
+# Output format names (see OUTPUT_FORMAT_DICT in output_formats.py)
+OUTPUT_FORMATS = ["text", "bin", "bin_le", "ihex", "readmemh", "logisim"]
+
+
+def get_argument_parser(description="Assemble a MIPS assembly file"):
+    """
+    Creates the argument parser for assembling a single file
+    :param description: description shown in the help text (string)
+    :return: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("input", nargs="?", default="Assembly Files/test.asm",
+                        help="assembly file (default: %(default)s)")
+    parser.add_argument("output", nargs="?", default="Assembled Files/assembled.txt",
+                        help="assembled file (default: %(default)s)")
+    parser.add_argument("--data-output", default=None,
+                        help="assembled data segment file, written only if the program has data (default: the output "
+                             "file with .data in front of its extension)")
+    parser.add_argument("-f", "--format", default="text", choices=OUTPUT_FORMATS,
+                        help="output format (default: %(default)s)")
+    parser.add_argument("--single-pass", action="store_true", help="read the input file only once")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes to encode the instructions with in the second pass "
+                             "(default: encode them in this process, only pays off for very large programs)")
+    parser.add_argument("--start-address", type=lambda value: int(value, 0), default=None,
+                        help="byte address of the first instruction (default: 7996)")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the time and allocations of each assembly phase, the number of lines of each "
+                             "type, and the slowest lines")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="with --profile, also measure memory in bytes (slower)")
+    parser.add_argument("--optimize", action="store_true",
+                        help="remove redundant instructions (no-op moves, jumps to the next instruction, ...) and "
+                             "print the instruction count reduction")
+    parser.add_argument("--schedule", action="store_true",
+                        help="reorder instructions within basic blocks to hide load, multiply, and divide latencies "
+                             "and print the estimated cycles saved per block")
+    return parser
+
+
+def get_profile(profile, profile_memory=False):
+    """
+    Creates the profile dictionary requested on the command line
+    :param profile: whether --profile was given (boolean)
+    :param profile_memory: whether --profile-memory was given (boolean)
+    :return: empty profile dictionary (see profiler.get_empty_profile(...)) or None if no profile was requested
+    """
+    return profiler.get_empty_profile(profile_memory) if profile else None
+
+
+def get_schedule(schedule):
+    """
+    Creates the scheduling report list requested on the command line
+    :param schedule: whether --schedule was given (boolean)
+    :return: empty list (see scheduler.schedule_words(...)) or None if no scheduling was requested
+    """
+    return [] if schedule else None
+
+
+def get_optimize_report(optimize):
+    """
+    Creates the optimizer report dictionary requested on the command line
+    :param optimize: whether --optimize was given (boolean)
+    :return: empty dictionary (see peephole.optimize_lines(...)) or None if no optimization was requested
+    """
+    return {} if optimize else None
+
+
+def get_report_messages(success, profile, optimize, schedule):
+    """
+    Renders the reports requested on the command line once the file is assembled
+    A report is only rendered if the assembler filled it out (the requested reports are empty if the file is invalid)
+    :param success: whether the file was assembled (boolean)
+    :param profile: profile dictionary (see get_profile(...)) or None
+    :param optimize: optimizer report dictionary (see get_optimize_report(...)) or None
+    :param schedule: scheduling report list (see get_schedule(...)) or None
+    :return: list of reports (strings) in the order they are printed
+    """
+    # Only imported when needed (see the note at the top)
+    import scheduler
+    import peephole
+    messages = []
+    if success and profile is not None:
+        messages.append(profiler.format_profile(profile))
+    if success and optimize:
+        messages.append(peephole.format_optimize_report(optimize))
+    if success and schedule is not None:
+        messages.append(scheduler.format_schedule_report(schedule))
+    return messages
+
+
+def get_exit_code(success):
+    """
+    Exit code for the result of an assembly
+    :param success: whether the file was assembled (boolean)
+    :return: 0 on success, 1 otherwise
+    """
+    return 0 if success else 1
@@ -0,0 +1,115 @@
+import tempfile
+import socket
+import json
+import cli
+import sys
+import os
+
+# Thin client for the assembler daemon (see daemon.py)
+# Accepts the same arguments as main.py and prints the same messages and exits with the same exit code, but the
+# assembly is done by the already running daemon so the assembler doesn't have to be imported and initialized again.
+# If no daemon is running, the file is assembled directly instead.
+
+
+def get_default_socket_path():
+    """
+    Location of the daemon's Unix socket (one per user)
+    The socket goes into $XDG_RUNTIME_DIR if it is set, otherwise into a private directory in the temporary directory
+    (created and checked by the daemon, see daemon.check_socket_directory(...)) so other users can't put a socket of
+    their own in its place
+    :return: socket path (string)
+    """
+    runtime_directory = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_directory:
+        return os.path.join(runtime_directory, "mipsy.sock")
+    return os.path.join(tempfile.gettempdir(), f"mipsy-{os.getuid()}", "daemon.sock")
+
+
+# Default location of the daemon's Unix socket
+DEFAULT_SOCKET_PATH = get_default_socket_path()
+
+# Exit code when the daemon was reached but the request failed (same as the daemon's own errors)
+DAEMON_ERROR_EXIT_CODE = 2
+
+
+def check_socket_owner(socket_path):
+    """
+    Makes sure the socket belongs to the daemon of the current user before anything is sent to it
+    :param socket_path: path of the daemon's Unix socket (string)
+    :return: None
+    :raises FileNotFoundError if there is no socket, PermissionError if it belongs to another user
+    """
+    if os.stat(socket_path).st_uid != os.getuid():
+        raise PermissionError(f"Assembler daemon socket \"{socket_path}\" is owned by another user")
+
+
+def send_request(request, socket_path=DEFAULT_SOCKET_PATH):
+    """
+    Sends a request to the daemon and waits for its response
+    Requests and responses are single lines of JSON
+    :param request: request dictionary (see daemon.handle_request(...))
+    :param socket_path: path of the daemon's Unix socket (string)
+    :return: response dictionary
+    :raises FileNotFoundError or ConnectionRefusedError if no daemon is running, other OSErrors if the socket belongs to
+        another user or the daemon fails while handling the request
+    """
+    check_socket_owner(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(json.dumps(request).encode() + b"\n")
+        response = b""
+        while not response.endswith(b"\n"):
+            data = connection.recv(65536)
+            if not data:
+                raise ConnectionError("Assembler daemon closed the connection without responding")
+            response += data
+    return json.loads(response)
+
+
+def run(argv=None, socket_path=DEFAULT_SOCKET_PATH):
+    """
+    Assembles a file through the daemon
+    :param argv: command line arguments (defaults to sys.argv[1:])
+    :param socket_path: path of the daemon's Unix socket (string)
+    :return: exit code (int)
+    """
+    args = cli.get_argument_parser("Assemble a MIPS assembly file using the assembler daemon").parse_args(argv)
+    request = {"command": "assemble",
+               # The daemon may run in another directory
+               "input": os.path.abspath(args.input),
+               "output": os.path.abspath(args.output),
+               "data_output": args.data_output and os.path.abspath(args.data_output),
+               "format": args.format,
+               "single_pass": args.single_pass,
+               "workers": args.workers,
+               "start_address": args.start_address,
+               "profile": args.profile,
+               "profile_memory": args.profile_memory,
+               "schedule": args.schedule,
+               "optimize": args.optimize}
+    try:
+        response = send_request(request, socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # No daemon running (or a stale socket left behind), assemble directly
+        import assembler
+        profile = cli.get_profile(args.profile, args.profile_memory)
+        schedule = cli.get_schedule(args.schedule)
+        optimize = cli.get_optimize_report(args.optimize)
+        success = assembler.assemble(args.input, args.output, args.single_pass, args.format, args.workers,
+                                     start_address=args.start_address, profile=profile, schedule=schedule,
+                                     optimize=optimize, data_filename=args.data_output)
+        for message in cli.get_report_messages(success, profile, optimize, schedule):
+            print(message)
+        return cli.get_exit_code(success)
+    except (OSError, ValueError) as error:
+        # The daemon (or whatever is listening) can't be trusted to have done anything, so don't assemble again
+        print(f"Assembler daemon error: {error}")
+        return DAEMON_ERROR_EXIT_CODE
+
+    for message in response["messages"]:
+        print(message)
+    return response["exit_code"]
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import NamedTuple
 
 
 # Types of lines that can be found in an assembly file
@@ -18,15 +19,119 @@ class LineType(Enum):
     U_INSTRUCTION = 12          # Used for instructions that are in MIPS, but not supported by this assembler
     INVALID_INSTRUCTION = 13    # Looks like an instruction, but is invalid
     INVALID = 14
+    PSEUDO_INSTRUCTION = 15     # Pseudo instruction (lowered to real instructions, see pseudo.py)
+    LABEL_WITH_PSEUDO_INSTR = 16    # Label on same line as a pseudo instruction
 
+    # Members are singletons, so hashing by identity is enough (Enum hashes the member name in Python code, which
+    # makes every membership test in the type sets below slower than scanning a list)
+    __hash__ = object.__hash__
 
-ALL_INSTRUCTIONAL_TYPES = [LineType.R_INSTRUCTION, LineType.I_INSTRUCTION, LineType.J_INSTRUCTION,
-                           LineType.LABEL_WITH_R_INSTR, LineType.LABEL_WITH_I_INSTR, LineType.LABEL_WITH_J_INSTR]
 
-ALL_LABEL_TYPES = [LineType.LABEL_ONLY, LineType.LABEL_WITH_U_INSTR, LineType.LABEL_WITH_R_INSTR,
-                   LineType.LABEL_WITH_I_INSTR, LineType.LABEL_WITH_J_INSTR]
+ALL_INSTRUCTIONAL_TYPES = frozenset([LineType.R_INSTRUCTION, LineType.I_INSTRUCTION, LineType.J_INSTRUCTION,
+                                     LineType.LABEL_WITH_R_INSTR, LineType.LABEL_WITH_I_INSTR,
+                                     LineType.LABEL_WITH_J_INSTR])
 
-ALL_INSTRUCTIONAL_LABEL_TYPES = [LineType.LABEL_WITH_U_INSTR, LineType.LABEL_WITH_R_INSTR,
-                                 LineType.LABEL_WITH_I_INSTR, LineType.LABEL_WITH_J_INSTR]
+ALL_LABEL_TYPES = frozenset([LineType.LABEL_ONLY, LineType.LABEL_WITH_U_INSTR, LineType.LABEL_WITH_R_INSTR,
+                             LineType.LABEL_WITH_I_INSTR, LineType.LABEL_WITH_J_INSTR,
+                             LineType.LABEL_WITH_PSEUDO_INSTR])
 
-ALL_INSTRUCTION_ONLY_TYPES = [LineType.R_INSTRUCTION, LineType.I_INSTRUCTION, LineType.J_INSTRUCTION]
\ No newline at end of file
+ALL_INSTRUCTIONAL_LABEL_TYPES = frozenset([LineType.LABEL_WITH_U_INSTR, LineType.LABEL_WITH_R_INSTR,
+                                           LineType.LABEL_WITH_I_INSTR, LineType.LABEL_WITH_J_INSTR,
+                                           LineType.LABEL_WITH_PSEUDO_INSTR])
+
+# Pseudo instructions occupy an instruction slot in the first pass, but aren't encoded until they are lowered
+ALL_PSEUDO_TYPES = frozenset([LineType.PSEUDO_INSTRUCTION, LineType.LABEL_WITH_PSEUDO_INSTR])
+
+ALL_INSTRUCTION_ONLY_TYPES = frozenset([LineType.R_INSTRUCTION, LineType.I_INSTRUCTION, LineType.J_INSTRUCTION])
+
+
+# Tokenized instruction list generated by a pseudo instruction expansion (see pseudo.py)
+# (expanded instructions may write the assembler temporary $at, which source instructions may not)
+class ExpandedInstruction(list):
+    pass
+
+
+# Result of classifying a line of an assembly file (see helpers.classify_line)
+class ClassifiedLine(NamedTuple):
+    line_type: LineType
+    label: str = None           # Label (or variable name) defined on the line
+    mnemonic: str = None        # Instruction mnemonic
+    operand_start: int = None   # Index in the line where the operands of the instruction start
+    operand_end: int = None     # Index in the line where the operands end (start of a trailing comment or end of line)
+
+
+# Exceptions raised when an assembly file is invalid
+# (all derive from Exception, so code catching Exception keeps working)
+class AssemblerError(Exception):
+    """
+    Base class for all errors found in an assembly file
+    message - description of the error (string)
+    line_number - number of the offending line starting with 1 as first line (int) or None if unknown
+    line - text of the offending line (string) or None if unknown
+    """
+    def __init__(self, message, line_number=None, line=None):
+        super().__init__(message)
+        self.message = message
+        self.line_number = line_number
+        self.line = line
+
+    def __reduce__(self):
+        # Rebuild without calling __init__ so subclasses with extra arguments survive pickling
+        # (errors raised in worker processes are pickled to get them back to the main process)
+        return self.__class__.__new__, (self.__class__, *self.args), self.__dict__
+
+    def __str__(self):
+        text = self.message
+        if self.line_number is not None:
+            text += f"\nLine number: {self.line_number}"
+        if self.line is not None:
+            text += f"\nLine: {self.line.rstrip()}"
+        return text
+
+
+class InvalidLineError(AssemblerError):
+    """
+    The line doesn't match any known line type
+    """
+
+
+class InvalidInstructionError(AssemblerError):
+    """
+    The instruction failed verification (wrong number of tokens, invalid register, immediate out of range, etc.)
+    """
+
+
+class UndefinedLabelError(InvalidInstructionError):
+    """
+    The instruction references a label which is not defined anywhere in the file
+    label - the undefined label (string)
+    """
+    def __init__(self, message, label, line_number=None, line=None):
+        super().__init__(message, line_number, line)
+        self.label = label
+
+
+class LinkError(AssemblerError):
+    """
+    Object files couldn't be linked together (a label exported by two modules, a branch target out of range, an
+    outdated object file, etc.)
+    """
+
+
+# Exception raised while running an assembled program (see simulator.py)
+class SimulationError(Exception):
+    """
+    The simulated program did something the simulator can't execute (unknown instruction, unaligned or out of range
+    memory access, etc.)
+    message - description of the error (string)
+    address - byte address of the offending instruction (int) or None if unknown
+    """
+    def __init__(self, message, address=None):
+        super().__init__(message)
+        self.message = message
+        self.address = address
+
+    def __str__(self):
+        if self.address is None:
+            return self.message
+        return f"{self.message}\nAddress: {self.address:#010x}"
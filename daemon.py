@@ -0,0 +1,127 @@
+from concurrent.futures import ProcessPoolExecutor
+import assembler
+import argparse
+import asyncio
+import client
+import stat
+import json
+import cli
+import os
+
+# Long running assembler server listening on a local Unix socket (see client.py for the matching client)
+# The instruction tables, compiled regexes, and encode memo are initialized once in each worker process and then stay
+# warm, so a request only pays for the assembly itself instead of starting Python and importing the assembler.
+
+
+def handle_request(request):
+    """
+    Handles a single request (runs in a worker process)
+    Requests:
+        {"command": "ping"} - responds with {"exit_code": 0, "messages": []}
+        {"command": "assemble", "input": ..., "output": ..., "format": ..., "single_pass": ..., "workers": ...,
+         "start_address": ..., "profile": ..., "profile_memory": ..., "schedule": ..., "optimize": ...}
+            - assembles the file exactly like main.py (the profile, optimizer, and scheduling reports are added to the
+              messages)
+    :param request: request dictionary
+    :return: response dictionary with the exit code and the messages the command line would have printed
+    """
+    messages = []
+    if request.get("command") == "ping":
+        return {"exit_code": 0, "messages": messages}
+    if request.get("command") != "assemble":
+        return {"exit_code": 2, "messages": [f"Unknown command \"{request.get('command')}\""]}
+
+    def log(*values):
+        # Same text print(...) would have produced
+        messages.append(" ".join(str(value) for value in values))
+
+    profile = cli.get_profile(request.get("profile", False), request.get("profile_memory", False))
+    schedule = cli.get_schedule(request.get("schedule", False))
+    optimize = cli.get_optimize_report(request.get("optimize", False))
+    success = assembler.assemble(request["input"], request["output"], request.get("single_pass", False),
+                                 request.get("format", "text"), request.get("workers"),
+                                 start_address=request.get("start_address"), log=log, profile=profile,
+                                 schedule=schedule, optimize=optimize, data_filename=request.get("data_output"))
+    messages.extend(cli.get_report_messages(success, profile, optimize, schedule))
+    return {"exit_code": cli.get_exit_code(success), "messages": messages}
+
+
+def check_socket_directory(socket_path):
+    """
+    Creates the directory of the socket if needed and makes sure no other user can put files in it
+    (so nobody else can take over the socket path or swap the socket once it is created)
+    :param socket_path: path of the Unix socket (string)
+    :return: None
+    :raises PermissionError if the directory belongs to another user or others may write to it
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    if not os.path.exists(directory):
+        os.mkdir(directory, 0o700)
+    directory_stat = os.lstat(directory)
+    if not stat.S_ISDIR(directory_stat.st_mode) or directory_stat.st_uid != os.getuid():
+        raise PermissionError(f"Socket directory \"{directory}\" is not a directory owned by the current user")
+    if directory_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"Socket directory \"{directory}\" may be written to by other users")
+
+
+async def serve(socket_path=client.DEFAULT_SOCKET_PATH, workers=None):
+    """
+    Runs the daemon until it receives a shutdown command
+    Connections are handled concurrently and the assemblies run in a pool of worker processes
+    :param socket_path: path of the Unix socket to listen on (string)
+    :param workers: number of worker processes (defaults to the number of cores)
+    :return: None
+    :raises PermissionError if the socket's directory isn't private to the current user
+        (see check_socket_directory(...))
+    """
+    loop = asyncio.get_running_loop()
+    stop = loop.create_future()
+    workers = workers or os.cpu_count() or 1
+    check_socket_directory(socket_path)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        async def handle_connection(reader, writer):
+            try:
+                request = json.loads(await reader.readline())
+                if request.get("command") == "shutdown":
+                    response = {"exit_code": 0, "messages": []}
+                    if not stop.done():
+                        stop.set_result(None)
+                else:
+                    response = await loop.run_in_executor(executor, handle_request, request)
+            except Exception as error:
+                response = {"exit_code": 2, "messages": [f"Assembler daemon error: {error}"]}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+
+        # Start the workers now (and import the assembler in them) so the first request doesn't pay for it
+        await asyncio.gather(*[loop.run_in_executor(executor, handle_request, {"command": "ping"})
+                               for _ in range(workers)])
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = await asyncio.start_unix_server(handle_connection, path=socket_path)
+        # Only the current user may connect (the daemon writes to any path it is sent)
+        os.chmod(socket_path, 0o600)
+        try:
+            async with server:
+                await stop
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the assembler daemon (use client.py to assemble files)")
+    parser.add_argument("--socket", default=client.DEFAULT_SOCKET_PATH, help="Unix socket path (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument("--shutdown", action="store_true", help="stop a running daemon")
+    args = parser.parse_args()
+
+    if args.shutdown:
+        client.send_request({"command": "shutdown"}, args.socket)
+    else:
+        asyncio.run(serve(args.socket, args.workers))
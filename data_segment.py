@@ -0,0 +1,332 @@
+"""
+Data segment: lays out the data directives and builds the packed memory image
+
+Lines after a .data directive (until the next .text directive) belong to the data segment.  The first pass hands every
+directive line, variable line ("label: .directive ..."), and label only line to process_line(...), which lays the
+data out and fills out the variable table with the address of every label in the data segment.  Supported directives:
+    .word, .half, .byte - values (decimal, hex, or binary, negative values are stored in 2's complement) or labels
+                          (their address), "value:count" repeats a value count times
+    .space n            - n zero bytes
+    .align n            - aligns the next element to 2^n bytes
+    .ascii, .asciiz     - quoted strings (with \\n, \\t, \\0, \\\\, \\" escapes), .asciiz adds a terminating zero byte
+.word and .half elements are aligned to their size.  Data directives always go to the data segment (even without a
+.data directive in front of them), .data and .text only decide where label only lines and instructions belong.
+
+The layout only records (offset, pattern, repeat count) fills, so a directive costs the same no matter how many bytes it
+covers: build_data_image(...) allocates the whole image as one zeroed bytearray, skips zero fills (.space), and copies
+repeated patterns with a doubling slice copy.  The image is big endian like the instruction words, and starts at
+DATA_START_ADDRESS.
+"""
+from custom_types import LineType, InvalidLineError, UndefinedLabelError
+import output_formats
+import dicts
+import sys
+
+# Byte address of the start of the data segment (the MIPS/MARS .data default)
+# Can be changed to anything, but should be word aligned and must not overlap the instructions
+DATA_START_ADDRESS = 0x10010000
+
+# Line types which may belong to the data segment (see process_line(...))
+DATA_LINE_TYPES = [LineType.ASSM_DIRECTIVE, LineType.VARIABLE, LineType.LABEL_ONLY]
+
+# Size in bytes (and alignment) of the elements of each value directive
+ELEMENT_SIZE_DICT = {".word": 4, ".half": 2, ".byte": 1}
+
+# Directives laying out data
+DATA_DIRECTIVES = {".word", ".half", ".byte", ".space", ".align", ".ascii", ".asciiz"}
+
+# Characters following a backslash in a string
+STRING_ESCAPE_DICT = {"n": "\n", "t": "\t", "r": "\r", "0": "\0", "\\": "\\", "\"": "\"", "'": "'"}
+
+
+def get_empty_data_layout(start_address=None):
+    """
+    Creates the layout of an empty data segment
+    :param start_address: byte address of the data segment (defaults to DATA_START_ADDRESS)
+    :return: data layout dictionary
+        start_address - byte address of the first byte of the data segment
+        size - number of bytes laid out so far
+        in_data - whether the current line is in the data segment (after .data until .text)
+        fills - list of tuples (offset, pattern (bytes), repeat count)
+        label_elements - list of tuples (offset, element size, label, line number, line) of elements holding the address
+            of a label (written once every label is known)
+        pending_labels - label only lines in the data segment waiting for the next element (so they point at it after
+            it is aligned)
+    """
+    return {"start_address": DATA_START_ADDRESS if start_address is None else start_address, "size": 0,
+            "in_data": False, "fills": [], "label_elements": [], "pending_labels": []}
+
+
+def get_number(token):
+    """
+    :return: value of a numeric token (decimal, "0x" hex, or "0b" binary, optionally negative) (int) or None if it
+        isn't numeric
+    """
+    try:
+        return int(token, 0)
+    except ValueError:
+        pass
+    try:
+        return int(token)       # Decimal with leading zeros
+    except ValueError:
+        return None
+
+
+def get_element_bytes(value, size):
+    """
+    :param value: element value (int)
+    :param size: element size in bytes (int)
+    :return: big endian bytes of the value (2's complement if negative)
+    :raises ValueError if the value doesn't fit the element
+    """
+    bits = 8 * size
+    if value < -pow(2, bits - 1) or value >= pow(2, bits):
+        raise ValueError(f"Value {value} does not fit in {size} byte(s)")
+    return (value & (pow(2, bits) - 1)).to_bytes(size, "big")
+
+
+def get_strings(operands):
+    """
+    Parses the quoted strings of .ascii and .asciiz (separated by whitespace or commas, a comment may follow)
+    :param operands: text following the directive (string)
+    :return: list of strings with the escapes replaced
+    :raises ValueError if the operands aren't quoted strings
+    """
+    strings = []
+    position = 0
+    while True:
+        while position < len(operands) and operands[position] in " \t\r\n,":
+            position += 1
+        if position == len(operands) or operands[position] == "#":
+            break
+        match = dicts.REGEX_DICT["string"].match(operands, position)
+        if match is None:
+            raise ValueError("Expected a quoted string")
+        text = match.group(1)
+        parts = text.split("\\")
+        # (every part after a backslash starts with the escaped character)
+        for index in range(1, len(parts)):
+            if parts[index] == "" or parts[index][0] not in STRING_ESCAPE_DICT:
+                raise ValueError(f"Unsupported escape in string \"{text}\"")
+            parts[index] = STRING_ESCAPE_DICT[parts[index][0]] + parts[index][1:]
+        strings.append("".join(parts))
+        position = match.end()
+    if not strings:
+        raise ValueError("Expected a quoted string")
+    return strings
+
+
+def align_layout(layout, alignment):
+    """
+    Moves the end of the layout up to a multiple of alignment bytes
+    """
+    layout["size"] = -(-layout["size"] // alignment) * alignment
+
+
+def define_pending_labels(layout, variable_table):
+    """
+    Points the label only lines waiting for an element at the current end of the layout
+    """
+    for label in layout["pending_labels"]:
+        variable_table[label] = layout["start_address"] + layout["size"]
+    layout["pending_labels"] = []
+
+
+def add_values(layout, size, operands, line_number, line):
+    """
+    Lays out the elements of a .word, .half, or .byte directive
+    Runs of values are packed into one fill, "value:count" becomes a single repeated fill
+    :param size: element size in bytes (int)
+    :param operands: text following the directive (string)
+    :raises ValueError if an element is invalid
+    """
+    elements = operands.split("#")[0].replace(",", " ").split()
+    if not elements:
+        raise ValueError("Expected at least one value")
+
+    run = []
+    run_offset = layout["size"]
+    for element in elements:
+        value_token, _, count_token = element.partition(":")
+        value = get_number(value_token)
+        if value is None:
+            if not (value_token[:1].isalpha() and value_token.replace("_", "").isalnum()) or count_token:
+                raise ValueError(f"Value \"{element}\" is not numeric or a label")
+            layout["label_elements"].append((layout["size"], size, value_token, line_number, line))
+            value = 0
+
+        if count_token:
+            count = get_number(count_token)
+            if count is None or count < 1:
+                raise ValueError(f"Repeat count \"{count_token}\" is not a positive number")
+            if run:
+                layout["fills"].append((run_offset, b"".join(run), 1))
+                run = []
+            layout["fills"].append((layout["size"], get_element_bytes(value, size), count))
+            layout["size"] += size * count
+            run_offset = layout["size"]
+        else:
+            run.append(get_element_bytes(value, size))
+            layout["size"] += size
+    if run:
+        layout["fills"].append((run_offset, b"".join(run), 1))
+
+
+def is_data_line(line_type, line):
+    """
+    Determines whether a line lays out data (for the tools which don't support a data segment)
+    :param line_type: LineType of the line
+    :param line: text of the line (string)
+    :return: True if the line is a variable or a data directive (see DATA_DIRECTIVES)
+    """
+    if line_type == LineType.VARIABLE:
+        return True
+    if line_type != LineType.ASSM_DIRECTIVE:
+        return False
+    match = dicts.REGEX_DICT["data_directive"].match(line)
+    return match is not None and match.group("directive") in DATA_DIRECTIVES
+
+
+def process_line(layout, line_type, label, line, line_number, variable_table):
+    """
+    Handles a line which may belong to the data segment (see DATA_LINE_TYPES)
+    :param layout: data layout (see get_empty_data_layout(...)) (updated)
+    :param line_type: LineType of the line
+    :param label: label defined on the line (string) or None
+    :param line: text of the line (string)
+    :param line_number: line number starting with 0 as first line (int)
+    :param variable_table: dictionary mapping variables to their byte addresses (filled out by this function)
+    :return: True if the line belongs to the data segment (so label only lines aren't added to the symbol table)
+    :raises InvalidLineError if a directive is invalid or unsupported
+    """
+    if line_type == LineType.LABEL_ONLY:
+        if layout["in_data"]:
+            layout["pending_labels"].append(label)
+        return layout["in_data"]
+
+    match = dicts.REGEX_DICT["data_directive"].match(line)
+    if match is None:
+        # Not a named directive (i.e. ".5"), ignored like any unknown directive
+        return True
+    directive, operands = match.group("directive"), match.group("operands")
+    if directive in [".data", ".text"]:
+        if operands.split("#")[0].strip():
+            raise InvalidLineError(f"Addresses after {directive} are not supported", line_number+1, line)
+        # Labels at the end of the data segment point just past its last element
+        define_pending_labels(layout, variable_table)
+        layout["in_data"] = directive == ".data"
+        return True
+
+    if directive not in DATA_DIRECTIVES:
+        # Other directives (.globl, ...) don't lay out data, but a variable needs data to point at
+        if line_type == LineType.VARIABLE:
+            raise InvalidLineError(f"Directive \"{directive}\" is not a supported data directive", line_number+1, line)
+        return True
+
+    try:
+        # Align first so the labels point at the aligned element
+        if directive == ".align":
+            power = get_number(operands.split("#")[0].strip())
+            if power is None or not 0 <= power <= 12:
+                raise ValueError("Alignment must be a power of 2 between 0 and 12")
+            align_layout(layout, pow(2, power))
+        elif directive in ELEMENT_SIZE_DICT:
+            align_layout(layout, ELEMENT_SIZE_DICT[directive])
+        layout["pending_labels"].extend([label] if label is not None else [])
+        define_pending_labels(layout, variable_table)
+
+        if directive in ELEMENT_SIZE_DICT:
+            add_values(layout, ELEMENT_SIZE_DICT[directive], operands, line_number, line)
+        elif directive == ".space":
+            size = get_number(operands.split("#")[0].strip())
+            if size is None or size < 0:
+                raise ValueError("Size of .space must be a non negative number")
+            layout["size"] += size
+        elif directive in [".ascii", ".asciiz"]:
+            data = "".join(get_strings(operands)).encode("latin-1") + (b"\0" if directive == ".asciiz" else b"")
+            layout["fills"].append((layout["size"], data, 1))
+            layout["size"] += len(data)
+    except (ValueError, UnicodeEncodeError) as error:
+        raise InvalidLineError(f"Invalid {directive} directive: {error}", line_number+1, line)
+    return True
+
+
+def finish_layout(layout, variable_table):
+    """
+    Points the label only lines left at the end of the file just past the last element
+    """
+    define_pending_labels(layout, variable_table)
+
+
+def fill_pattern(image, offset, pattern, count):
+    """
+    Writes a pattern count times into the image, doubling the filled region with every slice copy
+    (no temporary object of the size of the region is created)
+    """
+    end = offset + len(pattern) * count
+    view = memoryview(image)
+    view[offset:offset + len(pattern)] = pattern
+    filled = len(pattern)
+    while offset + filled < end:
+        chunk = min(filled, end - offset - filled)
+        view[offset + filled:offset + filled + chunk] = view[offset:offset + chunk]
+        filled += chunk
+    view.release()
+
+
+def build_data_image(layout, symbol_table, variable_table):
+    """
+    Builds the memory image of the data segment
+    :param layout: data layout (see get_empty_data_layout(...))
+    :param symbol_table: dictionary mapping labels to their byte addresses (for elements holding a label's address)
+    :param variable_table: dictionary mapping variables to their byte addresses
+    :return: image of the data segment (bytearray, empty if the program has no data)
+    :raises UndefinedLabelError if an element references an undefined label, InvalidLineError if a label's address
+        doesn't fit its element
+    """
+    image = bytearray(layout["size"])
+    for offset, pattern, count in layout["fills"]:
+        # The image starts out zeroed
+        if any(pattern):
+            fill_pattern(image, offset, pattern, count)
+
+    for offset, size, label, line_number, line in layout["label_elements"]:
+        address = variable_table.get(label, symbol_table.get(label))
+        if address is None:
+            raise UndefinedLabelError(f"Label \"{label}\" could not be located in symbol table or variable table",
+                                      label, line_number+1, line)
+        try:
+            image[offset:offset + size] = get_element_bytes(address, size)
+        except ValueError as error:
+            raise InvalidLineError(f"Address of label \"{label}\": {error}", line_number+1, line)
+    return image
+
+
+def get_data_words(image):
+    """
+    Splits the data image into words for the output formats (see output_formats.write_words(...))
+    :param image: image of the data segment (bytearray)
+    :return: array of big endian words (the last word is padded with zeros)
+    """
+    words = output_formats.get_word_array()
+    words.frombytes(bytes(image) + bytes(-len(image) % 4))
+    if sys.byteorder != "big":
+        words.byteswap()
+    return words
+
+
+def write_data_image(d_file, image, output_format="text", start_address=DATA_START_ADDRESS):
+    """
+    Writes the image of the data segment in an output format
+    Data words have no instruction fields, so the text format writes them as plain 32 bit lines
+    (see output_formats.render_plain_text(...)), every other format is the same as for instructions.
+    :param d_file: output file handle (opened with the mode given by output_formats.get_output_mode(...))
+    :param image: image of the data segment (bytearray, see build_data_image(...))
+    :param output_format: name of the output format (see OUTPUT_FORMAT_DICT in output_formats.py)
+    :param start_address: byte address of the data segment (int) (only used by formats that contain addresses)
+    :return: None
+    """
+    if output_format == "text":
+        d_file.write(output_formats.render_plain_text(get_data_words(image)))
+    else:
+        output_formats.write_words(d_file, get_data_words(image), output_format, start_address)
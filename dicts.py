@@ -56,12 +56,44 @@ REGEX_DICT = {
     # (matches full line)
     'label_and_instr': re.compile(r"^\s*[a-zA-Z]+\w*:\s+[a-zA-Z]+\s+.+"),
 
-    # Matches any line of the form "something: .something digits" where digits may be any number of digits
-    # (does not match full line, matches up to the end of the digits section)
-    'variable': re.compile(r"^\s*[a-zA-Z]+\w*:\s+\.[a-zA-Z]\w*\s+\d+"),
+    # Matches any line of the form "something: .something ..." (a label followed by a data directive, see
+    # data_segment.py)
+    # (does not match full line, matches up to the end of the directive)
+    'variable': re.compile(r"^\s*[a-zA-Z]+\w*:\s*\.[a-zA-Z]\w*"),
 
     # Matches any line of the form ".something"
     # (first non-whitespace char is "." and it's followed by an any number of alphanumeric characters)
     # (does not match full line, only to end of word)
-    'directive': re.compile(r"^\s*\.\w+")
+    'directive': re.compile(r"^\s*\.\w+"),
+
+    # Matches a data segment directive, capturing the optional label, the directive, and the operands (up to the end of
+    # the line, comments are removed by data_segment.py since "#" may appear inside strings)
+    'data_directive': re.compile(r"^\s*(?:(?P<label>[a-zA-Z]+\w*):)?\s*(?P<directive>\.[a-zA-Z]\w*)(?P<operands>.*)"),
+
+    # Matches a quoted string operand of .ascii and .asciiz (backslash escapes allowed)
+    'string': re.compile(r'"((?:[^"\\\n]|\\.)*)"'),
+
+    # Matches a ".globl" (or ".global") directive and captures the labels it exports (separated by commas/whitespace)
+    # (does not match full line, stops before a trailing comment)
+    'global': re.compile(r"^\s*\.globa?l\s+([a-zA-Z]+\w*(?:[\s,]+[a-zA-Z]+\w*)*)")
 }
+
+# Single regex combining the patterns above so a line can be classified with one match call
+# The alternatives are tried in the same order as the checks in get_line_type(...) and the name of the outermost
+# group that matched gives the kind of line (retrieved through match.lastgroup)
+# Inner named groups capture the label and mnemonic so the line doesn't need to be split again later
+LINE_REGEX = re.compile(
+    r"^(?:"
+    r"(?P<blank>\s*$)"
+    r"|(?P<comment>\s*#)"
+    r"|(?P<label_only>\s*(?P<lone_label>[a-zA-Z]+\w*):\s*$)"
+    r"|(?P<variable>\s*(?P<variable_name>[a-zA-Z]+\w*):\s*\.[a-zA-Z]\w*)"
+    r"|(?P<label_and_instr>\s*(?P<label>[a-zA-Z]+\w*):\s+(?P<label_mnemonic>[a-zA-Z]+)\s+.+)"
+    r"|(?P<instruction>\s*(?P<mnemonic>[a-zA-Z]+)(?:\s+[a-zA-Z]+\w*|(?:\s+\$.*)+))"
+    r"|(?P<directive>\s*\.\w+)"
+    r")"
+)
+
+# Same as LINE_REGEX, but matching bytes of a memory mapped file in place (see mapped_source.py)
+# (MULTILINE so "^" matches at the start of any line when matching from a line offset)
+LINE_BYTES_REGEX = re.compile(LINE_REGEX.pattern.encode(), re.MULTILINE)
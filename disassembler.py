@@ -0,0 +1,375 @@
+"""
+Vectorized disassembler turning assembled machine code back into assembly
+
+The words are loaded into a NumPy uint32 array (from the "text" output format, raw big or little endian binary, or
+the readmemh/logisim hex formats), and the fields of every instruction (opcode, rs, rt, rd, shamt, funct, imm, and
+the jump address) are extracted for the whole array at once with shifts and masks.  Mnemonics and register names are
+looked up through reverse tables built from instructions.instruction_list and dicts.REGISTER_DICT, and the operands
+are put together with the instruction's format list, again a whole group of instructions at a time.  The text is
+produced (and can be written) in chunks, so a dump of millions of words never has to be held as one string.
+
+The output assembles back to the same words: branch and jump targets inside the dump get labels ("L_00001f40:") and
+immediates are written as signed numbers.  Since mul and mult share an encoding, both disassemble to mult.  A word
+which isn't a supported instruction can't be written back into the text segment (.word always goes to the data
+segment, see data_segment.py), so such a word is refused with a ValueError unless unknown words are allowed, in which
+case it is written as a ".word 0x........" line and everything after it no longer assembles to its old address.
+
+NumPy is optional for the rest of the assembler, it is only needed to use this module.
+
+Usage (from the repository root):
+    python disassembler.py "Assembled Files/assembled.txt" [output.asm] [-f text|bin|bin_le|readmemh|logisim]
+        [--allow-unknown]
+"""
+from instruction_assemblers import OPCODE_SHIFT, FIELD_SHIFT_DICT, REGISTER_MASK, IMM_MASK, ADDRESS_MASK
+import instructions
+import assembler
+import argparse
+import dicts
+import sys
+
+try:
+    import numpy as np
+except ImportError:     # NumPy is only required for disassembling
+    np = None
+
+# Number of words rendered to text at a time
+DEFAULT_CHUNK_SIZE = 65536
+
+# Input formats (names match OUTPUT_FORMAT_DICT in output_formats.py, Intel HEX isn't supported)
+INPUT_FORMATS = ["text", "bin", "bin_le", "readmemh", "logisim"]
+
+# Input format guessed from the file extension when none is given
+EXTENSION_FORMAT_DICT = {".txt": "text", ".bin": "bin", ".mem": "readmemh", ".img": "logisim"}
+
+# Mnemonics in instruction list order, reverse lookup tables mapping opcodes (and functs for opcode 0) to their
+# position in MNEMONICS (-1 if unknown)
+# Note: mul and mult share an encoding, mult is listed last so it wins
+MNEMONICS = list(instructions.instruction_list)
+_OPCODE_TABLE = [-1] * 64
+_FUNCT_TABLE = [-1] * 64
+for _mnemonic_index, (_mnemonic, _instr_format_dict) in enumerate(instructions.instruction_list.items()):
+    if _instr_format_dict["type"] == "R":
+        _FUNCT_TABLE[_instr_format_dict["funct"]] = _mnemonic_index
+    else:
+        _OPCODE_TABLE[_instr_format_dict["opcode"]] = _mnemonic_index
+
+# Register names by number (the first name of each register in REGISTER_DICT, i.e. "$zero" rather than "$0")
+REGISTER_NAMES = [None] * 32
+for _register_name, _register_number in dicts.REGISTER_DICT.items():
+    if REGISTER_NAMES[_register_number] is None:
+        REGISTER_NAMES[_register_number] = _register_name
+
+# Format lists mapped to the positions in MNEMONICS of the instructions using them
+FORMAT_GROUP_DICT = {}
+for _mnemonic_index, _mnemonic in enumerate(MNEMONICS):
+    FORMAT_GROUP_DICT.setdefault(tuple(instructions.instruction_list[_mnemonic]["format"]), []).append(_mnemonic_index)
+
+# Column of the address comments (see show_addresses)
+COMMENT_COLUMN = 40
+
+# Width of the label prefix of a line ("L_00001f40: ", lines without a label are indented by the same amount)
+LABEL_WIDTH = 12
+
+
+def require_numpy():
+    """
+    :raises ImportError if NumPy is not installed
+    """
+    if np is None:
+        raise ImportError("Disassembling requires NumPy (pip install numpy)")
+
+
+def get_input_format(filename):
+    """
+    Guesses the input format of a file from its extension
+    :param filename: name of the file (string)
+    :return: input format (one of INPUT_FORMATS, "text" if the extension is unknown)
+    """
+    for extension, input_format in EXTENSION_FORMAT_DICT.items():
+        if filename.endswith(extension):
+            return input_format
+    return "text"
+
+
+def parse_digits(data, digit_values, digits_per_word, bits_per_digit):
+    """
+    Extracts the digits of a text dump and combines every digits_per_word digits into a word
+    Characters which aren't digits (spaces, newlines, ...) are skipped
+    :param data: text of the dump (bytes)
+    :param digit_values: (256,) int16 array mapping every byte to its digit value (-1 if it isn't a digit)
+    :param digits_per_word: number of digits making up a word (int)
+    :param bits_per_digit: number of bits of every digit (int)
+    :return: uint32 array of words
+    :raises ValueError if the number of digits isn't a multiple of digits_per_word
+    """
+    values = digit_values[np.frombuffer(data, dtype=np.uint8)]
+    digits = values[values >= 0].astype(np.uint32)
+    if len(digits) % digits_per_word:
+        raise ValueError(f"Dump contains {len(digits)} digits, which is not a multiple of {digits_per_word} "
+                         f"(one word)")
+    digits = digits.reshape(-1, digits_per_word)
+    shifts = np.arange(digits_per_word - 1, -1, -1, dtype=np.uint32) * bits_per_digit
+    return np.bitwise_or.reduce(digits << shifts, axis=1).astype(np.uint32) if len(digits) \
+        else np.zeros(0, dtype=np.uint32)
+
+
+def load_words(data, input_format="text"):
+    """
+    Loads the words of a machine code dump into a NumPy array
+    :param data: contents of the dump (bytes)
+    :param input_format: one of INPUT_FORMATS
+    :return: uint32 array of words in address order
+    :raises ValueError if the input format is unknown or the dump doesn't hold whole words
+    """
+    require_numpy()
+    if input_format in ["bin", "bin_le"]:
+        if len(data) % 4:
+            raise ValueError(f"Binary dump is {len(data)} bytes long, which is not a multiple of 4 (one word)")
+        return np.frombuffer(data, dtype=">u4" if input_format == "bin" else "<u4").astype(np.uint32)
+
+    if input_format == "text":
+        digit_values = np.full(256, -1, dtype=np.int16)
+        digit_values[ord("0")], digit_values[ord("1")] = 0, 1
+        return parse_digits(data, digit_values, 32, 1)
+
+    if input_format in ["readmemh", "logisim"]:
+        if input_format == "logisim" and data.startswith(b"v2.0 raw"):
+            data = data[data.find(b"\n") + 1:]
+        digit_values = np.full(256, -1, dtype=np.int16)
+        for digit in range(16):
+            digit_values[ord(f"{digit:x}")] = digit_values[ord(f"{digit:X}")] = digit
+        return parse_digits(data, digit_values, 8, 4)
+
+    raise ValueError(f"Input format \"{input_format}\" is not supported "
+                     f"(supported formats: {', '.join(INPUT_FORMATS)})")
+
+
+def decode_fields(words, start_address):
+    """
+    Extracts the fields of every word
+    :param words: uint32 array of words
+    :param start_address: byte address of the first word (int)
+    :return: dictionary of int64 arrays with one entry per word: address, mnemonic (index into MNEMONICS, -1 if the
+        word isn't a supported instruction), rs, rt, rd, shamt, imm (sign extended), and target (branch or jump
+        target address)
+    """
+    words = words.astype(np.int64)
+    opcode = words >> OPCODE_SHIFT
+    funct = words & 0x3F
+    imm = words & IMM_MASK
+    imm = imm - ((imm & 0x8000) << 1)
+    address = start_address + 4 * np.arange(len(words), dtype=np.int64)
+
+    mnemonic = np.where(opcode == 0, np.array(_FUNCT_TABLE)[funct], np.array(_OPCODE_TABLE)[opcode])
+    # Jumps replace the low 28 bits of PC+4, branches are relative to PC+4
+    jump_target = ((address + 4) & 0xF0000000) | ((words & ADDRESS_MASK) << 2)
+    branch_target = (address + 4 + (imm << 2)) & 0xFFFFFFFF
+    is_jump = np.isin(opcode, [instructions.instruction_list[name]["opcode"]
+                               for name in MNEMONICS if instructions.instruction_list[name]["type"] == "J"])
+    return {"address": address, "mnemonic": mnemonic,
+            "rs": (words >> FIELD_SHIFT_DICT["rs"]) & REGISTER_MASK,
+            "rt": (words >> FIELD_SHIFT_DICT["rt"]) & REGISTER_MASK,
+            "rd": (words >> FIELD_SHIFT_DICT["rd"]) & REGISTER_MASK,
+            "shamt": (words >> FIELD_SHIFT_DICT["shamt"]) & REGISTER_MASK,
+            "imm": imm, "target": np.where(is_jump, jump_target, branch_target)}
+
+
+def get_label_addresses(fields):
+    """
+    :param fields: fields of every word (see decode_fields(...))
+    :return: sorted int64 array of the branch and jump targets which are inside the dump (or right after its last
+        word, like a label at the end of a program)
+    """
+    label_mnemonics = [index for index, name in enumerate(MNEMONICS)
+                       if "label" in instructions.instruction_list[name]["format"]]
+    targets = fields["target"][np.isin(fields["mnemonic"], label_mnemonics)]
+    address = fields["address"]
+    if len(address) == 0:
+        return targets
+    return np.unique(targets[(targets >= address[0]) & (targets <= address[-1] + 4)])
+
+
+def get_hex_strings(values, digits=8):
+    """
+    :param values: int64 array
+    :return: array of strings with the lowest digits hex digits of every value (lowercase, zero padded)
+    """
+    hex_digits = np.array(list("0123456789abcdef"))
+    strings = hex_digits[(values >> (4 * (digits - 1))) & 0xF]
+    for digit in range(digits - 2, -1, -1):
+        strings = np.char.add(strings, hex_digits[(values >> (4 * digit)) & 0xF])
+    return strings
+
+
+def render_operand(field, fields, selection, register_names):
+    """
+    Renders one operand of a group of instructions sharing a format
+    :param field: format field ("rd", "rs", "rt", "shamt", "imm", "imm(rs)", or "label")
+    :param fields: fields of every word (see decode_fields(...))
+    :param selection: index array of the instructions in the group
+    :param register_names: array of register names by number
+    :return: array of strings
+    """
+    if field in ["rd", "rs", "rt"]:
+        return register_names[fields[field][selection]]
+    if field in ["shamt", "imm"]:
+        return fields[field][selection].astype(str)
+    if field == "imm(rs)":
+        return np.char.add(np.char.add(fields["imm"][selection].astype(str), "("),
+                           np.char.add(register_names[fields["rs"][selection]], ")"))
+    return np.char.add("L_", get_hex_strings(fields["target"][selection]))
+
+
+def check_known_words(fields):
+    """
+    :param fields: fields of every word (see decode_fields(...)) and the words themselves under "word"
+    :raises ValueError if a word isn't a supported instruction (its assembly wouldn't assemble back to the same words)
+    """
+    unknown = np.nonzero(fields["mnemonic"] < 0)[0]
+    if len(unknown):
+        index = unknown[0]
+        raise ValueError(f"Word 0x{int(fields['word'][index]):08x} at address 0x{int(fields['address'][index]):08x} "
+                         f"is not a supported instruction and can't be assembled back into the text segment "
+                         f"(unknown words in the dump: {len(unknown):,}, allow unknown words to write them as .word "
+                         f"lines)")
+
+
+def render_chunk(fields, chunk_start, chunk_end, label_addresses, show_addresses=False):
+    """
+    Renders a chunk of the dump as assembly (words which aren't supported instructions as .word lines)
+    :param fields: fields of every word (see decode_fields(...)) and the words themselves under "word"
+    :param chunk_start, chunk_end: range of word indexes to render
+    :param label_addresses: sorted array of the addresses which get a label (see get_label_addresses(...))
+    :param show_addresses: end every line with a comment holding its address and word
+    :return: text of the chunk (string)
+    """
+    chunk = {name: values[chunk_start:chunk_end] for name, values in fields.items()}
+    count = chunk_end - chunk_start
+    register_names = np.array(REGISTER_NAMES)
+    mnemonics = chunk["mnemonic"]
+    lines = np.zeros(count, dtype=object)
+
+    # Instructions sharing a format are rendered together
+    for format_tuple, format_mnemonics in FORMAT_GROUP_DICT.items():
+        selection = np.nonzero(np.isin(mnemonics, format_mnemonics))[0]
+        if len(selection) == 0:
+            continue
+        text = np.char.add(np.array(MNEMONICS)[mnemonics[selection]], " ")
+        for position, field in enumerate(format_tuple):
+            if position:
+                text = np.char.add(text, ", ")
+            text = np.char.add(text, render_operand(field, chunk, selection, register_names))
+        lines[selection] = text
+
+    unknown = np.nonzero(mnemonics < 0)[0]
+    if len(unknown):
+        lines[unknown] = np.char.add(".word 0x", get_hex_strings(chunk["word"][unknown]))
+
+    # Labels in front of the branch and jump targets, everything else indented to line up
+    prefixes = np.full(count, " " * LABEL_WIDTH, dtype=f"U{LABEL_WIDTH}")
+    labeled = np.nonzero(np.isin(chunk["address"], label_addresses))[0]
+    if len(labeled):
+        prefixes[labeled] = np.char.add(np.char.add("L_", get_hex_strings(chunk["address"][labeled])), ": ")
+    lines = np.char.add(prefixes, lines.astype(str))
+
+    if show_addresses:
+        lines = np.char.add(np.char.add(np.char.add(np.char.ljust(lines, COMMENT_COLUMN), "# 0x"),
+                                        get_hex_strings(chunk["address"])),
+                            np.char.add(": ", get_hex_strings(chunk["word"])))
+    return "\n".join(lines.tolist()) + "\n" if count else ""
+
+
+def disassemble_chunks(words, start_address=None, chunk_size=DEFAULT_CHUNK_SIZE, show_addresses=False,
+                       allow_unknown=False):
+    """
+    Generator disassembling a dump a chunk at a time
+    :param words: words in address order (NumPy array, array, or list of ints)
+    :param start_address: byte address of the first word (defaults to assembler.START_ADDRESS)
+    :param chunk_size: number of words rendered at a time (int)
+    :param show_addresses: end every line with a comment holding its address and word
+    :param allow_unknown: write words which aren't supported instructions as .word lines instead of refusing them
+        (the text then no longer assembles back to the same words)
+    :return: yields the text of each chunk (string)
+    :raises ValueError if a word isn't a supported instruction and allow_unknown is False (before anything is
+        yielded)
+    """
+    require_numpy()
+    start_address = assembler.START_ADDRESS if start_address is None else start_address
+    words = np.asarray(words, dtype=np.uint32)
+    fields = decode_fields(words, start_address)
+    fields["word"] = words.astype(np.int64)
+    if not allow_unknown:
+        check_known_words(fields)
+    label_addresses = get_label_addresses(fields)
+    for chunk_start in range(0, len(words), chunk_size):
+        yield render_chunk(fields, chunk_start, min(chunk_start + chunk_size, len(words)), label_addresses,
+                           show_addresses)
+    end_address = start_address + 4 * len(words)
+    if len(label_addresses) and label_addresses[-1] == end_address:
+        yield f"L_{end_address:08x}:\n"
+
+
+def disassemble(words, start_address=None, show_addresses=False, allow_unknown=False):
+    """
+    Disassembles a dump into one string
+    :param words: words in address order (NumPy array, array, or list of ints)
+    :param start_address: byte address of the first word (defaults to assembler.START_ADDRESS)
+    :param show_addresses: end every line with a comment holding its address and word
+    :param allow_unknown: write words which aren't supported instructions as .word lines instead of refusing them
+    :return: assembly text (string)
+    :raises ValueError if a word isn't a supported instruction and allow_unknown is False
+    """
+    return "".join(disassemble_chunks(words, start_address, show_addresses=show_addresses,
+                                      allow_unknown=allow_unknown))
+
+
+def disassemble_file(input_filename, o_file, input_format=None, start_address=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                     show_addresses=False, allow_unknown=False):
+    """
+    Disassembles a dump file, writing the text a chunk at a time
+    :param input_filename: name of the dump file (string)
+    :param o_file: output file handle (text mode)
+    :param input_format: one of INPUT_FORMATS (guessed from the extension if None, see get_input_format(...))
+    :param start_address: byte address of the first word (defaults to assembler.START_ADDRESS)
+    :param chunk_size: number of words rendered at a time (int)
+    :param show_addresses: end every line with a comment holding its address and word
+    :param allow_unknown: write words which aren't supported instructions as .word lines instead of refusing them
+    :return: number of words disassembled (int)
+    :raises OSError if the file can't be read, ValueError if it isn't a valid dump (or holds a word which isn't a
+        supported instruction and allow_unknown is False, nothing is written then)
+    """
+    with open(input_filename, "rb") as i_file:
+        words = load_words(i_file.read(), input_format or get_input_format(input_filename))
+    for text in disassemble_chunks(words, start_address, chunk_size, show_addresses, allow_unknown):
+        o_file.write(text)
+    return len(words)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Disassemble MIPS machine code")
+    parser.add_argument("input", help="machine code dump")
+    parser.add_argument("output", nargs="?", default=None, help="assembly file (default: standard output)")
+    parser.add_argument("-f", "--format", default=None, choices=INPUT_FORMATS,
+                        help="input format (default: guessed from the extension, text if unknown)")
+    parser.add_argument("--start-address", type=lambda value: int(value, 0), default=None,
+                        help="byte address of the first word (default: 7996)")
+    parser.add_argument("--addresses", action="store_true",
+                        help="end every line with a comment holding its address and word")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="number of words rendered at a time (default: %(default)s)")
+    parser.add_argument("--allow-unknown", action="store_true",
+                        help="write words which aren't supported instructions as .word lines (the output then "
+                             "doesn't assemble back to the same words)")
+    args = parser.parse_args()
+
+    try:
+        if args.output is None:
+            disassemble_file(args.input, sys.stdout, args.format, args.start_address, args.chunk_size,
+                             args.addresses, args.allow_unknown)
+        else:
+            with open(args.output, "w") as output_file:
+                disassemble_file(args.input, output_file, args.format, args.start_address, args.chunk_size,
+                                 args.addresses, args.allow_unknown)
+    except (OSError, ValueError, ImportError) as error:
+        print(error)
+        sys.exit(1)
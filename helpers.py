@@ -1,5 +1,5 @@
 from contextlib import contextmanager
-from custom_types import LineType
+from custom_types import LineType, ClassifiedLine
 import instructions
 import dicts
 import re
@@ -24,86 +24,15 @@ def open_with_error(filename, mode="r"):
             f.close()
 
 
-def get_twos_complement(binary_string: str):
+def rewind(i_file):
     """
-    Compute the 2's complement of int value
-
-    Note: Currently this expects and returns strings without any prefix, i.e. "01011"
-          NO "0b" prefix
-
-    :param binary_string: string with value to compute 2's complement of (int)
-    :return: string with 2's complement representation
-    """
-    n = len(binary_string)
-
-    # Traverse the string to get first
-    # '1' from the last of string
-    i = n - 1
-    while i >= 0:
-        if binary_string[i] == '1':
-            break
-
-        i -= 1
-
-    # If there exists no '1' concatenate 1
-    # at the starting of string
-    if i == -1:
-        return '1' + binary_string
-
-    # Continue traversal after the
-    # position of first '1'
-    k = i - 1
-    while k >= 0:
-
-        # Just flip the values
-        if binary_string[k] == '1':
-            binary_string = list(binary_string)
-            binary_string[k] = '0'
-            binary_string = ''.join(binary_string)
-        else:
-            binary_string = list(binary_string)
-            binary_string[k] = '1'
-            binary_string = ''.join(binary_string)
-
-        k -= 1
-
-    # return the modified string
-    return binary_string
-
-
-def sign_extend(binary_string: bin, total_bits: int):
-    """
-    Sign extend a binary value up to set number of bits
-    Note: This expects strings beginning with either "-0b" or "0b" based on whether it is negative or not
-        If the value is negative, it takes the 2's complement and returns it without the "-0b" prefix
-        All strings returned contain the "0b" prefix, and all are "positive" in the sense they use
-        2's complement representation
-
-    :param binary_string: binary string to extend (prefixed with "0b" or "-0b")
-    :param total_bits: total number of bits in resulting string (does not include 0b prefix)
-    :return: binary string with specified number of bits (prefixed with "0b")
+    Resets the read pointer of a file to the top of the file
+    Other iterables of lines (lists, generators, etc.) are left alone
+    :param i_file: file handle or iterable of lines
+    :return: None
     """
-    negative = False
-
-    # Determine if it is negative (binary strings are prefixed with "-0b" if negative)
-    # If it is negative...
-    if binary_string[0] == "-":
-        negative = True
-        # Chop off "-0b" prefix
-        string = binary_string[3:]
-        # Convert to 2's complement representation
-        string = get_twos_complement(string)
-    # else not negative
-    else:
-        # Chop off "0b" prefix
-        string = binary_string[2:]
-
-    sign_bit_char = "0" if not negative else "1"
-    # Extend
-    string = string.rjust(total_bits, sign_bit_char)
-    # Add "0b" prefix back on
-    result_binary_string = "0b" + string
-    return result_binary_string
+    if hasattr(i_file, "seek"):
+        i_file.seek(0)
 
 
 def get_line_type(line):
@@ -113,37 +42,69 @@ def get_line_type(line):
     :return: LineType (see LineType enum for options)
     :rtype: LineType
     """
-    if line.strip() == "":
-        return LineType.BLANK
+    return classify_line(line).line_type
 
-    # If first non-whitespace char is "#" it's a comment
-    if re.search(dicts.REGEX_DICT["comment"], line):
-        return LineType.COMMENT
 
-    # If it matches the regex pattern below it's a label only
-    if re.search(dicts.REGEX_DICT["label_only"], line):
-        return LineType.LABEL_ONLY
+# ClassifiedLine results for line types that don't carry any further information
+_BLANK_LINE = ClassifiedLine(LineType.BLANK)
+_COMMENT_LINE = ClassifiedLine(LineType.COMMENT)
+_DIRECTIVE_LINE = ClassifiedLine(LineType.ASSM_DIRECTIVE)
+_INVALID_LINE = ClassifiedLine(LineType.INVALID)
 
-    # If it matches the regex pattern below it's a variable
-    if re.search(dicts.REGEX_DICT["variable"], line):
-        return LineType.VARIABLE
+# Dictionary mapping every known mnemonic to its line type without and with a label on the same line
+_MNEMONIC_LINE_TYPE_DICT = {
+    **{mnemonic: (LineType.U_INSTRUCTION, LineType.LABEL_WITH_U_INSTR)
+       for mnemonic in instructions.unsupported_instruction_list},
+    **{mnemonic: (LineType.PSEUDO_INSTRUCTION, LineType.LABEL_WITH_PSEUDO_INSTR)
+       for mnemonic in instructions.pseudo_instruction_list},
+    **{mnemonic: {"R": (LineType.R_INSTRUCTION, LineType.LABEL_WITH_R_INSTR),
+                  "I": (LineType.I_INSTRUCTION, LineType.LABEL_WITH_I_INSTR),
+                  "J": (LineType.J_INSTRUCTION, LineType.LABEL_WITH_J_INSTR)}[instr_format_dict["type"]]
+       for mnemonic, instr_format_dict in instructions.instruction_list.items()},
+}
 
-    # If it matches the regex pattern below it is a label most likely followed by an instruction
-    # however the validity of the instruction portion has yet to be verified
-    if re.search(dicts.REGEX_DICT["label_and_instr"], line):
-        return get_instruction_type(line)
 
-    # Line below matches any line that starts like an instruction
-    # The full validity of the instruction has yet to be verified
-    if re.search(dicts.REGEX_DICT["instruction"], line):
-        return get_instruction_type(line)
-
-    # If it matches the regex pattern below it's an assembler directive
-    if re.search(dicts.REGEX_DICT["directive"], line):
-        return LineType.ASSM_DIRECTIVE
-
-    # Else it's an invalid line
-    return LineType.INVALID
+def classify_line(line):
+    """
+    Classifies the provided line with a single regex match (see LINE_REGEX in dicts.py)
+    Equivalent to get_line_type(...), but also returns the label, mnemonic, and the location of the operands so the
+    line doesn't need to be searched or split again when it is tokenized
+    :param line: assembly file line
+    :return: ClassifiedLine (see custom_types.py)
+    :rtype: ClassifiedLine
+    """
+    match = dicts.LINE_REGEX.match(line)
+    if match is None:
+        return _INVALID_LINE
+
+    kind = match.lastgroup
+    if kind == "blank":
+        return _BLANK_LINE
+    if kind == "comment":
+        return _COMMENT_LINE
+    if kind == "label_only":
+        return ClassifiedLine(LineType.LABEL_ONLY, match.group("lone_label"))
+    if kind == "variable":
+        return ClassifiedLine(LineType.VARIABLE, match.group("variable_name"))
+    if kind == "directive":
+        return _DIRECTIVE_LINE
+
+    # Otherwise it is an instruction (possibly preceded by a label)
+    # Only the mnemonic is checked at this stage (see get_instruction_type(...))
+    with_label = kind == "label_and_instr"
+    mnemonic_group = "label_mnemonic" if with_label else "mnemonic"
+    mnemonic = match.group(mnemonic_group)
+    line_types = _MNEMONIC_LINE_TYPE_DICT.get(mnemonic)
+    if line_types is None:
+        return ClassifiedLine(LineType.INVALID_INSTRUCTION)
+
+    # Operands run until a trailing comment or the end of the line
+    operand_start = match.end(mnemonic_group)
+    operand_end = line.find("#", operand_start)
+    if operand_end == -1:
+        operand_end = len(line)
+    return ClassifiedLine(line_types[with_label], match.group("label") if with_label else None, mnemonic,
+                          operand_start, operand_end)
 
 
 def get_instruction_type(instruction_line):
@@ -183,19 +144,8 @@ def get_instruction_type(instruction_line):
     instr_line_list = instruction.split()
     # Get mnemonic portion
     mnemonic = instr_line_list[0]
-    # Check if mnemonic matches a valid instruction
-    if mnemonic in instructions.instruction_list:
-        instr_type_dict = instructions.instruction_list[mnemonic]
-        # Get type of instruction
-        if instr_type_dict["type"] == "R":
-            return LineType.R_INSTRUCTION if with_label is False else LineType.LABEL_WITH_R_INSTR
-        if instr_type_dict["type"] == "I":
-            return LineType.I_INSTRUCTION if with_label is False else LineType.LABEL_WITH_I_INSTR
-        if instr_type_dict["type"] == "J":
-            return LineType.J_INSTRUCTION if with_label is False else LineType.LABEL_WITH_J_INSTR
-
-    # else check if it is technically an instruction, but not yet supported
-    elif mnemonic in instructions.unsupported_instruction_list:
-        return LineType.U_INSTRUCTION if with_label is False else LineType.LABEL_WITH_U_INSTR
+    # Check if mnemonic matches a valid (or valid but not yet supported) instruction and get its type
+    if mnemonic in _MNEMONIC_LINE_TYPE_DICT:
+        return _MNEMONIC_LINE_TYPE_DICT[mnemonic][with_label]
 
     return LineType.INVALID_INSTRUCTION
@@ -0,0 +1,248 @@
+from custom_types import LineType, AssemblerError, InvalidLineError, InvalidInstructionError
+from instruction_assemblers import *
+from io import StringIO
+import output_formats
+import data_segment
+import custom_types
+import instructions
+import assembler
+import argparse
+import hashlib
+import helpers
+import pseudo
+import pickle
+import cli
+import sys
+
+# Bump whenever the cache contents or the way instructions are encoded changes so old caches are discarded
+CACHE_VERSION = 3
+
+
+def get_hash(text):
+    """
+    Content hash used to key the cache (stable across runs unlike the built-in hash(...))
+    :param text: text to hash (string)
+    :return: digest (bytes)
+    """
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def get_empty_cache():
+    """
+    Creates an empty cache
+    lines - dictionary mapping line hashes to a list [line type, label, tokenized instruction list, word, target label,
+            expansion]
+            (word is only stored for instructions that don't reference a label, since those don't depend on their
+            address, target label is stored for branches and jumps once they have been verified, expansion is the list
+            of entries of the instructions a pseudo instruction was lowered to, None for other lines)
+    branches - dictionary mapping (instruction key, position) to the word of a branch or jump
+            (instruction key is the line hash, or (line hash, index in the expansion) for expanded instructions,
+            position is the target address for jumps, and the distance from the instruction to the target for
+            branches since they are PC relative)
+    words - assembled words of the whole file (reused as is if the file hash matches)
+    """
+    return {"version": CACHE_VERSION, "file_hash": None, "start_address": None,
+            "lines": {}, "branches": {}, "words": output_formats.get_word_array()}
+
+
+def load_cache(cache_filename):
+    """
+    Loads the cache written by a previous run
+    Note: the cache is a pickle file, only load caches created by this assembler
+    :param cache_filename: cache filename (string)
+    :return: cache dictionary (see get_empty_cache(...)), empty if the file doesn't exist or is outdated
+    """
+    try:
+        with open(cache_filename, "rb") as cache_file:
+            cache = pickle.load(cache_file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return get_empty_cache()
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return get_empty_cache()
+    return cache
+
+
+def save_cache(cache_filename, cache):
+    """
+    Writes the cache for the next run
+    :param cache_filename: cache filename (string)
+    :param cache: cache dictionary (see get_empty_cache(...))
+    :return: None
+    """
+    with open(cache_filename, "wb") as cache_file:
+        pickle.dump(cache, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def assemble_text_incremental(text, cache, stats):
+    """
+    Assembles the text of an assembly file reusing everything the cache contains from the last run
+    Only lines whose text changed are classified, tokenized and encoded again, along with jumps whose target label
+    address moved and branches whose distance to their target label changed.
+    :param text: contents of the assembly file (string)
+    :param cache: cache dictionary from the last run (see get_empty_cache(...))
+    :param stats: dictionary of hit/miss counters (updated by this function)
+    :return: Tuple (assembled words (array), new cache dictionary)
+    :raises AssemblerError if a line or instruction is invalid
+    """
+    file_hash = get_hash(text)
+    if cache["file_hash"] == file_hash and cache["start_address"] == assembler.START_ADDRESS:
+        stats["file_hits"] += 1
+        return cache["words"], cache
+
+    stats["file_misses"] += 1
+    new_cache = get_empty_cache()
+    new_cache["file_hash"] = file_hash
+    new_cache["start_address"] = assembler.START_ADDRESS
+
+    # Same as the first pass, but using the cached classification of every unchanged line
+    symbol_table = {}
+    instruction_list = []   # Tuples (line cache entry, instruction key, instruction address, line number)
+    current_instruction_address = assembler.START_ADDRESS-4
+    for line_number, line in enumerate(StringIO(text)):
+        line_hash = get_hash(line)
+        entry = new_cache["lines"].get(line_hash) or cache["lines"].get(line_hash)
+        if entry is not None:
+            stats["line_hits"] += 1
+        else:
+            stats["line_misses"] += 1
+            classified_line = helpers.classify_line(line)
+            if classified_line.line_type == LineType.INVALID:
+                raise InvalidLineError("Error invalid line encountered in assembly file",
+                                       line_number+1, line)                     # +1 since first line is 0
+            tokenized_instr_list = None
+            expansion = None
+            if classified_line.line_type in custom_types.ALL_INSTRUCTIONAL_TYPES or \
+                    classified_line.line_type in custom_types.ALL_PSEUDO_TYPES:
+                tokenized_instr_list = tokenize_classified_line(line, classified_line)
+            # Pseudo instructions are lowered on their own, since relaxing their sizes would need the whole program
+            # (see pseudo.py, there are no variables since data segments aren't supported)
+            if classified_line.line_type in custom_types.ALL_PSEUDO_TYPES:
+                try:
+                    expanded_lines = pseudo.get_expanded_lines(
+                        classified_line.line_type, pseudo.get_fixed_size_expansion(tokenized_instr_list, {}))
+                except AssemblerError as error:
+                    error.line_number, error.line = line_number+1, line   # +1 since first line is 0
+                    raise
+                expansion = [[expanded_line_type, None, expanded_tokens, None, None, None]
+                             for expanded_line_type, expanded_tokens in expanded_lines]
+            entry = [classified_line.line_type, classified_line.label, tokenized_instr_list, None, None, expansion]
+        new_cache["lines"][line_hash] = entry
+
+        line_type = entry[0]
+        # The cache only holds instruction words, so data would be lost
+        if data_segment.is_data_line(line_type, line):
+            raise InvalidLineError("Data segments are not supported by incremental reassembly",
+                                   line_number+1, line)                         # +1 since first line is 0
+        if line_type in custom_types.ALL_INSTRUCTIONAL_TYPES:
+            current_instruction_address += 4
+            instruction_list.append((entry, line_hash, current_instruction_address, line_number))
+        if line_type in custom_types.ALL_LABEL_TYPES:
+            # (the expansion of a pseudo instruction is placed below, so its label is at the next address too)
+            if line_type in [LineType.LABEL_ONLY, LineType.LABEL_WITH_PSEUDO_INSTR]:
+                symbol_table[entry[1]] = current_instruction_address + 4
+            else:
+                symbol_table[entry[1]] = current_instruction_address
+        if line_type in custom_types.ALL_PSEUDO_TYPES:
+            for position, expanded_entry in enumerate(entry[5]):
+                current_instruction_address += 4
+                instruction_list.append((expanded_entry, (line_hash, position), current_instruction_address,
+                                         line_number))
+
+    # Same as the second pass, but reusing every word whose inputs didn't change
+    # Lines from the last run which contained branches or jumps (to tell new lines apart from moved targets)
+    old_branch_lines = {instruction_key for instruction_key, _ in cache["branches"]}
+    words = new_cache["words"]
+    for entry, instruction_key, current_instruction_address, line_number in instruction_list:
+        line_type, label, tokenized_instr_list, word, target_label, _ = entry
+
+        # Instructions which don't reference a label only depend on their text
+        if word is not None:
+            stats["encode_hits"] += 1
+            words.append(word)
+            continue
+
+        # Verify instructions the first time they are seen (and any time their target label is missing)
+        instr_format_dict = instructions.instruction_list[tokenized_instr_list[0]]
+        if target_label is None or target_label not in symbol_table:
+            try:
+                instr_format_dict = verify_instruction_tokens(tokenized_instr_list, symbol_table)
+            except AssemblerError as error:
+                error.line_number = line_number+1                       # +1 since first line is 0
+                raise
+            target_label = get_label_token(tokenized_instr_list, instr_format_dict)
+            if target_label is None:
+                stats["encode_misses"] += 1
+                entry[3] = assembler.assemble_instruction(line_type, tokenized_instr_list, instr_format_dict,
+                                                          symbol_table, current_instruction_address)
+                words.append(entry[3])
+                continue
+            entry[4] = target_label
+
+        # Jumps depend on the address of their target and branches on the distance to it
+        target_address = symbol_table[target_label]
+        if line_type in [LineType.J_INSTRUCTION, LineType.LABEL_WITH_J_INSTR]:
+            branch_key = (instruction_key, target_address)
+        else:
+            branch_key = (instruction_key, target_address - current_instruction_address)
+        word = new_cache["branches"].get(branch_key)
+        if word is None:
+            word = cache["branches"].get(branch_key)
+        if word is not None:
+            stats["encode_hits"] += 1
+        else:
+            stats["encode_misses"] += 1
+            if instruction_key in old_branch_lines:
+                stats["moved_targets"] += 1
+            word = assembler.assemble_instruction(line_type, tokenized_instr_list, instr_format_dict, symbol_table,
+                                                  current_instruction_address)
+        new_cache["branches"][branch_key] = word
+        words.append(word)
+
+    return words, new_cache
+
+
+def assemble_incremental(assembly_filename, assembled_filename, cache_filename=None, output_format="text"):
+    """
+    Assembles a file using an on-disk cache of the classification, tokens and encoded words of every line from the
+    last run, so reassembling after a small edit costs roughly the size of the edit instead of the size of the file
+    :param assembly_filename: input filename (include file extension)
+    :param assembled_filename: output filename
+    :param cache_filename: cache filename (defaults to the input filename with ".cache" appended)
+    :param output_format: name of the output format (see OUTPUT_FORMAT_DICT in output_formats.py)
+    :return: dictionary of cache hit/miss counters
+        file_hits/file_misses - whether the whole file was unchanged
+        line_hits/line_misses - lines whose classification and tokens were reused/recomputed
+        encode_hits/encode_misses - instructions whose encoded word was reused/recomputed
+        moved_targets - branches and jumps encoded again because their target moved
+    :raises AssemblerError if the assembly file is invalid (the cache is not updated in that case)
+    """
+    cache_filename = cache_filename or assembly_filename + ".cache"
+    stats = {"file_hits": 0, "file_misses": 0, "line_hits": 0, "line_misses": 0,
+             "encode_hits": 0, "encode_misses": 0, "moved_targets": 0}
+
+    with open(assembly_filename, "r") as i_file:
+        text = i_file.read()
+    words, new_cache = assemble_text_incremental(text, load_cache(cache_filename), stats)
+
+    with open(assembled_filename, output_formats.get_output_mode(output_format)) as o_file:
+        output_formats.write_words(o_file, words, output_format, assembler.START_ADDRESS)
+    save_cache(cache_filename, new_cache)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Incrementally reassemble a MIPS assembly file using a cache")
+    parser.add_argument("input", help="assembly file")
+    parser.add_argument("output", help="assembled file")
+    parser.add_argument("-f", "--format", default="text", choices=output_formats.OUTPUT_FORMAT_DICT,
+                        help="output format (default: %(default)s)")
+    parser.add_argument("--cache", default=None, help="cache filename (default: <input>.cache)")
+    args = parser.parse_args()
+
+    try:
+        cache_stats = assemble_incremental(args.input, args.output, args.cache, args.format)
+    except Exception as error:
+        print(error)
+        sys.exit(cli.get_exit_code(False))
+    else:
+        print(", ".join(f"{key}: {value}" for key, value in cache_stats.items()))
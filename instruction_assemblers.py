@@ -1,7 +1,31 @@
+from custom_types import InvalidInstructionError, UndefinedLabelError, ExpandedInstruction
 import instructions
-from helpers import sign_extend
 import dicts
 
+# Bit positions of each field within the final 32 bit instruction word
+OPCODE_SHIFT = 26
+FIELD_SHIFT_DICT = {"rs": 21, "rt": 16, "rd": 11, "shamt": 6}
+
+# Masks used to truncate values to the width of their field
+REGISTER_MASK = 0x1F        # 5 bits (rs, rt, rd, shamt)
+IMM_MASK = 0xFFFF           # 16 bits
+ADDRESS_MASK = 0x3FFFFFF    # 26 bits
+
+# Opcode and funct bits of every supported instruction already shifted into place
+# The instruction assemblers start from this prefix and OR in the remaining fields
+INSTRUCTION_PREFIX_DICT = {
+    mnemonic: (instr_format_dict["opcode"] << OPCODE_SHIFT) | (instr_format_dict["funct"] or 0)
+    for mnemonic, instr_format_dict in instructions.instruction_list.items()
+}
+
+# Mnemonics whose encoding only depends on the instruction text (everything except branches and jumps to labels)
+POSITION_INDEPENDENT_MNEMONICS = {mnemonic for mnemonic, instr_format_dict in instructions.instruction_list.items()
+                                  if "label" not in instr_format_dict["format"]}
+
+# Opcodes used to select the field layout when rendering a word as text
+R_TYPE_OPCODES = {fmt["opcode"] for fmt in instructions.instruction_list.values() if fmt["type"] == "R"}
+J_TYPE_OPCODES = {fmt["opcode"] for fmt in instructions.instruction_list.values() if fmt["type"] == "J"}
+
 
 def tokenize_instruction(line, with_label):
     """
@@ -31,7 +55,20 @@ def tokenize_instruction(line, with_label):
     return tokenized_instr_list
 
 
-def verify_instruction_tokens(tokenized_instr_list, symbol_table):
+def tokenize_classified_line(line, classified_line):
+    """
+    Same as tokenize_instruction(...), but uses the mnemonic and operand location found by helpers.classify_line(...)
+    so only the operand portion of the line is split
+
+    :param line: line of text containing the instruction and possible trailing comments (string)
+    :param classified_line: ClassifiedLine returned by helpers.classify_line(line)
+    :return: tokenized_instr_list (list)
+    """
+    operands = line[classified_line.operand_start:classified_line.operand_end]
+    return [classified_line.mnemonic, *operands.replace(",", "").split()]
+
+
+def verify_instruction_tokens(tokenized_instr_list, symbol_table, allow_undefined_labels=False):
     """
     This function uses the instruction mnemonic to find the proper instr_format_dict in the instruction_list
     It then performs some basic verification checks on the instruction such as:
@@ -48,8 +85,11 @@ def verify_instruction_tokens(tokenized_instr_list, symbol_table):
 
     :param symbol_table: dictionary mapping symbols/labels to their respective addresses (dict)
     :param tokenized_instr_list: tokenized instruction list (list)
+    :param allow_undefined_labels: skip the symbol table check for labels (boolean)
+        Used by the single pass assembler, where a label may be defined after the instruction referencing it
     :return: instr_format_dict (dict)
-    :raises Exception: if any verification fails
+    :raises InvalidInstructionError: if any verification fails
+        (UndefinedLabelError if a label could not be located in the symbol table)
     """
     # Get mnemonic portion
     mnemonic = tokenized_instr_list[0]
@@ -58,7 +98,8 @@ def verify_instruction_tokens(tokenized_instr_list, symbol_table):
     try:
         instr_format_dict = instructions.instruction_list[mnemonic]
     except KeyError as error:
-        raise Exception("Tried to find an instruction in the instruction_list that is not a supported instruction")
+        raise InvalidInstructionError("Tried to find an instruction in the instruction_list that is not a supported "
+                                      "instruction")
 
     # Get the expected format list
     expected_format_list = instr_format_dict.get("format")
@@ -69,7 +110,7 @@ def verify_instruction_tokens(tokenized_instr_list, symbol_table):
     # Verify token number: number of tokens (including mnemonic) should be the number of expected tokens + 1
     # (+1 because of the mnemonic)
     if len(tokenized_instr_list) != len(expected_format_list) + 1:
-        raise Exception("Instruction did not contain expected number of tokens")
+        raise InvalidInstructionError("Instruction did not contain expected number of tokens")
 
     # Verify token types
     for i, token_type in enumerate(expected_format_list):
@@ -78,7 +119,7 @@ def verify_instruction_tokens(tokenized_instr_list, symbol_table):
         
         Checks the following:
             rd, rs, rt - should be in REGISTER_DICT
-            rd - cannot be $0, $at, ($k0, $k1)?
+            rd - cannot be $0, $at (unless expanded from a pseudo instruction, see pseudo.py), ($k0, $k1)?
                 TODO additionally for instructions where rs or rt is the destination, then those can't be the above
                      registers either
                 TODO for jr instruction, rs must be multiple of 4
@@ -109,13 +150,14 @@ def verify_instruction_tokens(tokenized_instr_list, symbol_table):
         # Verify registers are valid
         if token_type in ["rd", "rs", "rt"]:
             if current_token not in dicts.REGISTER_DICT:
-                raise Exception(f"Provided register value \"{current_token}\" is not a valid register")
+                raise InvalidInstructionError(f"Provided register value \"{current_token}\" is not a valid register")
 
         # Verify destination register rd is not a protected/reserved register
         if token_type == "rd":
-            if current_token in ["$0", "$zero", "$at", "$k0", "$k1"]:
-                raise Exception(f"Instruction attempted to write to \"{current_token}\" which is a "
-                                f"projected/reserved register")
+            if current_token in ["$0", "$zero", "$at", "$k0", "$k1"] and not \
+                    (current_token == "$at" and isinstance(tokenized_instr_list, ExpandedInstruction)):
+                raise InvalidInstructionError(f"Instruction attempted to write to \"{current_token}\" which is a "
+                                              f"projected/reserved register")
         # TODO same as above, but for cases when the destination register is not rd
 
         # Verify immediate value is valid
@@ -124,11 +166,11 @@ def verify_instruction_tokens(tokenized_instr_list, symbol_table):
             try:
                 current_token = int(current_token)
             except ValueError:
-                raise Exception(f"Immediate value \"{current_token}\" is not numeric")
+                raise InvalidInstructionError(f"Immediate value \"{current_token}\" is not numeric")
 
             # Verify value is within valid range
             if current_token < (-1*pow(2, 15)) or current_token > (pow(2, 15)-1):
-                raise Exception(f"Immediate value \"{current_token}\" is out of range")
+                raise InvalidInstructionError(f"Immediate value \"{current_token}\" is out of range")
 
         # Verify shift amount is valid
         if token_type == "shamt":
@@ -136,23 +178,39 @@ def verify_instruction_tokens(tokenized_instr_list, symbol_table):
             try:
                 current_token = int(current_token)
             except ValueError:
-                raise Exception(f"Shift amount \"{current_token}\" not numeric")
+                raise InvalidInstructionError(f"Shift amount \"{current_token}\" not numeric")
 
             # Verify value is within valid range
             if current_token < 0 or current_token > (pow(2, 5) - 1):
-                raise Exception(f"Shift amount \"{current_token}\" is out of range")
+                raise InvalidInstructionError(f"Shift amount \"{current_token}\" is out of range")
 
         # Verify label is valid
         # TODO support numeric labels?
         #   also verify label is divisible by 4 (only needs to be implemented if the above is implemented)
         #   as it currently stands, this will always be the case
-        if token_type == "label":
+        if token_type == "label" and not allow_undefined_labels:
             if current_token not in symbol_table:
-                raise Exception(f"Label \"{current_token}\" could not be located in symbol table")
+                raise UndefinedLabelError(f"Label \"{current_token}\" could not be located in symbol table",
+                                          current_token)
 
     return instr_format_dict
 
 
+def get_label_token(tokenized_instr_list, instr_format_dict):
+    """
+    Finds the label referenced by an instruction (the target of a branch or jump)
+
+    :param tokenized_instr_list: tokenized instruction list (list)
+    :param instr_format_dict: dictionary from instruction_list containing the formatting info for the given instruction
+    :return: the label (string) or None if the instruction does not reference a label
+    """
+    expected_format_list = instr_format_dict.get("format")
+    if "label" in expected_format_list:
+        # (+1 because the tokenized instruction list starts with the mnemonic while the expected format list does not)
+        return tokenized_instr_list[expected_format_list.index("label")+1]
+    return None
+
+
 def assemble_r_instruction(tokenized_instr_list, instr_format_dict):
     """
     Assembles the provided instruction (converts it to binary etc.)
@@ -168,18 +226,11 @@ def assemble_r_instruction(tokenized_instr_list, instr_format_dict):
 
     :param tokenized_instr_list: tokenized instruction list (list)
     :param instr_format_dict: dictionary from instruction_list containing the formatting info for the given instruction
-    :return: binary string containing the final 32 bit instruction (string) (not prefixed with "0b")
-        The string will be of the form: "000000 00000 00000 00000 00000 000000"
-        can easily be changed to "00000000000000000000000000000000"
+    :return: the final 32 bit instruction word (int)
+        Use format_instruction_word(...) to render it as "000000 00000 00000 00000 00000 000000"
     """
-    # Initialize and convert all parameters to binary strings
-    # with the proper length
-    opcode = sign_extend(bin(instr_format_dict.get("opcode")), 6)
-    rs = sign_extend(bin(0), 5)
-    rt = sign_extend(bin(0), 5)
-    rd = sign_extend(bin(0), 5)
-    shamt = sign_extend(bin(0), 5)
-    funct = sign_extend(bin(instr_format_dict.get("funct")), 6)
+    # Start from the precomputed opcode and funct bits
+    word = INSTRUCTION_PREFIX_DICT[tokenized_instr_list[0]]
     expected_format_list = instr_format_dict.get("format")
 
     # For each expected token
@@ -189,22 +240,13 @@ def assemble_r_instruction(tokenized_instr_list, instr_format_dict):
         # (+1 because the tokenized instruction list starts with the mnemonic while the expected format list does not)
         current_token = tokenized_instr_list[i+1]
 
-        # Update the appropriate value
-        match token_type:
-            case "rs":
-                rs = sign_extend(bin(dicts.REGISTER_DICT[current_token]), 5)
-            case "rt":
-                rt = sign_extend(bin(dicts.REGISTER_DICT[current_token]), 5)
-            case "rd":
-                rd = sign_extend(bin(dicts.REGISTER_DICT[current_token]), 5)
-            case "shamt":
-                shamt = sign_extend(bin(int(current_token)), 5)
-
-    # Return final binary string
-    # Note: slicing because bin() results in a string starting with "0b"...
-    # also using list comprehension
-    # Can remove space separator between tokens by changing " " to ""
-    return " ".join([x[2:] for x in [opcode, rs, rt, rd, shamt, funct]])
+        # OR the value into the appropriate field
+        if token_type == "shamt":
+            word |= (int(current_token) & REGISTER_MASK) << FIELD_SHIFT_DICT["shamt"]
+        else:
+            word |= dicts.REGISTER_DICT[current_token] << FIELD_SHIFT_DICT[token_type]
+
+    return word
 
 
 def assemble_i_instruction(tokenized_instr_list, instr_format_dict, symbol_table, current_instruction_address):
@@ -226,16 +268,11 @@ def assemble_i_instruction(tokenized_instr_list, instr_format_dict, symbol_table
     :param instr_format_dict: dictionary from instruction_list containing the formatting info for the given instruction
     :param symbol_table: dictionary mapping symbols/labels to their respective addresses
     :param current_instruction_address: memory address of the current instruction being passed in (int)
-    :return: binary string containing the final 32 bit instruction (string) (not prefixed with "0b")
-        The string will be of the form: "000000 00000 00000 0000000000000000"
-        can easily be changed to "00000000000000000000000000000000"
+    :return: the final 32 bit instruction word (int)
+        Use format_instruction_word(...) to render it as "000000 00000 00000 0000000000000000"
     """
-    # Initialize and convert all parameters to binary strings
-    # with the proper length
-    opcode = sign_extend(bin(instr_format_dict.get("opcode")), 6)
-    rs = sign_extend(bin(0), 5)
-    rt = sign_extend(bin(0), 5)
-    imm = sign_extend(bin(0), 16)
+    # Start from the precomputed opcode bits
+    word = INSTRUCTION_PREFIX_DICT[tokenized_instr_list[0]]
     expected_format_list = instr_format_dict.get("format")
 
     # For each expected token
@@ -245,41 +282,22 @@ def assemble_i_instruction(tokenized_instr_list, instr_format_dict, symbol_table
         # (+1 because the tokenized instruction list starts with the mnemonic while the expected format list does not)
         current_token = tokenized_instr_list[i+1]
 
-        # Update the appropriate value
+        # OR the value into the appropriate field
         match token_type:
-            case "rs":
-                rs = sign_extend(bin(dicts.REGISTER_DICT[current_token]), 5)
-            case "rt":
-                rt = sign_extend(bin(dicts.REGISTER_DICT[current_token]), 5)
+            case "rs" | "rt":
+                word |= dicts.REGISTER_DICT[current_token] << FIELD_SHIFT_DICT[token_type]
             case "imm":
-                imm = sign_extend(bin(int(current_token)), 16)
+                # Masking a negative value leaves its 16 bit 2's complement representation
+                word |= int(current_token) & IMM_MASK
             case "imm(rs)":
                 # Separate and isolate the imm and rs portions
-                split_string = current_token.split("(")
-                imm = split_string[0]
-                rs = split_string[1].replace(")", "")
-                # Convert to final values
-                imm = sign_extend(bin(int(imm)), 16)
-                rs = sign_extend(bin(dicts.REGISTER_DICT[rs]), 5)
+                imm, rs = current_token.split("(")
+                rs = rs.replace(")", "")
+                word |= (int(imm) & IMM_MASK) | (dicts.REGISTER_DICT[rs] << FIELD_SHIFT_DICT["rs"])
             case "label":
-                # Get the address the label portion points to from symbol table
-                address = symbol_table[current_token]
-
-                # Compute proper branch address
-                # Note: The immediate value stored for a branch instruction is 2's complement, word aligned, and
-                # used as a PC relative address, and the PC is incremented early, so its really PC+4 (or the next
-                # instruction address.
-                # The stored address is calculated as: x = (TargetAddress - NextAddress)/4
-                # When used, the stored address is multiplied by four and added to the PC+4
-                address = int((address - (current_instruction_address+4))/4)
-                # Convert address to binary string, and extend to proper length
-                imm = sign_extend(bin(address), 16)
-
-    # Return final binary string
-    # Note: slicing because bin() results in a string starting with "0b"...
-    # also using list comprehension
-    # Can remove space separator between tokens by changing " " to ""
-    return " ".join([x[2:] for x in [opcode, rs, rt, imm]])
+                word |= get_branch_offset(symbol_table[current_token], current_instruction_address)
+
+    return word
 
 
 def assemble_j_instruction(tokenized_instr_list, instr_format_dict, symbol_table):
@@ -298,23 +316,57 @@ def assemble_j_instruction(tokenized_instr_list, instr_format_dict, symbol_table
     :param tokenized_instr_list: tokenized instruction list (list)
     :param instr_format_dict: dictionary from instruction_list containing the formatting info for the given instruction
     :param symbol_table: dictionary mapping symbols/labels to their respective addresses
-    :return: binary string containing the final 32 bit instruction (string) (not prefixed with "0b")
-        The string will be of the form: "000000 00000000000000000000000000"
-        can easily be changed to "00000000000000000000000000000000"
+    :return: the final 32 bit instruction word (int)
+        Use format_instruction_word(...) to render it as "000000 00000000000000000000000000"
     """
-    # Get opcode, convert to binary string, and extend to proper length
-    opcode = sign_extend(bin(instr_format_dict.get("opcode")), 6)
-
     # Get the address the label portion points to from symbol table
     address = symbol_table[tokenized_instr_list[1]]
 
-    # Convert address to binary string, and extend to proper length
-    # Note: the address is divided by 4 since MIPS represents it as a word address which later gets right shifted twice
-    address = sign_extend(bin(int(address/4)), 26)
+    return INSTRUCTION_PREFIX_DICT[tokenized_instr_list[0]] | get_jump_address(address)
 
-    # Return final binary string
-    # Note: slicing because bin() results in a string starting with "0b"...
-    # also using list comprehension
-    # Can remove space separator between tokens by changing " " to ""
-    return " ".join([x[2:] for x in [opcode, address]])
 
+def get_branch_offset(target_address, current_instruction_address):
+    """
+    Computes the 16 bit immediate field for a PC relative branch
+
+    Note: The immediate value stored for a branch instruction is 2's complement, word aligned, and
+    used as a PC relative address, and the PC is incremented early, so its really PC+4 (or the next
+    instruction address.
+    The stored address is calculated as: x = (TargetAddress - NextAddress)/4
+    When used, the stored address is multiplied by four and added to the PC+4
+
+    :param target_address: byte address of the branch target (int)
+    :param current_instruction_address: byte address of the branch instruction (int)
+    :return: immediate field in 2's complement (int)
+    """
+    return int((target_address - (current_instruction_address+4))/4) & IMM_MASK
+
+
+def get_jump_address(target_address):
+    """
+    Computes the 26 bit address field for a jump
+    Note: the address is divided by 4 since MIPS represents it as a word address which later gets right shifted twice
+
+    :param target_address: byte address of the jump target (int)
+    :return: address field (int)
+    """
+    return int(target_address/4) & ADDRESS_MASK
+
+
+def format_instruction_word(word):
+    """
+    Renders an assembled instruction word as binary in ascii with a space between each field
+    The field layout (R, I or J) is selected from the opcode
+
+    :param word: 32 bit instruction word (int)
+    :return: binary string (string) (not prefixed with "0b")
+        The string will be of the form: "000000 00000 00000 00000 00000 000000"
+        Can remove space separator between fields by using format(word, "032b") instead
+    """
+    bits = format(word, "032b")
+    opcode = word >> OPCODE_SHIFT
+    if opcode in R_TYPE_OPCODES:
+        return f"{bits[:6]} {bits[6:11]} {bits[11:16]} {bits[16:21]} {bits[21:26]} {bits[26:]}"
+    if opcode in J_TYPE_OPCODES:
+        return f"{bits[:6]} {bits[6:]}"
+    return f"{bits[:6]} {bits[6:11]} {bits[11:16]} {bits[16:]}"
@@ -78,39 +78,44 @@ opcode  address
 instruction_list["j"] = {"type": "J", "opcode": 2, "funct": None, "format": ["label"]}
 instruction_list["jal"] = {"type": "J", "opcode": 3, "funct": None, "format": ["label"]}
 
+# List of all currently supported pseudo instructions
+# Lowered to the instructions above between the first and second pass (see pseudo.py)
+# "reg/imm" operands may be a register or an immediate (decimal or hex), "label/imm" a label or an immediate
+pseudo_instruction_list = {}
+pseudo_instruction_list["abs"] = {"format": ["rd", "rs"]}
+pseudo_instruction_list["b"] = {"format": ["label"]}
+pseudo_instruction_list["beqz"] = {"format": ["rs", "label"]}
+pseudo_instruction_list["bge"] = {"format": ["rs", "reg/imm", "label"]}
+pseudo_instruction_list["bgt"] = {"format": ["rs", "reg/imm", "label"]}
+pseudo_instruction_list["ble"] = {"format": ["rs", "reg/imm", "label"]}
+pseudo_instruction_list["blt"] = {"format": ["rs", "reg/imm", "label"]}
+pseudo_instruction_list["bltz"] = {"format": ["rs", "label"]}
+pseudo_instruction_list["la"] = {"format": ["rt", "label/imm"]}
+pseudo_instruction_list["li"] = {"format": ["rt", "imm"]}
+pseudo_instruction_list["move"] = {"format": ["rd", "rs"]}
+pseudo_instruction_list["neg"] = {"format": ["rd", "rs"]}
+pseudo_instruction_list["negu"] = {"format": ["rd", "rs"]}
+pseudo_instruction_list["not"] = {"format": ["rd", "rs"]}
+pseudo_instruction_list["seq"] = {"format": ["rd", "rs", "rt"]}
+pseudo_instruction_list["sge"] = {"format": ["rd", "rs", "rt"]}
+pseudo_instruction_list["sgt"] = {"format": ["rd", "rs", "rt"]}
+pseudo_instruction_list["sne"] = {"format": ["rd", "rs", "rt"]}
+
 unsupported_instruction_list = [
-    "abs",
-    "b",
-    "beqz",
-    "bge",
-    "bgt",
-    "ble",
-    "blt",
-    "bltz",
     "break",
     "bxs",
-    "la",
     "lh",
-    "li",
     "ll",
     "lld",
-    "move",
     "mulos",
     "muls",
-    "neg",
-    "negu",
     "neqs",
     "NOP",
-    "not",
     "rol",
     "ror",
     "sc",
     "sd",
-    "seq",
-    "sge",
-    "sgt",
     "sllv",
-    "sne",
     "srav",
     "sxs",
     "syscall",
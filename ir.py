@@ -0,0 +1,183 @@
+"""
+Compact struct of arrays representation of the instructions between the passes
+
+The line type list handed from the first to the second pass holds a tuple and a list of token strings for every
+source line.  The IR holds only the instruction lines, as parallel array columns with one entry per instruction:
+    line_numbers - line number in the source (starting with 0 as first line)
+    type_codes - LineType value of the line (LineType(type code) gives the line type back)
+    addresses - byte address of the instruction
+    mnemonic_ids - position of the mnemonic in MNEMONICS (instruction list order)
+    rs, rt, rd - register numbers (0 for fields the instruction doesn't have)
+    values - immediate or shift amount (0 if the instruction has neither)
+    label_ids - position of the referenced label in labels (-1 if the instruction doesn't reference one)
+    labels - list of the labels referenced by the instructions (each label once)
+
+Every instruction is verified while the IR is built (recently seen instruction texts only once), so the columns only
+hold valid instructions and can be encoded (see encode_ir(...), same words as the second pass) or analyzed without
+looking at a token again.  A million instructions of a generated program take roughly 26 MB as columns compared to
+roughly 400 MB as a line type list (see benchmarks/ir_benchmark.py).
+"""
+from custom_types import AssemblerError, ExpandedInstruction
+from instruction_assemblers import FIELD_SHIFT_DICT, REGISTER_MASK, IMM_MASK, INSTRUCTION_PREFIX_DICT, \
+    verify_instruction_tokens, get_branch_offset, get_jump_address
+from collections import OrderedDict
+from array import array
+import output_formats
+import custom_types
+import instructions
+import dicts
+import sys
+
+# Mnemonics in instruction list order (mnemonic ids index into it) and the id of every mnemonic
+MNEMONICS = list(instructions.instruction_list)
+MNEMONIC_ID_DICT = {mnemonic: mnemonic_id for mnemonic_id, mnemonic in enumerate(MNEMONICS)}
+
+# Opcode and funct bits of every mnemonic id (see INSTRUCTION_PREFIX_DICT)
+PREFIXES = [INSTRUCTION_PREFIX_DICT[mnemonic] for mnemonic in MNEMONICS]
+
+# Type ("R", "I", or "J") of every mnemonic id
+MNEMONIC_TYPES = [instructions.instruction_list[mnemonic]["type"] for mnemonic in MNEMONICS]
+
+# Type codes of the columns (addresses and labels are 32 bit unsigned, values 32 bit signed)
+WORD_TYPECODE = output_formats.get_word_array().typecode
+COLUMN_TYPECODE_DICT = {"line_numbers": WORD_TYPECODE, "type_codes": "B", "addresses": WORD_TYPECODE,
+                        "mnemonic_ids": "B", "rs": "B", "rt": "B", "rd": "B", "values": "i", "label_ids": "i"}
+
+# Maximum number of distinct instruction texts whose operands build_ir(...) remembers (least recently used dropped)
+OPERANDS_MEMO_SIZE = 65536
+
+
+def get_empty_ir():
+    """
+    Creates an IR without instructions
+    :return: IR dictionary (see module docstring)
+    """
+    return {**{column: array(typecode) for column, typecode in COLUMN_TYPECODE_DICT.items()}, "labels": []}
+
+
+def get_operands(tokenized_instr_list, instr_format_dict):
+    """
+    Converts the operand tokens of a verified instruction to numbers
+    :param tokenized_instr_list: tokenized instruction list (list)
+    :param instr_format_dict: dictionary from instruction_list containing the formatting info for the instruction
+    :return: Tuple (mnemonic id, rs, rt, rd, value, label or None)
+    """
+    rs = rt = rd = value = 0
+    label = None
+    # (+1 because the tokenized instruction list starts with the mnemonic while the expected format list does not)
+    for token_type, current_token in zip(instr_format_dict["format"], tokenized_instr_list[1:]):
+        if token_type == "rs":
+            rs = dicts.REGISTER_DICT[current_token]
+        elif token_type == "rt":
+            rt = dicts.REGISTER_DICT[current_token]
+        elif token_type == "rd":
+            rd = dicts.REGISTER_DICT[current_token]
+        elif token_type == "imm" or token_type == "shamt":
+            value = int(current_token)
+        elif token_type == "imm(rs)":
+            imm, rs_token = current_token.split("(")
+            # (the offset isn't range checked by the verification, only its 16 bit 2's complement is encoded)
+            value = ((int(imm) + 0x8000) & IMM_MASK) - 0x8000
+            rs = dicts.REGISTER_DICT[rs_token.replace(")", "")]
+        else:
+            label = current_token
+    return MNEMONIC_ID_DICT[tokenized_instr_list[0]], rs, rt, rd, value, label
+
+def build_ir(line_type_list, symbol_table, first_line_number=0):
+    """
+    Verifies every instruction line of the line type list and stores it in the IR
+    :param line_type_list: line type list (or a slice of it) (from the first pass)
+    :param symbol_table: dictionary mapping labels to their byte addresses (from the first pass)
+    :param first_line_number: line number of the first entry when passing a slice (starting with 0 as first line)
+    :return: IR dictionary (see module docstring)
+    :raises InvalidInstructionError if an instruction is invalid (with the line number filled in)
+    """
+    ir = get_empty_ir()
+    labels = ir["labels"]
+    label_id_dict = {}
+    # (bound once, since every instruction appends to every column)
+    column_appends = [ir[column].append for column in ["line_numbers", "type_codes", "addresses", "mnemonic_ids",
+                                                         "rs", "rt", "rd", "values", "label_ids"]]
+    append_line_number, append_type_code, append_address, append_mnemonic_id, append_rs, append_rt, append_rd, \
+        append_value, append_label_id = column_appends
+    instructional_types = custom_types.ALL_INSTRUCTIONAL_TYPES
+
+    # Operands (with the label already turned into its id) of the recently seen instruction texts (repeated ones are
+    # only verified and converted once, expanded instructions using $at aren't remembered since the same tokens are
+    # invalid in a source instruction)
+    operands_memo = OrderedDict()
+    for line_number, (line_type, current_instruction_address, tokenized_instr_list) in \
+            enumerate(line_type_list, first_line_number):
+        if line_type not in instructional_types:
+            continue
+
+        key = tuple(tokenized_instr_list)
+        operands = operands_memo.get(key)
+        if operands is None:
+            try:
+                instr_format_dict = verify_instruction_tokens(tokenized_instr_list, symbol_table)
+            except AssemblerError as error:
+                error.line_number = line_number+1                       # +1 since first line is 0
+                raise
+            mnemonic_id, rs, rt, rd, value, label = get_operands(tokenized_instr_list, instr_format_dict)
+            label_id = -1
+            if label is not None:
+                label_id = label_id_dict.get(label)
+                if label_id is None:
+                    label_id = label_id_dict[label] = len(labels)
+                    labels.append(label)
+            operands = (mnemonic_id, rs, rt, rd, value, label_id)
+            if "$at" not in key or not isinstance(tokenized_instr_list, ExpandedInstruction):
+                operands_memo[key] = operands
+                if len(operands_memo) > OPERANDS_MEMO_SIZE:
+                    operands_memo.popitem(last=False)
+        else:
+            operands_memo.move_to_end(key)
+        mnemonic_id, rs, rt, rd, value, label_id = operands
+
+        append_line_number(line_number)
+        append_type_code(line_type.value)
+        append_address(current_instruction_address)
+        append_mnemonic_id(mnemonic_id)
+        append_rs(rs)
+        append_rt(rt)
+        append_rd(rd)
+        append_value(value)
+        append_label_id(label_id)
+    return ir
+
+
+def encode_ir(ir, symbol_table):
+    """
+    Encodes every instruction of the IR (same words as assembler.encode_instructions(...))
+    :param ir: IR dictionary (see build_ir(...))
+    :param symbol_table: dictionary mapping labels to their byte addresses (from the first pass)
+    :return: assembled instruction words in address order (array)
+    """
+    label_addresses = [symbol_table[label] for label in ir["labels"]]
+    rs_shift, rt_shift, rd_shift, shamt_shift = (FIELD_SHIFT_DICT[field] for field in ["rs", "rt", "rd", "shamt"])
+
+    words = output_formats.get_word_array()
+    for mnemonic_id, rs, rt, rd, value, label_id, current_instruction_address in \
+            zip(ir["mnemonic_ids"], ir["rs"], ir["rt"], ir["rd"], ir["values"], ir["label_ids"], ir["addresses"]):
+        word = PREFIXES[mnemonic_id] | (rs << rs_shift) | (rt << rt_shift) | (rd << rd_shift)
+        mnemonic_type = MNEMONIC_TYPES[mnemonic_id]
+        if mnemonic_type == "R":
+            word |= (value & REGISTER_MASK) << shamt_shift
+        elif mnemonic_type == "J":
+            word |= get_jump_address(label_addresses[label_id])
+        elif label_id >= 0:
+            word |= get_branch_offset(label_addresses[label_id], current_instruction_address)
+        else:
+            word |= value & IMM_MASK
+        words.append(word)
+    return words
+
+
+def get_ir_size(ir):
+    """
+    :param ir: IR dictionary (see build_ir(...))
+    :return: number of bytes taken by the columns and the label list (int)
+    """
+    return sum(sys.getsizeof(ir[column]) for column in COLUMN_TYPECODE_DICT) + sys.getsizeof(ir["labels"]) \
+        + sum(sys.getsizeof(label) for label in ir["labels"])
@@ -0,0 +1,349 @@
+"""
+Separate compilation: relocatable object files and a linker
+
+Every module (assembly file) is assembled on its own as if it started at address 0 and saved as an object file
+holding:
+    words - the encoded instruction words
+    symbols - every label defined in the module (byte offset from the start of the module)
+    exports - labels other modules may reference, named by ".globl label" (or ".global") directives
+    imports - labels the module references without defining them
+    relocations - (word index, relocation type, label) for every word which depends on where the modules end up:
+        "jump" - j and jal (the 26 bit target address is absolute), for local and imported labels
+        "branch" - branches to imported labels (the 16 bit offset is PC relative, so branches to local labels are
+                   already final)
+
+The linker lays the modules out one after the other from the start address (the first module comes first, so its
+first instruction is where execution starts), builds the global symbol table from the exports, and patches the fields
+of the relocated words.  Labels resolve to the module's own definition first, so every module can use its own "loop"
+or "done" labels.
+
+Object files are cached next to their source (module.asm -> module.o) along with the hash of the source, so only
+modules that changed are assembled again (in parallel, see -j) and the link step is all that reruns otherwise.
+
+Usage (from the repository root):
+    python linker.py <output> <module.asm or module.o> [...] [-f format] [-j workers] [--start-address N] [--map]
+    python linker.py -c <module.asm> [...]     (only assemble the object files)
+"""
+from concurrent.futures import ProcessPoolExecutor
+from custom_types import LineType, AssemblerError, LinkError, UndefinedLabelError
+from instruction_assemblers import IMM_MASK, ADDRESS_MASK, get_branch_offset, get_jump_address, get_label_token
+import output_formats
+import data_segment
+import instructions
+import pseudo
+import custom_types
+import incremental
+import assembler
+import argparse
+import pickle
+import dicts
+import sys
+import os
+
+# Bump whenever the object file contents change so outdated object files are assembled again
+OBJECT_VERSION = 3
+
+# Extension of object files (module.asm is assembled to module.o)
+OBJECT_EXTENSION = ".o"
+
+# Range of the word offset of a branch (signed 16 bits)
+MIN_BRANCH_OFFSET = -pow(2, 15)
+MAX_BRANCH_OFFSET = pow(2, 15) - 1
+
+
+def get_global_labels(lines):
+    """
+    Finds the labels named by .globl (or .global) directives
+    :param lines: lines of the module (list)
+    :return: list of labels in the order they appear (list)
+    """
+    global_labels = []
+    for line in lines:
+        match = dicts.REGEX_DICT["global"].match(line)
+        if match is not None:
+            global_labels.extend(label for label in match.group(1).replace(",", " ").split()
+                                 if label not in global_labels)
+    return global_labels
+
+
+def assemble_module(text, name=""):
+    """
+    Assembles the text of a module into a relocatable object
+    :param text: contents of the assembly file (string)
+    :param name: name of the module used in error messages (string)
+    :return: object dictionary (see module docstring), plus version, name, and source_hash
+        (see incremental.get_hash(...))
+    :raises AssemblerError if a line or instruction is invalid, UndefinedLabelError if a .globl directive names a label
+        which isn't defined in the module, LinkError if the module has a data segment
+    """
+    lines = text.splitlines(keepends=True)
+    symbol_table, variable_table, line_type_list = assembler.process_first_pass(lines, start_address=0)
+
+    # Object files only hold instructions, so data would be lost
+    for line_number, (line_type, _, _) in enumerate(line_type_list):
+        if data_segment.is_data_line(line_type, lines[line_number]):
+            raise LinkError("Data segments are not supported in separately compiled modules", line_number+1,
+                            lines[line_number])                                 # +1 since first line is 0
+
+    # la of a label loads its absolute address, which has no relocation type (branch pseudo instructions are fine)
+    for line_number, (line_type, _, tokenized_instr_list) in enumerate(line_type_list):
+        if line_type in custom_types.ALL_PSEUDO_TYPES and tokenized_instr_list[0] == "la" \
+                and len(tokenized_instr_list) == 3 and data_segment.get_number(tokenized_instr_list[2]) is None:
+            raise LinkError("la of a label is not supported in separately compiled modules", line_number+1,
+                            lines[line_number])                                 # +1 since first line is 0
+    symbol_table, line_type_list, line_numbers = pseudo.expand_lines(symbol_table, variable_table, line_type_list, 0)
+
+    exports = {}
+    for label in get_global_labels(lines):
+        if label not in symbol_table:
+            raise UndefinedLabelError(f"Label \"{label}\" exported by a .globl directive is not defined in the "
+                                      f"module", label)
+        exports[label] = symbol_table[label]
+
+    # Labels referenced but not defined are imports, encoded with a placeholder address which the linker replaces
+    imports = []
+    relocations = []
+    instruction_index = 0
+    for line_type, _, tokenized_instr_list in line_type_list:
+        if line_type not in custom_types.ALL_INSTRUCTIONAL_TYPES:
+            continue
+        instr_format_dict = instructions.instruction_list.get(tokenized_instr_list[0])
+        label = None if instr_format_dict is None else get_label_token(tokenized_instr_list, instr_format_dict)
+        if label is not None and len(tokenized_instr_list) == len(instr_format_dict["format"]) + 1:
+            is_import = label not in symbol_table
+            if is_import and label not in imports:
+                imports.append(label)
+            if line_type in [LineType.J_INSTRUCTION, LineType.LABEL_WITH_J_INSTR]:
+                relocations.append((instruction_index, "jump", label))
+            elif is_import:
+                relocations.append((instruction_index, "branch", label))
+        instruction_index += 1
+
+    try:
+        words = assembler.encode_instructions(line_type_list, {**{label: 0 for label in imports}, **symbol_table})
+    except AssemblerError as error:
+        # Only the position in the expanded line type list is known (see assembler.process_file(...))
+        if line_numbers is not None:
+            error.line_number = line_numbers[error.line_number-1]+1
+        raise
+    return {"version": OBJECT_VERSION, "name": name, "source_hash": incremental.get_hash(text), "words": words,
+            "symbols": symbol_table, "exports": exports, "imports": imports, "relocations": relocations}
+
+
+def get_object_filename(assembly_filename):
+    """
+    :return: name of the object file of an assembly file (module.asm -> module.o)
+    """
+    return os.path.splitext(assembly_filename)[0] + OBJECT_EXTENSION
+
+
+def load_object(object_filename):
+    """
+    Loads an object file
+    Note: object files are pickle files, only load object files created by this assembler
+    :param object_filename: object filename (string)
+    :return: object dictionary (see assemble_module(...))
+    :raises OSError if the file can't be read, LinkError if it isn't an object file of this version
+    """
+    try:
+        with open(object_filename, "rb") as object_file:
+            module = pickle.load(object_file)
+    except (pickle.UnpicklingError, EOFError):
+        module = None
+    if not isinstance(module, dict) or module.get("version") != OBJECT_VERSION:
+        raise LinkError(f"\"{object_filename}\" is not an object file of this assembler version (assemble its source "
+                        f"again)")
+    return module
+
+
+def save_object(object_filename, module):
+    """
+    Writes an object file
+    :param object_filename: object filename (string)
+    :param module: object dictionary (see assemble_module(...))
+    :return: None
+    """
+    with open(object_filename, "wb") as object_file:
+        pickle.dump(module, object_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def assemble_object_job(job):
+    """
+    Assembles a single module and saves its object file (runs in a worker process)
+    Errors are returned instead of raised so every failing module is reported
+    :param job: tuple (assembly filename, object filename)
+    :return: error message (string) or None if the module assembled
+    """
+    assembly_filename, object_filename = job
+    try:
+        with open(assembly_filename, "r") as i_file:
+            module = assemble_module(i_file.read(), assembly_filename)
+        save_object(object_filename, module)
+    except (AssemblerError, OSError) as error:
+        return f"{assembly_filename}: {error}"
+    return None
+
+
+def build_objects(input_filenames, workers=None, stats=None):
+    """
+    Brings the object file of every assembly file up to date and loads all the modules
+    An object file is reused if it was built from the same source text, the others are assembled across worker
+    processes.  Object files (.o) given directly are loaded as they are.
+    :param input_filenames: list of assembly (.asm) and object (.o) filenames in link order (list)
+    :param workers: number of worker processes (None or 1 assembles the modules in this process)
+    :param stats: dictionary to count the assembled and reused modules in, None to not count
+    :return: list of object dictionaries in the same order (see assemble_module(...))
+    :raises AssemblerError listing every module which failed to assemble, OSError if a file can't be read
+    """
+    jobs = []
+    object_filenames = []
+    for input_filename in input_filenames:
+        if input_filename.endswith(OBJECT_EXTENSION):
+            object_filenames.append(input_filename)
+            continue
+        object_filename = get_object_filename(input_filename)
+        object_filenames.append(object_filename)
+        with open(input_filename, "r") as i_file:
+            source_hash = incremental.get_hash(i_file.read())
+        try:
+            current = load_object(object_filename)["source_hash"] == source_hash
+        except (OSError, LinkError):
+            current = False
+        if not current:
+            jobs.append((input_filename, object_filename))
+
+    if workers is not None and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            errors = list(executor.map(assemble_object_job, jobs))
+    else:
+        errors = [assemble_object_job(job) for job in jobs]
+    errors = [error for error in errors if error is not None]
+    if errors:
+        raise AssemblerError("\n".join(errors))
+
+    if stats is not None:
+        stats["assembled"] = stats.get("assembled", 0) + len(jobs)
+        stats["reused"] = stats.get("reused", 0) + len(input_filenames) - len(jobs)
+    return [load_object(object_filename) for object_filename in object_filenames]
+
+
+def link_objects(modules, start_address=None):
+    """
+    Lays the modules out one after the other and patches their relocations
+    :param modules: list of object dictionaries in link order (see assemble_module(...))
+    :param start_address: byte address of the first instruction of the first module (defaults to START_ADDRESS)
+    :return: Tuple (linked words in address order (array), global symbol table mapping every exported label to its
+        byte address, list of tuples (module name, byte address of its first word, number of words))
+    :raises LinkError if a label is exported by more than one module or a branch target is out of range,
+        UndefinedLabelError if an imported label isn't exported by any module
+    """
+    address = assembler.START_ADDRESS if start_address is None else start_address
+    bases = []
+    layout = []
+    global_symbol_table = {}
+    exporters = {}
+    for module in modules:
+        bases.append(address)
+        layout.append((module["name"], address, len(module["words"])))
+        for label, offset in module["exports"].items():
+            if label in global_symbol_table:
+                raise LinkError(f"Label \"{label}\" is exported by both {exporters[label]} and {module['name']}")
+            global_symbol_table[label] = address + offset
+            exporters[label] = module["name"]
+        address += 4 * len(module["words"])
+
+    linked_words = output_formats.get_word_array()
+    for module, base in zip(modules, bases):
+        words = output_formats.get_word_array(module["words"])
+        for index, relocation_type, label in module["relocations"]:
+            # Local labels first, so modules don't clash over labels they don't export
+            if label in module["symbols"]:
+                target_address = base + module["symbols"][label]
+            elif label in global_symbol_table:
+                target_address = global_symbol_table[label]
+            else:
+                raise UndefinedLabelError(f"Label \"{label}\" imported by {module['name']} is not exported by any "
+                                          f"module", label)
+
+            current_instruction_address = base + 4 * index
+            if relocation_type == "jump":
+                words[index] = (words[index] & ~ADDRESS_MASK) | get_jump_address(target_address)
+            else:
+                offset = (target_address - (current_instruction_address + 4)) >> 2
+                if offset < MIN_BRANCH_OFFSET or offset > MAX_BRANCH_OFFSET:
+                    raise LinkError(f"Branch from {module['name']} to \"{label}\" is out of range "
+                                    f"({current_instruction_address:#010x} -> {target_address:#010x})")
+                words[index] = (words[index] & ~IMM_MASK) | get_branch_offset(target_address,
+                                                                              current_instruction_address)
+        linked_words.extend(words)
+    return linked_words, global_symbol_table, layout
+
+
+def link_files(input_filenames, assembled_filename, output_format="text", start_address=None, workers=None):
+    """
+    Assembles the modules which changed, links every module, and writes the linked program
+    :param input_filenames: list of assembly (.asm) and object (.o) filenames in link order (list)
+    :param assembled_filename: output filename
+    :param output_format: name of the output format (see OUTPUT_FORMAT_DICT in output_formats.py)
+    :param start_address: byte address of the first instruction (defaults to START_ADDRESS)
+    :param workers: number of worker processes to assemble the modules with (see build_objects(...))
+    :return: dictionary with the assembled and reused module counts, the global symbol table (symbols), and the
+        layout of the modules (see link_objects(...))
+    :raises AssemblerError if a module is invalid or the modules can't be linked
+    """
+    stats = {"assembled": 0, "reused": 0}
+    modules = build_objects(input_filenames, workers, stats)
+    words, global_symbol_table, layout = link_objects(modules, start_address)
+    with open(assembled_filename, output_formats.get_output_mode(output_format)) as o_file:
+        output_formats.write_words(o_file, words, output_format,
+                                   assembler.START_ADDRESS if start_address is None else start_address)
+    return {**stats, "symbols": global_symbol_table, "layout": layout}
+
+
+def format_link_map(link_result):
+    """
+    Renders the layout of the modules and the global symbol table
+    :param link_result: dictionary returned by link_files(...)
+    :return: link map (string)
+    """
+    lines = ["Modules:"]
+    for name, address, count in link_result["layout"]:
+        lines.append(f"  {address:#010x}{count:>10,} words  {name}")
+    lines.append("Exported labels:")
+    for label, address in sorted(link_result["symbols"].items(), key=lambda item: item[1]):
+        lines.append(f"  {address:#010x}  {label}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Assemble MIPS modules separately and link them")
+    parser.add_argument("files", nargs="+",
+                        help="output file followed by the modules (.asm or .o) in link order (only the modules "
+                             "with -c)")
+    parser.add_argument("-c", "--compile-only", action="store_true",
+                        help="only assemble the object files, don't link")
+    parser.add_argument("-f", "--format", default="text", choices=output_formats.OUTPUT_FORMAT_DICT,
+                        help="output format (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes to assemble the modules with (default: 1)")
+    parser.add_argument("--start-address", type=lambda value: int(value, 0), default=None,
+                        help="byte address of the first instruction (default: 7996)")
+    parser.add_argument("--map", action="store_true", help="print the module layout and exported labels")
+    args = parser.parse_args()
+
+    try:
+        if args.compile_only:
+            build_stats = {}
+            build_objects(args.files, args.workers, build_stats)
+            print(f"{build_stats['assembled']} modules assembled, {build_stats['reused']} up to date")
+        else:
+            if len(args.files) < 2:
+                parser.error("expected an output file and at least one module")
+            result = link_files(args.files[1:], args.files[0], args.format, args.start_address, args.workers)
+            print(f"{result['assembled']} modules assembled, {result['reused']} up to date, "
+                  f"{sum(count for _, _, count in result['layout']):,} words linked")
+            if args.map:
+                print(format_link_map(result))
+    except (AssemblerError, OSError) as error:
+        print(error)
+        sys.exit(1)
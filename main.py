@@ -1,12 +1,19 @@
 import assembler
+import cli
+import sys
 
 if __name__ == '__main__':
-    # input_filename = input(
-    #     "Please enter the full filepath and name including file extension to the MIPS file assembly you would like to assemble: ")
-    input_filename = "Assembly Files/test.asm"
-    # output_file = input(
-    #     "Please enter the full filepath and name (excluding file extension) for the assembled file output: ")
-    output_filename = "Assembled Files/assembled.txt"
+    # Input and output filenames default to "Assembly Files/test.asm" and "Assembled Files/assembled.txt"
+    # Run with --help for the other options
+    args = cli.get_argument_parser().parse_args()
 
     # Assemble File
-    assembler.assemble(input_filename, output_filename)
+    profile = cli.get_profile(args.profile, args.profile_memory)
+    schedule = cli.get_schedule(args.schedule)
+    optimize = cli.get_optimize_report(args.optimize)
+    success = assembler.assemble(args.input, args.output, args.single_pass, args.format, args.workers,
+                                 start_address=args.start_address, profile=profile, schedule=schedule,
+                                 optimize=optimize, data_filename=args.data_output)
+    for message in cli.get_report_messages(success, profile, optimize, schedule):
+        print(message)
+    sys.exit(cli.get_exit_code(success))
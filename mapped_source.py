@@ -0,0 +1,152 @@
+"""
+Memory mapped, zero copy access to the lines of an assembly file
+
+The file is mapped read only and the offset of every line is recorded in a compact array with one scan, so any line can
+be looked up by number in O(1) (i.e. to show the offending line of an error found in the second pass) without keeping
+a second copy of the file.  Lines are classified by matching dicts.LINE_BYTES_REGEX on the mapped bytes in place; only
+the label, the mnemonic, and the operands of instructions are copied out and decoded.
+
+Lines end with "\n" (a "\r" before it is treated as trailing whitespace like any other).
+"""
+from custom_types import LineType
+from array import array
+import profiler
+import helpers
+import codecs
+import mmap
+import dicts
+import io
+import os
+
+# Encodings whose bytes can be matched with dicts.LINE_BYTES_REGEX (ASCII characters are single bytes)
+ASCII_COMPATIBLE_ENCODINGS = {"utf-8", "ascii", "latin-1", "iso8859-1", "cp1252"}
+
+# Line types of the lines which carry no further information, by the name of the group of LINE_BYTES_REGEX they match
+_SIMPLE_LINE_TYPE_DICT = {"blank": LineType.BLANK, "comment": LineType.COMMENT, "directive": LineType.ASSM_DIRECTIVE}
+
+# Same as helpers._MNEMONIC_LINE_TYPE_DICT, keyed by the encoded mnemonic so it is never decoded on its own
+_BYTES_MNEMONIC_LINE_TYPE_DICT = {mnemonic.encode(): line_types
+                                  for mnemonic, line_types in helpers._MNEMONIC_LINE_TYPE_DICT.items()}
+
+
+def get_line_offsets(data):
+    """
+    Finds where every line starts with one scan
+    :param data: contents of the file (bytes or mmap)
+    :return: array of byte offsets with one entry per line plus one for the end of the file (array of unsigned long
+        longs), so line n spans offsets[n] to offsets[n+1]
+    """
+    line_offsets = array("Q", [0])
+    position = data.find(b"\n")
+    while position != -1:
+        line_offsets.append(position + 1)
+        position = data.find(b"\n", position + 1)
+    # Last line without a newline
+    if line_offsets[-1] != len(data):
+        line_offsets.append(len(data))
+    return line_offsets
+
+
+class MappedSource:
+    """
+    Read only memory map of an assembly file with the offset of every line (use in a with statement)
+    data - contents of the file (mmap, or b"" for an empty file since empty files can't be mapped)
+    line_offsets - array of line offsets (see get_line_offsets(...))
+    encoding - encoding of the file (string)
+    """
+    def __init__(self, i_file, encoding="utf-8"):
+        if os.fstat(i_file.fileno()).st_size:
+            self.data = mmap.mmap(i_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.data = b""
+        self.line_offsets = get_line_offsets(self.data)
+        self.encoding = encoding
+
+    def __len__(self):
+        return len(self.line_offsets) - 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def get_line(self, line_number):
+        """
+        :param line_number: line number starting with 0 as first line (int)
+        :return: text of the line (string)
+        """
+        return self.data[self.line_offsets[line_number]:self.line_offsets[line_number + 1]].decode(self.encoding,
+                                                                                                   "replace")
+
+    def scan_lines(self, clock=None):
+        """
+        Generator classifying (same as helpers.classify_line(...)) and tokenizing (same as
+        instruction_assemblers.tokenize_classified_line(...)) every line, matching the mapped bytes in place
+        The mnemonic and operands of an instruction are decoded with a single slice, other lines aren't decoded at all
+        (except for their label).
+        :param clock: lap clock splitting the time into the classify and tokenize phases (see
+            profiler.get_lap_clock(...)), None to not profile
+        :return: yields tuples (line number, LineType, label or None, tokenized instruction list or None)
+        """
+        data = self.data
+        encoding = self.encoding
+        match_line = dicts.LINE_BYTES_REGEX.match
+        line_offsets = self.line_offsets
+        for line_number, (start, end) in enumerate(zip(line_offsets, line_offsets[1:])):
+            label = None
+            match = match_line(data, start, end)
+            kind = None if match is None else match.lastgroup
+            if kind is None:
+                line_type = LineType.INVALID
+            elif kind in _SIMPLE_LINE_TYPE_DICT:
+                line_type = _SIMPLE_LINE_TYPE_DICT[kind]
+            elif kind == "label_only":
+                line_type, label = LineType.LABEL_ONLY, match.group("lone_label").decode(encoding)
+            elif kind == "variable":
+                line_type, label = LineType.VARIABLE, match.group("variable_name").decode(encoding)
+            else:
+                # Otherwise it is an instruction (possibly preceded by a label)
+                with_label = kind == "label_and_instr"
+                mnemonic_group = "label_mnemonic" if with_label else "mnemonic"
+                line_types = _BYTES_MNEMONIC_LINE_TYPE_DICT.get(match.group(mnemonic_group))
+                if line_types is None:
+                    line_type = LineType.INVALID_INSTRUCTION
+                else:
+                    line_type = line_types[with_label]
+                    if clock is not None:
+                        profiler.lap_classified(clock, line_number, line_type)
+
+                    # Mnemonic and operands run until a trailing comment or the end of the line
+                    operand_end = data.find(b"#", match.end(mnemonic_group), end)
+                    tokens = data[match.start(mnemonic_group):end if operand_end == -1 else operand_end]
+                    label = match.group("label").decode(encoding) if with_label else None
+                    tokenized_instr_list = tokens.decode(encoding).replace(",", "").split()
+                    if clock is not None:
+                        profiler.lap(clock, "tokenize", line_number)
+                    yield line_number, line_type, label, tokenized_instr_list
+                    continue
+
+            if clock is not None:
+                profiler.lap_classified(clock, line_number, line_type)
+            yield line_number, line_type, label, None
+
+
+def open_mapped_source(i_file):
+    """
+    Maps an opened assembly file
+    :param i_file: assembly language input file handle (or any other iterable of lines)
+    :return: MappedSource, or None if the input can't be mapped (not a regular file, i.e. a StringIO or list of lines,
+        or an encoding which isn't ASCII compatible)
+    """
+    try:
+        encoding = codecs.lookup(getattr(i_file, "encoding", None) or "utf-8").name
+        if encoding not in ASCII_COMPATIBLE_ENCODINGS:
+            return None
+        return MappedSource(i_file, encoding)
+    except (AttributeError, io.UnsupportedOperation, OSError, ValueError, LookupError):
+        return None
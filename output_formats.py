@@ -0,0 +1,144 @@
+from array import array
+from instruction_assemblers import format_instruction_word
+import sys
+
+
+def get_word_array(words=()):
+    """
+    Creates a compact array of unsigned 32 bit words
+    :param words: iterable of instruction words (int)
+    :return: array of words (array)
+    """
+    # "I" is 4 bytes on all common platforms, fall back to "L" otherwise
+    return array("I" if array("I").itemsize == 4 else "L", words)
+
+
+def render_text(words):
+    """
+    Binary represented in ascii with a space between each field, one instruction per line (the original format)
+    i.e. "000000 10010 01000 01000 00000 100000"
+    """
+    return "".join([format_instruction_word(word) + "\n" for word in words])
+
+
+def render_plain_text(words):
+    """
+    Binary represented in ascii, 32 bits per line without field spaces (used for data words, which have no fields)
+    i.e. "00000000000000000000000000000011"
+    """
+    return "".join([f"{word:032b}\n" for word in words])
+
+
+def render_hex(words):
+    """
+    8 hex digits per line, as read by Verilog's $readmemh (and Logisim once the header is added)
+    i.e. "02484020"
+    """
+    return "".join([f"{word:08x}\n" for word in words])
+
+
+def render_big_endian(words):
+    """
+    Raw machine code, 4 bytes per instruction, most significant byte first (MIPS default)
+    """
+    word_array = get_word_array(words)
+    if sys.byteorder != "big":
+        word_array.byteswap()
+    return word_array.tobytes()
+
+
+def render_little_endian(words):
+    """
+    Raw machine code, 4 bytes per instruction, least significant byte first
+    """
+    word_array = get_word_array(words)
+    if sys.byteorder != "little":
+        word_array.byteswap()
+    return word_array.tobytes()
+
+
+def render_intel_hex(words, start_address):
+    """
+    Intel HEX records (16 data bytes per record, big endian words) placed at the start address
+    Extended linear address records are emitted whenever the upper 16 bits of the address change
+    :param words: iterable of instruction words (int)
+    :param start_address: byte address of the first word (int)
+    :return: text of the Intel HEX file (string)
+    """
+    def record(record_type, address, data):
+        body = bytes([len(data), (address >> 8) & 0xFF, address & 0xFF, record_type]) + data
+        checksum = -sum(body) & 0xFF
+        return f":{body.hex().upper()}{checksum:02X}\n"
+
+    data = render_big_endian(words)
+    records = []
+    upper_address = None
+    offset = 0
+    while offset < len(data):
+        address = start_address + offset
+        # Split records at 64 KiB boundaries so the extended linear address stays valid for the whole record
+        length = min(16, len(data) - offset, 0x10000 - (address & 0xFFFF))
+        if address >> 16 != upper_address:
+            upper_address = address >> 16
+            records.append(record(0x04, 0, upper_address.to_bytes(2, "big")))
+        records.append(record(0x00, address & 0xFFFF, data[offset:offset+length]))
+        offset += length
+    records.append(record(0x01, 0, b""))
+    return "".join(records)
+
+
+# Dictionary of all supported output formats
+# binary - the output file must be opened in binary mode
+# extension - default file extension for files in this format
+# header - written before the first instruction
+# render - function rendering a sequence of words.  Every word is rendered to a record that doesn't depend on its
+#          neighbors, so a slice of words can be rendered on its own (used by the single pass mode to write chunks and
+#          patch placeholders in place).  None if the format has to be rendered as a whole (see write_words(...))
+OUTPUT_FORMAT_DICT = {
+    "text": {"binary": False, "extension": ".txt", "header": "", "render": render_text},
+    "bin": {"binary": True, "extension": ".bin", "header": b"", "render": render_big_endian},
+    "bin_le": {"binary": True, "extension": ".bin", "header": b"", "render": render_little_endian},
+    "ihex": {"binary": False, "extension": ".hex", "header": "", "render": None},
+    "readmemh": {"binary": False, "extension": ".mem", "header": "", "render": render_hex},
+    "logisim": {"binary": False, "extension": ".img", "header": "v2.0 raw\n", "render": render_hex},
+}
+
+
+def get_output_format_dict(output_format):
+    """
+    Looks up an output format in the OUTPUT_FORMAT_DICT
+    :param output_format: name of the output format (string)
+    :return: output format dict (dict)
+    :raises ValueError if the output format is not supported
+    """
+    try:
+        return OUTPUT_FORMAT_DICT[output_format]
+    except KeyError:
+        raise ValueError(f"Output format \"{output_format}\" is not supported "
+                         f"(supported formats: {', '.join(OUTPUT_FORMAT_DICT)})")
+
+
+def get_output_mode(output_format):
+    """
+    Determines the mode the output file should be opened with for the given output format
+    (unknown formats fall back to text mode, the error is reported once assembly starts)
+    :param output_format: name of the output format (string)
+    :return: "wb" or "w" (string)
+    """
+    return "wb" if OUTPUT_FORMAT_DICT.get(output_format, {}).get("binary") else "w"
+
+
+def write_words(o_file, words, output_format="text", start_address=0):
+    """
+    Renders all the words in the selected output format and writes them to the output file with one write
+    :param o_file: output file handle (opened in binary mode if the output format is binary)
+    :param words: sequence of instruction words in address order (array or list)
+    :param output_format: name of the output format (see OUTPUT_FORMAT_DICT)
+    :param start_address: byte address of the first word (int) (only used by formats that contain addresses)
+    :return: None
+    """
+    output_format_dict = get_output_format_dict(output_format)
+    if output_format_dict["render"] is None:
+        o_file.write(render_intel_hex(words, start_address))
+    else:
+        o_file.write(output_format_dict["header"] + output_format_dict["render"](words))
@@ -0,0 +1,258 @@
+"""
+Peephole optimizer working on the tokenized instructions of the first pass
+
+Runs between the first pass (which tokenized every instruction and built the symbol table) and the second pass
+(which verifies and encodes the tokens).  The operands of each instruction are matched up with the "format" list of
+its instruction_list entry, and these patterns are rewritten or removed:
+    no-op moves - an instruction copying a register to itself (addi $x, $x, 0, or $x, $x, $zero, sll $x, $x, 0, ...)
+    redundant moves - a move right after the same move, or right after the opposite move (or $a, $b, $zero followed
+                      by or $b, $a, $zero)
+    jumps to the next instruction - j, beq, bne, bgtz, and blez whose target is the following instruction (there are
+                                    no delay slots, so falling through does the same)
+    back to back shifts - sll $a, $b, n followed by sll $a, $a, m becomes sll $a, $b, n+m (same for srl and sra)
+Patterns spanning two instructions are only rewritten if no label points at the second one.  The passes repeat until
+nothing changes (a removal can create new opportunities, i.e. a jump over a removed no-op), then every instruction
+address and label is recomputed: a label pointing at a removed instruction moves to the instruction after it.
+
+Lines of removed instructions are kept in the line type list (as comments, or label only lines if they had a label),
+so line numbers in error messages still match the source.
+"""
+from custom_types import LineType
+import custom_types
+import instructions
+import dicts
+
+# Instructions which copy a register when one operand is $zero (add, addu, or, xor either way around)
+ZERO_OPERAND_MOVE_MNEMONICS = {"add", "addu", "or", "xor", "sub", "subu"}
+COMMUTATIVE_MNEMONICS = {"add", "addu", "or", "xor"}
+
+# Instructions which copy a register when both sources are the same register
+SAME_OPERAND_MOVE_MNEMONICS = {"and", "or"}
+
+# Instructions which copy a register when the immediate or shift amount is 0
+ZERO_IMMEDIATE_MOVE_MNEMONICS = {"addi", "addiu", "ori", "xori"}
+SHIFT_MNEMONICS = {"sll", "srl", "sra"}
+
+# Branches and jumps without side effects (jal and jalr link, so they are never removed)
+REMOVABLE_TRANSFER_MNEMONICS = {"j", "beq", "bne", "bgtz", "blez"}
+
+# Names of the rules in the report
+RULES = ["no_op_moves", "redundant_moves", "jumps_to_next", "merged_shifts"]
+
+
+def get_operands(tokenized_instr_list):
+    """
+    Matches the operands of an instruction up with the format list of its instruction_list entry
+    :param tokenized_instr_list: tokenized instruction list (list)
+    :return: dictionary mapping format fields ("rd", "rs", "imm", ...) to operand tokens, None if the instruction
+        doesn't match its format (it is left alone so the second pass reports it)
+    """
+    instr_format_dict = instructions.instruction_list.get(tokenized_instr_list[0])
+    if instr_format_dict is None or len(tokenized_instr_list) != len(instr_format_dict["format"]) + 1:
+        return None
+    return dict(zip(instr_format_dict["format"], tokenized_instr_list[1:]))
+
+
+def get_number(token):
+    """
+    :return: value of an immediate or shift amount token (int) or None if it isn't numeric
+    """
+    try:
+        return int(token)
+    except ValueError:
+        return None
+
+
+def get_move(tokenized_instr_list):
+    """
+    Determines whether an instruction only copies one register to another
+    :param tokenized_instr_list: tokenized instruction list (list)
+    :return: Tuple (destination register number, source register number) or None if it isn't a move
+    """
+    mnemonic = tokenized_instr_list[0]
+    operands = get_operands(tokenized_instr_list)
+    if operands is None:
+        return None
+    registers = {field: dicts.REGISTER_DICT.get(token) for field, token in operands.items()
+                 if field in ["rd", "rs", "rt"]}
+    if None in registers.values():
+        return None
+
+    if mnemonic in ZERO_OPERAND_MOVE_MNEMONICS:
+        if registers["rt"] == 0:
+            return registers["rd"], registers["rs"]
+        if mnemonic in COMMUTATIVE_MNEMONICS and registers["rs"] == 0:
+            return registers["rd"], registers["rt"]
+    if mnemonic in SAME_OPERAND_MOVE_MNEMONICS and registers["rs"] == registers["rt"]:
+        return registers["rd"], registers["rs"]
+    if mnemonic in SHIFT_MNEMONICS and get_number(operands["shamt"]) == 0:
+        return registers["rd"], registers["rt"]
+    if mnemonic in ZERO_IMMEDIATE_MOVE_MNEMONICS and get_number(operands["imm"]) == 0:
+        return registers["rt"], registers["rs"]
+    return None
+
+
+def get_transfer_label(tokenized_instr_list):
+    """
+    Determines the target label of a branch or jump which can be removed if it targets the next instruction
+    :param tokenized_instr_list: tokenized instruction list (list)
+    :return: target label token, or None if it isn't a removable branch or jump or it doesn't match its format (it is
+        left alone so the second pass reports it)
+    """
+    if tokenized_instr_list[0] not in REMOVABLE_TRANSFER_MNEMONICS:
+        return None
+    operands = get_operands(tokenized_instr_list)
+    if operands is None or any(operands[field] not in dicts.REGISTER_DICT for field in ["rs", "rt"]
+                               if field in operands):
+        return None
+    return operands["label"]
+
+
+def get_merged_shift(first_tokens, second_tokens):
+    """
+    Merges two back to back shifts of the same kind where the second one shifts the result of the first in place
+    (sll $a, $b, n followed by sll $a, $a, m)
+    :return: tokenized instruction list of the single equivalent shift, or None if they can't be merged
+    """
+    mnemonic = first_tokens[0]
+    if mnemonic not in SHIFT_MNEMONICS or second_tokens[0] != mnemonic:
+        return None
+    first, second = get_operands(first_tokens), get_operands(second_tokens)
+    if first is None or second is None:
+        return None
+    destination = dicts.REGISTER_DICT.get(first["rd"])
+    if destination is None or dicts.REGISTER_DICT.get(second["rd"]) != destination \
+            or dicts.REGISTER_DICT.get(second["rt"]) != destination:
+        return None
+    first_shamt, second_shamt = get_number(first["shamt"]), get_number(second["shamt"])
+    if first_shamt is None or second_shamt is None or first_shamt < 0 or second_shamt < 0:
+        return None
+
+    # Shifting an arithmetic shift further only copies more sign bits, logical shifts of 32 or more would need a
+    # different instruction to produce 0
+    shamt = first_shamt + second_shamt
+    if mnemonic == "sra":
+        shamt = min(shamt, 31)
+    elif shamt > 31:
+        return None
+    return [mnemonic, first_tokens[1], first_tokens[2], str(shamt)]
+
+
+def optimize_round(instruction_tokens, label_indexes, leaders, rule_counts):
+    """
+    Makes one pass over the instructions applying every rule
+    :param instruction_tokens: tokenized instruction lists in address order (list, rewritten instructions are replaced)
+    :param label_indexes: dictionary mapping labels to the index of the instruction they point at
+    :param leaders: set of instruction indexes labels point at
+    :param rule_counts: dictionary counting how often each rule was applied (see RULES) (updated)
+    :return: set of indexes of the instructions to remove
+    """
+    removed = set()
+    count = len(instruction_tokens)
+    for index in range(count):
+        if index in removed:
+            continue
+        tokens = instruction_tokens[index]
+
+        move = get_move(tokens)
+        if move is not None and move[0] == move[1]:
+            removed.add(index)
+            rule_counts["no_op_moves"] += 1
+            continue
+
+        transfer_label = get_transfer_label(tokens)
+        if transfer_label is not None and label_indexes.get(transfer_label) == index + 1:
+            removed.add(index)
+            rule_counts["jumps_to_next"] += 1
+            continue
+
+        # Rules combining this instruction with the next one (which nothing may jump to)
+        next_index = index + 1
+        if next_index >= count or next_index in leaders:
+            continue
+        next_tokens = instruction_tokens[next_index]
+
+        # (a move to $zero has no effect, so the opposite move after it isn't redundant)
+        next_move = get_move(next_tokens)
+        if move is not None and move[0] != 0 and next_move is not None \
+                and (next_move == move or next_move == move[::-1]):
+            removed.add(next_index)
+            rule_counts["redundant_moves"] += 1
+            continue
+
+        merged_shift = get_merged_shift(tokens, next_tokens)
+        if merged_shift is not None:
+            instruction_tokens[index] = merged_shift
+            removed.add(next_index)
+            rule_counts["merged_shifts"] += 1
+    return removed
+
+
+def optimize_lines(symbol_table, line_type_list, start_address, report=None):
+    """
+    Applies the peephole rules to the output of the first pass until nothing changes
+    :param symbol_table: dictionary mapping labels to their byte addresses (from the first pass)
+    :param line_type_list: line type list (from the first pass)
+    :param start_address: byte address of the first instruction (int)
+    :param report: dictionary to fill out, None to not report
+        instructions_before, instructions_after - number of instructions before and after optimizing
+        rules - dictionary mapping each rule (see RULES) to the number of times it was applied
+    :return: Tuple (symbol table, line type list) with the instructions removed or rewritten and the addresses and
+        labels recomputed (the arguments are left unchanged)
+    """
+    instruction_lines = [line_number for line_number, (line_type, _, _) in enumerate(line_type_list)
+                         if line_type in custom_types.ALL_INSTRUCTIONAL_TYPES]
+    instruction_tokens = [line_type_list[line_number][2] for line_number in instruction_lines]
+    label_indexes = {label: (address - start_address) >> 2 for label, address in symbol_table.items()}
+    rule_counts = {rule: 0 for rule in RULES}
+
+    while True:
+        removed = optimize_round(instruction_tokens, label_indexes, set(label_indexes.values()), rule_counts)
+        if not removed:
+            break
+
+        # Labels move down by the number of removed instructions in front of them
+        # (a label pointing at a removed instruction ends up at the instruction following it)
+        new_indexes = []
+        kept = 0
+        for index in range(len(instruction_tokens) + 1):
+            new_indexes.append(kept)
+            if index not in removed:
+                kept += 1
+        label_indexes = {label: new_indexes[index] for label, index in label_indexes.items()}
+        instruction_lines = [line_number for index, line_number in enumerate(instruction_lines)
+                             if index not in removed]
+        instruction_tokens = [tokens for index, tokens in enumerate(instruction_tokens) if index not in removed]
+
+    # Rebuild the line type list with the new addresses (removed lines become comments or label only lines)
+    optimized_line_type_list = []
+    kept_lines = dict(zip(instruction_lines, range(len(instruction_lines))))
+    for line_number, (line_type, _, tokens) in enumerate(line_type_list):
+        index = kept_lines.get(line_number)
+        if index is not None:
+            optimized_line_type_list.append((line_type, start_address + 4 * index, instruction_tokens[index]))
+        elif line_type in custom_types.ALL_INSTRUCTIONAL_TYPES:
+            optimized_line_type_list.append((LineType.LABEL_ONLY if line_type in custom_types.ALL_LABEL_TYPES
+                                             else LineType.COMMENT, None, None))
+        else:
+            optimized_line_type_list.append((line_type, None, tokens))
+    optimized_symbol_table = {label: start_address + 4 * index for label, index in label_indexes.items()}
+
+    if report is not None:
+        report.update(instructions_before=sum(line_type in custom_types.ALL_INSTRUCTIONAL_TYPES
+                                              for line_type, _, _ in line_type_list),
+                      instructions_after=len(instruction_tokens), rules=rule_counts)
+    return optimized_symbol_table, optimized_line_type_list
+
+
+def format_optimize_report(report):
+    """
+    Renders the optimizer report as a human readable summary
+    :param report: dictionary filled out by optimize_lines(...)
+    :return: report (string)
+    """
+    before, after = report["instructions_before"], report["instructions_after"]
+    reduction = (before - after) / before if before else 0.0
+    applied = ", ".join(f"{rule.replace('_', ' ')} {count:,}" for rule, count in report["rules"].items() if count)
+    return (f"Peephole: {before:,} -> {after:,} instructions ({before - after:,} removed, {reduction:.1%})"
+            + (f"\n  {applied}" if applied else ""))
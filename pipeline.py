@@ -0,0 +1,349 @@
+"""
+Cycle level timing model of a classic 5 stage MIPS pipeline (IF, ID, EX, MEM, WB)
+
+The program is run in the simulator once to record the executed instruction trace (see simulator.run_trace(...)),
+then the trace is replayed through the timing model, which tracks when every register value becomes available:
+    ALU results can be forwarded from the end of EX, loaded values from the end of MEM, so an instruction using a
+    value loaded by the instruction right before it waits one cycle (a load-use stall)
+    multiplies and divides take several cycles in their own unit before their results can be used (see
+    LATENCY_DICT)
+    store data is only needed in MEM, so a store of a just loaded value doesn't stall
+    without forwarding a value can only be read in ID once the producer wrote it back in WB
+    branches are predicted not taken, conditional branches, jr, and jalr are resolved in EX (BRANCH_PENALTY cycles
+    lost when control doesn't continue with the next instruction) and j and jal in ID (JUMP_PENALTY cycles)
+    HI and LO are tracked like registers (mult/div write them, mfhi/mflo read them), and jal/jalr write $ra
+There are no branch delay slots (matching the simulator), and memory always answers in one cycle.
+
+The registers each instruction reads and writes come from the "format" lists of instructions.instruction_list.
+
+Usage (from the repository root):
+    python pipeline.py "Assembly Files/test.asm" [--no-forwarding] [--annotate]
+"""
+from custom_types import SimulationError, AssemblerError
+import instructions
+import simulator
+import argparse
+import sys
+import api
+from array import array
+
+# Cycles lost when a branch resolved in EX (beq, bne, bgtz, blez, jr, jalr) transfers control
+BRANCH_PENALTY = 2
+
+# Cycles lost when a jump resolved in ID (j, jal) transfers control
+JUMP_PENALTY = 1
+
+# Stages between an instruction entering EX and the end of the pipeline (EX, MEM, WB)
+# plus the stages in front of EX (IF, ID)
+STAGES_FROM_EX = 3
+STAGES_BEFORE_EX = 2
+
+# Cycles from an instruction entering EX until its result can be used by an instruction entering EX
+# (ALU results are forwarded to the very next instruction, loads need MEM as well, multiplies and divides run in
+# their own multi-cycle unit)
+ALU_LATENCY = 1
+LOAD_LATENCY = 2
+MULTIPLY_LATENCY = 4
+DIVIDE_LATENCY = 12
+
+# Default limit on the number of executed instructions (the trace takes 4 bytes per instruction)
+DEFAULT_MAX_TRACE_STEPS = 10000000
+
+# Number of lines listed in the report as the ones stalling most
+STALLING_LINE_COUNT = 10
+
+# Loads and stores by opcode (loads 32-39, stores 40-47)
+LOAD_MNEMONICS = {mnemonic for mnemonic, fmt in instructions.instruction_list.items()
+                  if fmt["type"] == "I" and 32 <= fmt["opcode"] < 40}
+STORE_MNEMONICS = {mnemonic for mnemonic, fmt in instructions.instruction_list.items()
+                   if fmt["type"] == "I" and 40 <= fmt["opcode"] < 48}
+
+# Result latencies of the instructions which don't use ALU_LATENCY
+LATENCY_DICT = {**{mnemonic: LOAD_LATENCY for mnemonic in LOAD_MNEMONICS},
+                "mul": MULTIPLY_LATENCY, "mult": MULTIPLY_LATENCY, "multu": MULTIPLY_LATENCY,
+                "div": DIVIDE_LATENCY, "divu": DIVIDE_LATENCY}
+
+# Control transfer penalties (instructions missing here never change the flow of control)
+CONTROL_PENALTY_DICT = {"beq": BRANCH_PENALTY, "bne": BRANCH_PENALTY, "bgtz": BRANCH_PENALTY, "blez": BRANCH_PENALTY,
+                        "jr": BRANCH_PENALTY, "jalr": BRANCH_PENALTY, "j": JUMP_PENALTY, "jal": JUMP_PENALTY}
+
+# Registers read and written which don't appear in the format lists
+# (tuples of register numbers, HI and LO use the simulator's register slots)
+IMPLICIT_REGISTER_DICT = {
+    "mult": ((), (simulator.HI, simulator.LO)),
+    "multu": ((), (simulator.HI, simulator.LO)),
+    "mul": ((), (simulator.HI, simulator.LO)),
+    "div": ((), (simulator.HI, simulator.LO)),
+    "divu": ((), (simulator.HI, simulator.LO)),
+    "mfhi": ((simulator.HI,), ()),
+    "mflo": ((simulator.LO,), ()),
+    "mthi": ((), (simulator.HI,)),
+    "mtlo": ((), (simulator.LO,)),
+    "jal": ((), (31,)),
+    "jalr": ((), (31,)),
+}
+
+
+def get_register_fields(mnemonic):
+    """
+    Determines which register fields an instruction reads and writes from its format list
+    rd is always written, rs always read (also as the base of imm(rs)), and rt is written if it comes first
+    (addi rt, rs, imm, lw rt, imm(rs), ...) except for stores, otherwise it is read (beq rs, rt, label, add rd, rs, rt)
+    :param mnemonic: instruction mnemonic (string)
+    :return: Tuple (fields read, fields written) (tuples of "rs", "rt", and "rd")
+    """
+    instr_format = instructions.instruction_list[mnemonic]["format"]
+    read_fields, written_fields = [], []
+    for position, field in enumerate(instr_format):
+        if field == "rd":
+            written_fields.append("rd")
+        elif field in ["rs", "imm(rs)"]:
+            read_fields.append("rs")
+        elif field == "rt":
+            if position == 0 and mnemonic not in STORE_MNEMONICS:
+                written_fields.append("rt")
+            else:
+                read_fields.append("rt")
+    return tuple(read_fields), tuple(written_fields)
+
+
+# Dictionary mapping every mnemonic to the register fields it reads and writes (see get_register_fields(...))
+REGISTER_FIELD_DICT = {mnemonic: get_register_fields(mnemonic) for mnemonic in instructions.instruction_list}
+
+
+def decode_instruction(word):
+    """
+    Decodes a word into what the timing model needs to know about it
+    :param word: instruction word (int)
+    :return: Tuple (mnemonic or None if unknown,
+                    registers read in EX, registers read in MEM (store data), registers written (tuples of ints),
+                    result latency (see LATENCY_DICT), whether the result is loaded from memory,
+                    control transfer penalty)
+    """
+    opcode = word >> 26
+    mnemonic = simulator.DECODE_DICT.get((opcode, word & 0x3F if opcode == 0 else None))
+    if mnemonic is None:
+        return None, (), (), (), ALU_LATENCY, False, 0
+
+    fields = {"rs": (word >> 21) & 0x1F, "rt": (word >> 16) & 0x1F, "rd": (word >> 11) & 0x1F}
+    read_fields, written_fields = REGISTER_FIELD_DICT[mnemonic]
+    implicit_reads, implicit_writes = IMPLICIT_REGISTER_DICT.get(mnemonic, ((), ()))
+
+    # $zero never creates a dependency
+    ex_reads = tuple(fields[field] for field in read_fields if fields[field]
+                     and not (field == "rt" and mnemonic in STORE_MNEMONICS)) + implicit_reads
+    mem_reads = (fields["rt"],) if mnemonic in STORE_MNEMONICS and fields["rt"] else ()
+    writes = tuple(fields[field] for field in written_fields if fields[field]) + implicit_writes
+    return (mnemonic, ex_reads, mem_reads, writes, LATENCY_DICT.get(mnemonic, ALU_LATENCY),
+            mnemonic in LOAD_MNEMONICS, CONTROL_PENALTY_DICT.get(mnemonic, 0))
+
+
+def analyze_trace(words, trace, forwarding=True):
+    """
+    Replays an executed instruction trace through the pipeline
+    The timing is a dictionary with the keys
+        instructions, cycles, cpi - number of instructions, total cycles (including filling the pipeline), and cycles
+                                    per instruction
+        data_stalls - cycles lost waiting for operands
+        load_use_stalls - the part of data_stalls spent waiting for a value loaded from memory
+        branch_penalty - cycles lost to taken branches and jumps
+        taken_branches - number of control transfers which didn't continue with the next instruction
+        forwarding_events - number of operands taken from the pipeline instead of the register file
+        forwarding - whether forwarding was modeled
+        executions, stalls, penalties - arrays with one entry per instruction index: how many times it executed,
+                                        the data stall cycles it waited, and the branch penalty cycles it caused
+    :param words: assembled instruction words (iterable of int)
+    :param trace: executed instruction indexes in execution order (iterable of int, see simulator.run_trace(...))
+    :param forwarding: model forwarding paths (EX/MEM and MEM/WB to EX, MEM/WB to MEM)
+    :return: timing dictionary
+    """
+    decoded_program = [decode_instruction(word) for word in words]
+    instruction_count = len(decoded_program)
+    executions = array("Q", bytes(8 * instruction_count))
+    stalls = array("Q", bytes(8 * instruction_count))
+    penalties = array("Q", bytes(8 * instruction_count))
+
+    # Cycle from which each register's newest value can be used in EX, and whether it is loaded from memory
+    ready_cycles = [0] * simulator.REGISTER_COUNT
+    loaded = [False] * simulator.REGISTER_COUNT
+    # Cycle in which each register's newest value is written back (it can be read in ID from then on)
+    write_back_cycles = [0] * simulator.REGISTER_COUNT
+
+    ex_cycle = STAGES_BEFORE_EX         # The first instruction enters EX in cycle 3
+    previous_index, pending_penalty = None, 0
+    data_stalls = load_use_stalls = branch_penalty = taken_branches = forwarding_events = 0
+    instructions_executed = 0
+
+    for index in trace:
+        mnemonic, ex_reads, mem_reads, writes, latency, is_load, penalty = decoded_program[index]
+
+        # Flush the instructions fetched after a branch or jump which transferred control
+        if pending_penalty and index != previous_index + 1:
+            branch_penalty += pending_penalty
+            penalties[previous_index] += pending_penalty
+            taken_branches += 1
+            earliest_cycle = ex_cycle + 1 + pending_penalty
+        else:
+            earliest_cycle = ex_cycle + 1
+
+        # Wait for the operands (store data is needed one stage later, in MEM, when it can be forwarded)
+        ex_cycle = earliest_cycle
+        load_wait = False
+        for register in ex_reads:
+            if ready_cycles[register] > ex_cycle:
+                ex_cycle = ready_cycles[register]
+                load_wait = loaded[register]
+        for register in mem_reads:
+            ready_cycle = ready_cycles[register] - 1 if forwarding else ready_cycles[register]
+            if ready_cycle > ex_cycle:
+                ex_cycle = ready_cycle
+                load_wait = loaded[register]
+        stall = ex_cycle - earliest_cycle
+        if stall:
+            data_stalls += stall
+            stalls[index] += stall
+            if load_wait:
+                load_use_stalls += stall
+
+        # Operands not written back before this instruction's ID (one cycle before EX) come from the pipeline
+        if forwarding:
+            for register in ex_reads + mem_reads:
+                if write_back_cycles[register] > ex_cycle - 1:
+                    forwarding_events += 1
+
+        # Results are written back once they passed MEM (or left the multiply/divide unit), without forwarding they
+        # can only be used in the EX following the write back
+        write_back_cycle = ex_cycle + max(latency, 2)
+        ready_cycle = ex_cycle + latency if forwarding else write_back_cycle + 1
+        for register in writes:
+            ready_cycles[register] = ready_cycle
+            loaded[register] = is_load
+            write_back_cycles[register] = write_back_cycle
+
+        executions[index] += 1
+        instructions_executed += 1
+        previous_index, pending_penalty = index, penalty
+
+    cycles = ex_cycle + STAGES_FROM_EX - 1 if instructions_executed else 0
+    return {"instructions": instructions_executed, "cycles": cycles,
+            "cpi": cycles / instructions_executed if instructions_executed else 0.0,
+            "data_stalls": data_stalls, "load_use_stalls": load_use_stalls, "branch_penalty": branch_penalty,
+            "taken_branches": taken_branches, "forwarding_events": forwarding_events, "forwarding": forwarding,
+            "executions": executions, "stalls": stalls, "penalties": penalties}
+
+
+def get_line_timing(timing, instruction_lines):
+    """
+    Adds up the timing of the instructions of every source line (a pseudo instruction is assembled to several)
+    :param timing: timing dictionary (see analyze_trace(...))
+    :param instruction_lines: source line number of every instruction (see api.AssembledProgram.line_numbers)
+    :return: dictionary mapping line numbers (starting with 0 as first line) to lists [executions, stalls, penalties]
+        (executions of the first instruction of the line, stalls and penalties of all of them)
+    """
+    line_timing = {}
+    for index, line_number in enumerate(instruction_lines):
+        if line_number not in line_timing:
+            line_timing[line_number] = [timing["executions"][index], 0, 0]
+        line_timing[line_number][1] += timing["stalls"][index]
+        line_timing[line_number][2] += timing["penalties"][index]
+    return line_timing
+
+
+def format_timing(timing, lines, instruction_lines, stalling_line_count=STALLING_LINE_COUNT):
+    """
+    Renders a timing as a human readable report, listing the lines which lost the most cycles
+    :param timing: timing dictionary (see analyze_trace(...))
+    :param lines: source lines (list of strings)
+    :param instruction_lines: source line number of every instruction (see api.AssembledProgram.line_numbers)
+    :param stalling_line_count: number of lines to list
+    :return: report (string)
+    """
+    report = [f"Pipeline: {timing['instructions']:,} instructions, {timing['cycles']:,} cycles, "
+              f"CPI {timing['cpi']:.3f} ({'with' if timing['forwarding'] else 'without'} forwarding)",
+              f"  data stalls         {timing['data_stalls']:>12,} cycles "
+              f"({timing['load_use_stalls']:,} load-use)",
+              f"  branch penalties    {timing['branch_penalty']:>12,} cycles "
+              f"({timing['taken_branches']:,} taken branches and jumps)",
+              f"  forwarded operands  {timing['forwarding_events']:>12,}"]
+
+    line_timing = get_line_timing(timing, instruction_lines)
+    stalling = sorted((line_number for line_number, (_, stalls, penalties) in line_timing.items()
+                       if stalls + penalties),
+                      key=lambda line_number: -sum(line_timing[line_number][1:]))[:stalling_line_count]
+    if stalling:
+        report.append("Lines losing the most cycles:")
+        report.append(f"  {'line':<8}{'executed':>12}{'stalls':>12}{'penalties':>12}")
+        for line_number in stalling:
+            executions, stalls, penalties = line_timing[line_number]
+            report.append(f"  {line_number + 1:<8}{executions:>12,}{stalls:>12,}{penalties:>12,}  "
+                          f"{lines[line_number].strip()}")
+    return "\n".join(report)
+
+
+def format_annotated_source(timing, lines, instruction_lines):
+    """
+    Renders the source with the executions, stall cycles, and branch penalty cycles of every instruction in front
+    :param timing: timing dictionary (see analyze_trace(...))
+    :param lines: source lines (list of strings)
+    :param instruction_lines: source line number of every instruction (see api.AssembledProgram.line_numbers)
+    :return: annotated source (string)
+    """
+    line_timing = get_line_timing(timing, instruction_lines)
+    annotated_lines = []
+    for line_number, line in enumerate(lines):
+        if line_number not in line_timing:
+            annotated_lines.append(f"{'':>36}  {line.rstrip()}")
+        else:
+            executions, stalls, penalties = line_timing[line_number]
+            annotated_lines.append(f"{executions:>12,}{stalls:>12,}{penalties:>12,}  {line.rstrip()}")
+    return "\n".join(annotated_lines)
+
+
+def time_source(source, start_address=None, memory_size=simulator.DEFAULT_MEMORY_SIZE,
+                max_steps=DEFAULT_MAX_TRACE_STEPS, forwarding=True):
+    """
+    Assembles and runs a program, then times its execution on the pipeline
+    :param source: the assembly program (see api.get_source_lines(...) for the supported types)
+    :param start_address: byte address of the first instruction (defaults to assembler.START_ADDRESS)
+    :param memory_size: size of the simulated memory in bytes (int)
+    :param max_steps: maximum number of instructions to execute (int)
+    :param forwarding: model forwarding paths (see analyze_trace(...))
+    :return: Tuple (timing dictionary (see analyze_trace(...)), source lines (list), instruction line numbers (array,
+        see api.AssembledProgram.line_numbers))
+    :raises AssemblerError if the program is invalid, SimulationError if it can't be executed
+    """
+    lines = list(api.get_source_lines(source))
+    program = api.assemble_source(lines, start_address, data_address=simulator.get_data_address(memory_size))
+    machine = simulator.load_program(program.words, program.start_address, memory_size, program.data_image,
+                                     program.data_address)
+    trace = array("I")
+    simulator.run_trace(machine, trace, max_steps)
+    return analyze_trace(program.words, trace, forwarding), lines, program.line_numbers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time a MIPS assembly program on a 5 stage pipeline")
+    parser.add_argument("input", help="assembly file")
+    parser.add_argument("--no-forwarding", action="store_true", help="model a pipeline without forwarding")
+    parser.add_argument("--annotate", action="store_true",
+                        help="print the source with the executions, stalls, and penalties of every instruction")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_TRACE_STEPS,
+                        help="maximum number of instructions to execute (default: %(default)s)")
+    parser.add_argument("--memory-size", type=int, default=simulator.DEFAULT_MEMORY_SIZE,
+                        help="size of the simulated memory in bytes (default: %(default)s)")
+    parser.add_argument("--start-address", type=lambda value: int(value, 0), default=None,
+                        help="byte address of the first instruction (default: 7996)")
+    args = parser.parse_args()
+
+    try:
+        with open(args.input) as i_file:
+            result = time_source(i_file, args.start_address, args.memory_size, args.max_steps,
+                                 not args.no_forwarding)
+    except (OSError, AssemblerError, SimulationError) as error:
+        print(error)
+        sys.exit(1)
+    timing, source_lines, source_instruction_lines = result
+    if args.annotate:
+        print(f"{'executed':>12}{'stalls':>12}{'penalties':>12}")
+        print(format_annotated_source(timing, source_lines, source_instruction_lines))
+    print(format_timing(timing, source_lines, source_instruction_lines))
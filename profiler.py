@@ -0,0 +1,199 @@
+"""
+Per-phase instrumentation of the assembler
+
+A profile is a plain dictionary (see get_empty_profile(...)) filled out by the regular passes of assembler.py when one
+is passed to them (assembler.process_file(..., profile=...), api.assemble_source(..., profile=True)), so the profile
+measures exactly the code path that runs without it.  Without a profile nothing is measured: measure_phase(None, ...)
+does nothing and the loops over the lines only check whether their lap clock (see get_lap_clock(...)) is None.
+
+Phases which run one after the other are measured as a whole (see measure_phase(...)).  Phases which alternate on every
+line (the first pass classifies and then tokenizes each line, single pass mode also encodes and writes it) are split
+with a lap clock: every lap adds the time since the previous lap to its phase and to its line (see lap(...)).
+"""
+from contextlib import contextmanager
+from array import array
+import tracemalloc
+import heapq
+import time
+import sys
+
+# Phases of the assembly process in the order they run
+# (tokenize includes lowering the pseudo instructions, optimize and schedule only run when requested)
+PHASES = ["read", "classify", "tokenize", "optimize", "verify", "encode", "schedule", "output"]
+
+# Number of slowest source lines recorded
+SLOWEST_LINE_COUNT = 10
+
+
+def get_empty_profile(trace_memory=False):
+    """
+    Creates an empty profile
+    phases - dictionary mapping each phase in PHASES to a dictionary of
+        seconds - wall time
+        allocated_blocks - net change in the number of memory blocks allocated by Python during the phase
+                           (phases split by a lap clock only count blocks if trace_memory is set, since counting them
+                           walks the whole heap, see lap(...))
+        allocated_bytes, peak_bytes - net change in traced memory and the peak above the phase start
+                                      (only if trace_memory is set, since tracing slows everything down)
+    line_type_counts - dictionary mapping LineType names to the number of lines of that type
+    slowest_lines - list of dictionaries (line_number, seconds, line) for the slowest lines, slowest first (the time
+                    measured for each line by the lap clock: classifying and tokenizing it, in single pass mode also
+                    verifying, encoding and writing it)
+    lines, instructions - number of source lines and instructions
+    :param trace_memory: also measure memory in bytes with tracemalloc (boolean)
+    :return: profile dictionary
+    """
+    phases = {phase: {"seconds": 0.0, "allocated_blocks": 0} for phase in PHASES}
+    if trace_memory:
+        for phase_dict in phases.values():
+            phase_dict.update(allocated_bytes=0, peak_bytes=0)
+    return {"phases": phases, "line_type_counts": {}, "slowest_lines": [], "lines": 0, "instructions": 0,
+            "trace_memory": trace_memory}
+
+
+@contextmanager
+def measure_phase(profile, phase):
+    """
+    Context manager adding the wall time and allocations of the enclosed code to a phase of the profile
+    :param profile: profile dictionary (see get_empty_profile(...)), None to not measure anything
+    :param phase: name of the phase (one of PHASES)
+    """
+    if profile is None:
+        yield
+        return
+    phase_dict = profile["phases"][phase]
+    trace_memory = profile["trace_memory"]
+    if trace_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+    start_blocks = sys.getallocatedblocks()
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        phase_dict["seconds"] += time.perf_counter() - start_time
+        phase_dict["allocated_blocks"] += sys.getallocatedblocks() - start_blocks
+        if trace_memory:
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            phase_dict["allocated_bytes"] += current_bytes - start_bytes
+            phase_dict["peak_bytes"] = max(phase_dict["peak_bytes"], peak_bytes - start_bytes)
+
+
+def get_lap_clock(profile):
+    """
+    Starts a clock splitting the time of a loop over the lines into phases and lines (see lap(...))
+    :param profile: profile dictionary (see get_empty_profile(...)), None to not measure anything
+    :return: lap clock dictionary, or None if profile is None
+        profile - the profile the laps are added to
+        line_seconds - time spent on each line so far (array of doubles indexed by line number)
+        time, blocks, bytes - wall time, allocated blocks, and traced bytes at the previous lap (blocks and bytes
+                              only if the profile traces memory)
+    """
+    if profile is None:
+        return None
+    if profile["trace_memory"] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    clock = {"profile": profile, "line_seconds": array("d")}
+    restart_lap_clock(clock)
+    return clock
+
+
+def restart_lap_clock(clock):
+    """
+    Starts the next lap now (the time since the previous lap isn't counted anywhere)
+    """
+    if clock["profile"]["trace_memory"]:
+        tracemalloc.reset_peak()
+        clock["bytes"] = tracemalloc.get_traced_memory()[0]
+        clock["blocks"] = sys.getallocatedblocks()
+    clock["time"] = time.perf_counter()
+
+
+def lap(clock, phase, line_number=None):
+    """
+    Adds the wall time and allocations since the previous lap to a phase of the profile (and the time to a line)
+    The lap clock itself isn't counted: the next lap starts once this one is recorded.  Allocations are only counted
+    if the profile traces memory: sys.getallocatedblocks() walks every arena, which would take longer than the line.
+    :param clock: lap clock dictionary (see get_lap_clock(...))
+    :param phase: name of the phase (one of PHASES)
+    :param line_number: line the time was spent on starting with 0 as first line (int), None if it wasn't spent on a
+        single line
+    :return: None
+    """
+    seconds = time.perf_counter() - clock["time"]
+    phase_dict = clock["profile"]["phases"][phase]
+    phase_dict["seconds"] += seconds
+    if clock["profile"]["trace_memory"]:
+        phase_dict["allocated_blocks"] += sys.getallocatedblocks() - clock["blocks"]
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        phase_dict["allocated_bytes"] += current_bytes - clock["bytes"]
+        phase_dict["peak_bytes"] = max(phase_dict["peak_bytes"], peak_bytes - clock["bytes"])
+
+    if line_number is not None:
+        line_seconds = clock["line_seconds"]
+        if line_number >= len(line_seconds):
+            line_seconds.frombytes(bytes(8 * (line_number + 1 - len(line_seconds))))
+        line_seconds[line_number] += seconds
+    restart_lap_clock(clock)
+
+
+def lap_classified(clock, line_number, line_type):
+    """
+    Ends the classify lap of a line (see lap(...)) and counts the line and its type
+    :param clock: lap clock dictionary (see get_lap_clock(...))
+    :param line_number: line number starting with 0 as first line (int)
+    :param line_type: LineType the line was classified as
+    :return: None
+    """
+    lap(clock, "classify", line_number)
+    profile = clock["profile"]
+    profile["lines"] += 1
+    profile["line_type_counts"][line_type.name] = profile["line_type_counts"].get(line_type.name, 0) + 1
+
+
+def record_slowest_lines(profile, line_seconds, get_line):
+    """
+    Saves the slowest lines to the profile
+    :param profile: profile dictionary (see get_empty_profile(...))
+    :param line_seconds: time spent on each line (array, see get_lap_clock(...))
+    :param get_line: function returning the text of a line given its line number starting with 0 as first line
+    :return: None
+    """
+    slowest = heapq.nlargest(SLOWEST_LINE_COUNT, range(len(line_seconds)), key=line_seconds.__getitem__)
+    profile["slowest_lines"] = [{"line_number": line_number+1,                  # +1 since first line is 0
+                                 "seconds": line_seconds[line_number],
+                                 "line": get_line(line_number).rstrip("\n")}
+                                for line_number in slowest]
+
+
+def format_profile(profile):
+    """
+    Renders a profile as a human readable report
+    :param profile: profile dictionary (see get_empty_profile(...))
+    :return: report (string)
+    """
+    total_seconds = sum(phase_dict["seconds"] for phase_dict in profile["phases"].values()) or 1.0
+    report = [f"Profile: {profile['lines']:,} lines, {profile['instructions']:,} instructions",
+              f"{'phase':<10}{'seconds':>10}{'share':>8}{'blocks':>12}"
+              + (f"{'bytes':>14}{'peak bytes':>14}" if profile["trace_memory"] else "")]
+    for phase, phase_dict in profile["phases"].items():
+        # (phases which didn't run, i.e. optimize without --optimize)
+        if not phase_dict["seconds"]:
+            continue
+        row = (f"{phase:<10}{phase_dict['seconds']:>10.4f}{phase_dict['seconds'] / total_seconds:>8.1%}"
+               f"{phase_dict['allocated_blocks']:>12,}")
+        if profile["trace_memory"]:
+            row += f"{phase_dict['allocated_bytes']:>14,}{phase_dict['peak_bytes']:>14,}"
+        report.append(row)
+
+    report.append("Lines per type:")
+    for line_type, count in sorted(profile["line_type_counts"].items(), key=lambda item: -item[1]):
+        report.append(f"  {line_type:<22}{count:>10,}")
+
+    report.append("Slowest lines:")
+    for slow_line in profile["slowest_lines"]:
+        report.append(f"  line {slow_line['line_number']:<8} {slow_line['seconds'] * 1e6:>8.1f} us  "
+                      f"{slow_line['line'].strip()}")
+    return "\n".join(report)
@@ -0,0 +1,259 @@
+"""
+Pseudo instruction lowering with size minimizing relaxation
+
+The first pass gives every pseudo instruction (see pseudo_instruction_list in instructions.py) a single instruction
+slot.  expand_lines(...) then replaces each one with the shortest sequence of real instructions:
+    li  rt, imm     - "addiu rt, $0, imm" if imm fits 16 bits signed, "ori rt, $0, imm" if it fits 16 bits unsigned,
+                      "lui rt, upper" if the lower half is zero, otherwise "lui rt, upper" + "ori rt, rt, lower"
+    la  rt, label   - same as li with the address of the label (or of the variable)
+    bge/bgt/ble/blt - "slt" (or "slti" if the second operand is an immediate which fits) into $at and a beq/bne
+    move, neg, not, b, beqz, ... - fixed expansions (see get_expansion(...))
+
+The size of an la depends on the address of its label, and the addresses depend on the sizes of the expansions in
+front of them, so the sizes are relaxed: every la starts out as a single word, and the addresses and sizes are
+recomputed until nothing changes.  An expansion never shrinks once it has grown (an la which would fit a single word
+again keeps "lui" + "ori" with a zero lower half), so the sizes only grow and the relaxation always reaches a fixed
+point (in at most one round per la, usually two or three rounds in total).  Expanding every la and li to the worst
+case ("lui" + "ori") would make most of them twice as large.
+
+Single pass mode and incremental reassembly can't relax, so they lower each pseudo instruction on its own with
+get_fixed_size_expansion(...), which refuses la with a label.
+
+$at is the assembler temporary, the compare and branch expansions clobber it.  Source instructions may not write it,
+the expanded instructions are marked (see ExpandedInstruction in custom_types.py) to be allowed to.
+"""
+from custom_types import InvalidInstructionError, UndefinedLabelError
+from bisect import bisect_left
+from array import array
+import data_segment
+import custom_types
+import instructions
+import helpers
+
+# Register the expansions use for intermediate values
+ASSEMBLER_TEMPORARY = "$at"
+
+# Branch of the compare and branch pseudo instructions, and whether the operands of the slt are swapped
+# (rs < rt is computed as slt, rs > rt as slt with swapped operands, the branch is taken on true (bne) or false (beq))
+COMPARE_BRANCH_DICT = {"blt": ("bne", False), "bge": ("beq", False), "bgt": ("bne", True), "ble": ("beq", True)}
+
+# Fixed expansions of the pseudo instructions with register operands (operands are substituted by position)
+FIXED_EXPANSION_DICT = {
+    "move": [["addu", 0, 1, "$0"]],
+    "neg": [["sub", 0, "$0", 1]],
+    "negu": [["subu", 0, "$0", 1]],
+    "not": [["nor", 0, 1, "$0"]],
+    "abs": [["sra", ASSEMBLER_TEMPORARY, 1, "31"], ["xor", 0, 1, ASSEMBLER_TEMPORARY],
+            ["subu", 0, 0, ASSEMBLER_TEMPORARY]],
+    "b": [["beq", "$0", "$0", 0]],
+    "beqz": [["beq", 0, "$0", 1]],
+    "bltz": [["slt", ASSEMBLER_TEMPORARY, 0, "$0"], ["bne", ASSEMBLER_TEMPORARY, "$0", 1]],
+    "seq": [["subu", 0, 1, 2], ["sltiu", 0, 0, "1"]],
+    "sne": [["subu", 0, 1, 2], ["sltu", 0, "$0", 0]],
+    "sgt": [["slt", 0, 2, 1]],
+    "sge": [["slt", 0, 1, 2], ["sltiu", 0, 0, "1"]],
+}
+
+
+def get_signed_16(value):
+    """
+    :return: lower 16 bits of value as a 16 bit 2's complement number (the immediate token encoding those bits)
+    """
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+
+def get_load_immediate(register, value, words=1):
+    """
+    Shortest expansion loading a 32 bit value into a register
+    :param register: destination register (string)
+    :param value: value to load (int, signed or unsigned 32 bit)
+    :param words: minimum number of words (a 2 word expansion is kept once relaxation chose it)
+    :return: list of tokenized instruction lists
+    :raises ValueError if the value doesn't fit 32 bits
+    """
+    if value < -pow(2, 31) or value >= pow(2, 32):
+        raise ValueError(f"Immediate value \"{value}\" does not fit in 32 bits")
+    value &= 0xFFFFFFFF
+    if words < 2:
+        if value < 0x8000 or value >= 0xFFFF8000:
+            return [["addiu", register, "$0", str(get_signed_16(value))]]
+        if value <= 0xFFFF:
+            return [["ori", register, "$0", str(get_signed_16(value))]]
+        if not value & 0xFFFF:
+            return [["lui", register, str(get_signed_16(value >> 16))]]
+    return [["lui", register, str(get_signed_16(value >> 16))],
+            ["ori", register, register, str(get_signed_16(value & 0xFFFF))]]
+
+
+def get_expansion(tokenized_instr_list, get_address=None, words=1):
+    """
+    Lowers a pseudo instruction to real instructions
+    :param tokenized_instr_list: tokenized pseudo instruction list (list)
+    :param get_address: function returning the byte address of a label, or None if it isn't defined (only needed for
+        la with a label operand)
+    :param words: minimum number of words (see get_load_immediate(...))
+    :return: list of tokenized instruction lists
+    :raises InvalidInstructionError if the operands are invalid, UndefinedLabelError if la references an undefined label
+    """
+    mnemonic, operands = tokenized_instr_list[0], tokenized_instr_list[1:]
+    if len(operands) != len(instructions.pseudo_instruction_list[mnemonic]["format"]):
+        raise InvalidInstructionError("Instruction did not contain expected number of tokens")
+
+    if mnemonic in FIXED_EXPANSION_DICT:
+        return [[operand if isinstance(operand, str) else operands[operand] for operand in expansion]
+                for expansion in FIXED_EXPANSION_DICT[mnemonic]]
+
+    if mnemonic in ["li", "la"]:
+        value = data_segment.get_number(operands[1])
+        if value is None:
+            if mnemonic == "li":
+                raise InvalidInstructionError(f"Immediate value \"{operands[1]}\" is not numeric")
+            value = get_address(operands[1])
+            if value is None:
+                raise UndefinedLabelError(f"Label \"{operands[1]}\" could not be located in symbol table or variable "
+                                          f"table", operands[1])
+        try:
+            return get_load_immediate(operands[0], value, words)
+        except ValueError as error:
+            raise InvalidInstructionError(str(error))
+
+    # Compare and branch: the second operand may be a register or an immediate
+    branch, swapped = COMPARE_BRANCH_DICT[mnemonic]
+    rs, rt, label = operands
+    expansion = []
+    if not rt.startswith("$"):
+        value = data_segment.get_number(rt)
+        if value is None:
+            raise InvalidInstructionError(f"Operand \"{rt}\" is neither a register nor a numeric immediate")
+        # rs > imm is the same as not rs < imm+1, so slti works for both orders while the immediate fits
+        if swapped and -0x8000 <= value+1 < 0x8000:
+            branch, swapped, value = {"bne": "beq", "beq": "bne"}[branch], False, value+1
+        if not swapped and -0x8000 <= value < 0x8000:
+            return [["slti", ASSEMBLER_TEMPORARY, rs, str(value)], [branch, ASSEMBLER_TEMPORARY, "$0", label]]
+        try:
+            expansion = get_load_immediate(ASSEMBLER_TEMPORARY, value)
+        except ValueError as error:
+            raise InvalidInstructionError(str(error))
+        rt = ASSEMBLER_TEMPORARY
+    expansion.append(["slt", ASSEMBLER_TEMPORARY, *((rt, rs) if swapped else (rs, rt))])
+    expansion.append([branch, ASSEMBLER_TEMPORARY, "$0", label])
+    return expansion
+
+
+def get_fixed_size_expansion(tokenized_instr_list, variable_table):
+    """
+    Lowers a pseudo instruction without knowing the addresses of the labels (for single pass mode and incremental
+    reassembly)
+    :param tokenized_instr_list: tokenized pseudo instruction list (list)
+    :param variable_table: dictionary mapping the variables defined so far to their byte addresses
+    :return: list of tokenized instruction lists
+    :raises InvalidInstructionError if the operands are invalid or la references a label (its size depends on where
+        the label ends up)
+    """
+    if tokenized_instr_list[0] == "la" and len(tokenized_instr_list) == 3 \
+            and data_segment.get_number(tokenized_instr_list[2]) is None \
+            and tokenized_instr_list[2] not in variable_table:
+        raise InvalidInstructionError(f"la of \"{tokenized_instr_list[2]}\" needs the whole program, only numbers and "
+                                      f"variables defined above it are supported in this mode")
+    return get_expansion(tokenized_instr_list, variable_table.get)
+
+
+def get_expanded_lines(line_type, expansion):
+    """
+    :param line_type: LineType of the pseudo instruction line
+    :param expansion: list of tokenized instruction lists (see get_expansion(...))
+    :return: list of tuples (line type, tokenized instruction list) of the expanded instructions (only the first one
+        carries the label of the line, the tokenized instruction lists are marked as ExpandedInstruction)
+    """
+    with_label = line_type == custom_types.LineType.LABEL_WITH_PSEUDO_INSTR
+    return [(helpers._MNEMONIC_LINE_TYPE_DICT[expanded_tokens[0]][with_label and position == 0],
+             custom_types.ExpandedInstruction(expanded_tokens))
+            for position, expanded_tokens in enumerate(expansion)]
+
+
+def expand_lines(symbol_table, variable_table, line_type_list, start_address):
+    """
+    Lowers every pseudo instruction of the line type list with the shortest expansions (see module docstring)
+    :param symbol_table: dictionary mapping labels to their byte addresses (from the first pass)
+    :param variable_table: dictionary mapping variables to their byte addresses (from the first pass)
+    :param line_type_list: line type list (from the first pass, pseudo instructions occupy one slot each)
+    :param start_address: byte address of the first instruction (int)
+    :return: Tuple (symbol table, line type list, line numbers) with the pseudo instructions replaced by their
+        expansions and the addresses and labels recomputed (the arguments are left unchanged)
+        line numbers maps each entry of the new line type list to the line number of the source line it came from
+        (array), or None if there are no pseudo instructions (the arguments are returned as they are)
+    :raises InvalidInstructionError if a pseudo instruction is invalid (with the line number filled in)
+    """
+    pseudo_lines = [line_number for line_number, (line_type, _, _) in enumerate(line_type_list)
+                    if line_type in custom_types.ALL_PSEUDO_TYPES]
+    if not pseudo_lines:
+        return symbol_table, line_type_list, None
+    pseudo_slots = [(line_type_list[line_number][1] - start_address) >> 2 for line_number in pseudo_lines]
+
+    # Additional words in front of each pseudo instruction (one entry more for the end of the program)
+    extra_words = [0] * (len(pseudo_lines) + 1)
+
+    def get_address(address):
+        # Address of the instruction which was at the given first pass address
+        return address + 4 * extra_words[bisect_left(pseudo_slots, (address - start_address) >> 2)]
+
+    def get_label_address(label):
+        if label in variable_table:
+            return variable_table[label]
+        return get_address(symbol_table[label]) if label in symbol_table else None
+
+    def expand(index, words=1):
+        line_number = pseudo_lines[index]
+        try:
+            return get_expansion(line_type_list[line_number][2], get_label_address, words)
+        except InvalidInstructionError as error:
+            error.line_number = line_number+1                           # +1 since first line is 0
+            raise
+
+    # Everything but la with a label has the same expansion no matter where it is placed
+    expansions = []
+    relaxed = []
+    for index, line_number in enumerate(pseudo_lines):
+        tokenized_instr_list = line_type_list[line_number][2]
+        if tokenized_instr_list[0] == "la" and len(tokenized_instr_list) == 3 \
+                and data_segment.get_number(tokenized_instr_list[2]) is None:
+            relaxed.append(index)
+            expansions.append(None)
+        else:
+            expansions.append(expand(index))
+    sizes = [1 if expansion is None else len(expansion) for expansion in expansions]
+
+    # Relax the sizes of la until the addresses don't change anymore (sizes only grow, see module docstring)
+    while True:
+        for index, size in enumerate(sizes):
+            extra_words[index+1] = extra_words[index] + size - 1
+        changed = False
+        for index in relaxed:
+            size = len(expand(index, sizes[index]))
+            if size != sizes[index]:
+                sizes[index] = size
+                changed = True
+        if not changed:
+            break
+    for index in relaxed:
+        expansions[index] = expand(index, sizes[index])
+
+    # Rebuild the line type list with the expansions in place of the pseudo instructions
+    expanded_line_type_list = []
+    line_numbers = array("L")
+    pseudo_indexes = dict(zip(pseudo_lines, range(len(pseudo_lines))))
+    for line_number, (line_type, address, tokens) in enumerate(line_type_list):
+        index = pseudo_indexes.get(line_number)
+        if index is None:
+            expanded_line_type_list.append((line_type, None if address is None else get_address(address), tokens))
+            line_numbers.append(line_number)
+            continue
+        address = get_address(address)
+        for position, (expanded_line_type, expanded_tokens) in \
+                enumerate(get_expanded_lines(line_type, expansions[index])):
+            expanded_line_type_list.append((expanded_line_type, address + 4 * position, expanded_tokens))
+            line_numbers.append(line_number)
+
+    expanded_symbol_table = {label: get_address(address) for label, address in symbol_table.items()}
+    return expanded_symbol_table, expanded_line_type_list, line_numbers
+
@@ -0,0 +1,206 @@
+"""
+Latency aware list scheduling of the assembled instructions within basic blocks
+
+After the second pass every instruction word is known, so its source and destination registers can be read back out
+of it (see pipeline.decode_instruction(...), which uses the format lists of the instruction list).  Each basic block
+(the instructions between two label targets, branches, or jumps) is reordered so instructions using the result of a
+load, multiply, or divide are moved further away from it and independent instructions fill the gap.
+
+Only straight line instructions move: the branch or jump ending a block stays last, and labels keep pointing at the
+first instruction of their block, so no label or branch offset changes.  The new order preserves every dependency:
+    reads of a register stay after the write they read (and before the next write of it)
+    writes of a register stay in order
+    stores stay in order with every other load and store (addresses aren't known, so any two may alias)
+The cycles of every block are estimated with the latencies of the pipeline model (pipeline.LATENCY_DICT, assuming
+forwarding), and a block is only reordered when that saves cycles.
+"""
+import pipeline
+
+# Longest run of instructions scheduled together (longer blocks are scheduled in windows of this size, keeping the
+# scheduling time linear for very long blocks)
+MAX_SCHEDULE_WINDOW = 64
+
+
+def estimate_cycles(decoded_instructions):
+    """
+    Estimates the cycles a sequence of instructions takes to issue, starting with every register available
+    :param decoded_instructions: list of decoded instructions (see pipeline.decode_instruction(...))
+    :return: number of cycles from the first instruction entering EX until the cycle after the last one did (int)
+    """
+    ready_cycles = {}
+    cycle = 0
+    for _, ex_reads, mem_reads, writes, latency, _, _ in decoded_instructions:
+        for register in ex_reads:
+            cycle = max(cycle, ready_cycles.get(register, 0))
+        for register in mem_reads:
+            # Store data is needed one stage later, in MEM
+            cycle = max(cycle, ready_cycles.get(register, 0) - 1)
+        for register in writes:
+            ready_cycles[register] = cycle + latency
+        cycle += 1
+    return cycle
+
+
+def get_dependencies(decoded_instructions):
+    """
+    Builds the dependency graph of a run of straight line instructions
+    :param decoded_instructions: list of decoded instructions (see pipeline.decode_instruction(...))
+    :return: list with one dictionary per instruction mapping each instruction it depends on (position in the run) to
+        the minimum number of cycles between the two entering EX
+    """
+    dependencies = [{} for _ in decoded_instructions]
+    last_writes = {}                # register -> position of the last instruction writing it
+    reads_since_write = {}          # register -> positions of the instructions reading it since the last write
+    last_store = None
+    loads_since_store = []
+
+    def add_dependency(position, earlier_position, distance):
+        dependencies[position][earlier_position] = max(dependencies[position].get(earlier_position, 1), distance)
+
+    for position, (mnemonic, ex_reads, mem_reads, writes, latency, is_load, _) in enumerate(decoded_instructions):
+        # Read after write (the distance is the latency of the result, store data is needed one cycle later)
+        for registers, delay in [(ex_reads, 0), (mem_reads, 1)]:
+            for register in registers:
+                writer = last_writes.get(register)
+                if writer is not None:
+                    add_dependency(position, writer, max(decoded_instructions[writer][4] - delay, 1))
+                reads_since_write.setdefault(register, []).append(position)
+
+        # Write after read and write after write (the later write also has to finish last)
+        for register in writes:
+            for reader in reads_since_write.get(register, []):
+                if reader != position:
+                    add_dependency(position, reader, 1)
+            writer = last_writes.get(register)
+            if writer is not None:
+                add_dependency(position, writer, max(decoded_instructions[writer][4] - latency + 1, 1))
+            last_writes[register] = position
+            reads_since_write[register] = []
+
+        # Memory accesses (stores are ordered with everything, loads only with stores)
+        if mnemonic in pipeline.STORE_MNEMONICS:
+            for load in loads_since_store:
+                add_dependency(position, load, 1)
+            if last_store is not None:
+                add_dependency(position, last_store, 1)
+            last_store = position
+            loads_since_store = []
+        elif is_load:
+            if last_store is not None:
+                add_dependency(position, last_store, 1)
+            loads_since_store.append(position)
+    return dependencies
+
+
+def schedule_run(decoded_instructions):
+    """
+    Orders a run of straight line instructions with list scheduling
+    Every cycle the instruction which can enter EX the earliest is issued, preferring the one with the longest chain
+    of latencies depending on it (the critical path) and then the original order.
+    :param decoded_instructions: list of decoded instructions (see pipeline.decode_instruction(...))
+    :return: list of positions in the run in their new order
+    """
+    count = len(decoded_instructions)
+    dependencies = get_dependencies(decoded_instructions)
+    dependents = [[] for _ in range(count)]
+    for position, position_dependencies in enumerate(dependencies):
+        for earlier_position, distance in position_dependencies.items():
+            dependents[earlier_position].append((position, distance))
+
+    # Length of the longest latency chain from every instruction to the end of the run
+    heights = [0] * count
+    for position in reversed(range(count)):
+        heights[position] = max([heights[later] + distance for later, distance in dependents[position]],
+                                default=decoded_instructions[position][4])
+
+    remaining_dependencies = [len(position_dependencies) for position_dependencies in dependencies]
+    earliest_cycles = [0] * count
+    ready = [position for position in range(count) if not remaining_dependencies[position]]
+    order = []
+    cycle = 0
+    while ready:
+        position = min(ready, key=lambda candidate: (max(earliest_cycles[candidate], cycle), -heights[candidate],
+                                                     candidate))
+        ready.remove(position)
+        issue_cycle = max(earliest_cycles[position], cycle)
+        order.append(position)
+        cycle = issue_cycle + 1
+        for later, distance in dependents[position]:
+            earliest_cycles[later] = max(earliest_cycles[later], issue_cycle + distance)
+            remaining_dependencies[later] -= 1
+            if not remaining_dependencies[later]:
+                ready.append(later)
+    return order
+
+
+def get_blocks(decoded_program, leaders):
+    """
+    Splits the program into runs of straight line instructions which may be reordered
+    :param decoded_program: list of decoded instructions (see pipeline.decode_instruction(...))
+    :param leaders: set of instruction indexes which are label targets
+    :return: yields tuples (index of the first instruction, index just past the last straight line instruction,
+        index just past the block including the branch or jump ending it)
+    """
+    start = 0
+    for index, (mnemonic, _, _, _, _, _, penalty) in enumerate(decoded_program):
+        if index in leaders and index > start:
+            yield start, index, index
+            start = index
+        # Branches, jumps, and words which aren't instructions end the block without moving
+        if penalty or mnemonic is None:
+            yield start, index, index + 1
+            start = index + 1
+    if start < len(decoded_program):
+        yield start, len(decoded_program), len(decoded_program)
+
+
+def schedule_words(words, symbol_table, start_address, report=None):
+    """
+    Reorders the instructions within every basic block to hide load, multiply, and divide latencies
+    :param words: assembled instruction words in address order (array)
+    :param symbol_table: dictionary mapping labels to their byte addresses (block boundaries)
+    :param start_address: byte address of the first instruction (int)
+    :param report: list to append a dictionary to for every reordered block, None to not report
+        address - byte address of the first instruction of the block
+        instructions - number of instructions in the block (including the branch or jump ending it)
+        cycles_before, cycles_after - estimated cycles of the block in the original and the new order
+    :return: scheduled instruction words in address order (array, words itself is left unchanged)
+    """
+    decoded_program = [pipeline.decode_instruction(word) for word in words]
+    leaders = {(address - start_address) >> 2 for address in symbol_table.values()}
+    scheduled_words = words[:]
+
+    for block_start, run_end, block_end in get_blocks(decoded_program, leaders):
+        block_order = []
+        for window_start in range(block_start, run_end, MAX_SCHEDULE_WINDOW):
+            window_end = min(window_start + MAX_SCHEDULE_WINDOW, run_end)
+            window_order = schedule_run(decoded_program[window_start:window_end])
+            block_order.extend(window_start + position for position in window_order)
+        block_order.extend(range(run_end, block_end))
+
+        cycles_before = estimate_cycles(decoded_program[block_start:block_end])
+        cycles_after = estimate_cycles([decoded_program[index] for index in block_order])
+        if cycles_after >= cycles_before:
+            continue
+        for index, original_index in enumerate(block_order, block_start):
+            scheduled_words[index] = words[original_index]
+        if report is not None:
+            report.append({"address": start_address + 4 * block_start, "instructions": block_end - block_start,
+                           "cycles_before": cycles_before, "cycles_after": cycles_after})
+    return scheduled_words
+
+
+def format_schedule_report(report):
+    """
+    Renders the scheduling report as a human readable summary
+    :param report: list of reordered blocks (see schedule_words(...))
+    :return: report (string)
+    """
+    cycles_before = sum(block["cycles_before"] for block in report)
+    cycles_after = sum(block["cycles_after"] for block in report)
+    lines = [f"Scheduling: {len(report):,} blocks reordered, estimated {cycles_before - cycles_after:,} cycles saved "
+             f"per pass through them ({cycles_before:,} -> {cycles_after:,})"]
+    for block in report:
+        lines.append(f"  {block['address']:#010x}{block['instructions']:>8,} instructions"
+                     f"{block['cycles_before']:>8,} -> {block['cycles_after']:,} cycles")
+    return "\n".join(lines)
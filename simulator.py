@@ -0,0 +1,927 @@
+"""
+Instruction set simulator for programs assembled by this assembler
+
+The program is loaded into a flat big endian memory (bytearray) at its start address (START_ADDRESS by default), its
+data segment at its data address, and every word of the text segment is decoded once into a small Python function (a
+handler) with its register numbers, immediate and branch target already extracted.  Running the program is then a
+tight loop calling one handler per instruction, each returning the index of the next instruction.
+
+Conventions (matching how the assembler encodes instructions):
+    there are no branch delay slots, branches and jumps take effect immediately and jal/jalr link to the next
+    instruction
+    jalr is assembled without rd, so it always links to $ra
+    mul and mult share an encoding, both set HI/LO and also write the low word to rd (the assembler takes rd for
+    mul, mult, multu, div and divu, so all of them write LO to rd as well)
+    add, addi and sub wrap around instead of trapping on overflow
+    execution stops when control leaves the text segment ($ra starts out pointing just past the last instruction, so
+    returning from the program ends it) or after max_steps instructions
+
+There are two execution engines producing exactly the same results: run(...) calls one handler per instruction, and
+run_blocks(...) translates each basic block into a generated Python function (see translate_block(...)).
+
+Usage (from the repository root):
+    python simulator.py "Assembly Files/test.asm" [--max-steps N] [--blocks]
+"""
+from custom_types import SimulationError, AssemblerError
+from instruction_assemblers import J_TYPE_OPCODES, IMM_MASK, ADDRESS_MASK
+import output_formats
+import instructions
+import assembler
+import argparse
+import struct
+import sys
+import re
+import dicts
+import api
+
+WORD_MASK = 0xFFFFFFFF
+SIGN_BIT = 0x80000000
+
+# Register file layout: the 32 general purpose registers, then HI and LO
+# Writes to $zero are redirected to the DISCARD slot at decode time so register 0 always reads 0
+HI = 32
+LO = 33
+DISCARD = 34
+REGISTER_COUNT = 35
+
+# Default size of the simulated memory in bytes (addresses 0 to DEFAULT_MEMORY_SIZE-1)
+DEFAULT_MEMORY_SIZE = 1 << 20
+
+# The data segment of programs assembled for the simulator starts this far into the memory (the MIPS default
+# data_segment.DATA_START_ADDRESS is far beyond any simulated memory), so the instructions get the memory below it and
+# the data and the stack ($sp starts at the top) share the memory above it
+DATA_ADDRESS_FRACTION = 0.5
+
+# Default limit on the number of executed instructions (protects against infinite loops)
+DEFAULT_MAX_STEPS = 100000000
+
+WORD_STRUCT = struct.Struct(">I")
+HALF_STRUCT = struct.Struct(">H")
+
+# Dictionary mapping (opcode, funct) to mnemonic (funct is None for I and J types), built from the instruction list
+# Note: mul and mult share an encoding, mult is listed last so it wins (see the module docstring)
+DECODE_DICT = {(fmt["opcode"], fmt["funct"] if fmt["type"] == "R" else None): mnemonic
+               for mnemonic, fmt in instructions.instruction_list.items()}
+
+
+def to_signed(value):
+    """
+    :param value: 32 bit unsigned value (int)
+    :return: the same bits as a signed value (int)
+    """
+    return (value ^ SIGN_BIT) - SIGN_BIT
+
+
+class _Halt(Exception):
+    """
+    Raised by the exit handlers to stop the simulation loop
+    """
+    def __init__(self, address):
+        super().__init__(address)
+        self.address = address
+
+
+def get_exit_index(machine, address):
+    """
+    Index of a handler which stops the simulation at an address outside the text segment
+    (these handlers are placed after the text segment handlers and are created the first time they are needed)
+    :param machine: machine dictionary (see load_program(...))
+    :param address: byte address control is transferred to (int)
+    :return: handler index (int)
+    """
+    exit_indexes = machine["exit_indexes"]
+    if address not in exit_indexes:
+        def exit_handler():
+            raise _Halt(address)
+        exit_indexes[address] = len(machine["code"])
+        machine["code"].append(exit_handler)
+    return exit_indexes[address]
+
+
+def get_target_index(machine, address):
+    """
+    :param machine: machine dictionary (see load_program(...))
+    :param address: byte address of a branch or jump target (int)
+    :return: index of the handler for the target (int)
+    :raises SimulationError if the target is not word aligned
+    """
+    if address & 3:
+        raise SimulationError("Jump to an address which is not word aligned", address)
+    index = (address - machine["text_start"]) >> 2
+    if 0 <= index < machine["instruction_count"]:
+        return index
+    return get_exit_index(machine, address)
+
+
+# Handler factories
+# Each one receives the machine, the instruction index and the decoded fields and returns the handler for that word
+# (rd or rt is replaced by DISCARD when it is the destination and $zero)
+
+def make_r_handler(mnemonic, machine, index, rs, rt, rd, shamt):
+    """
+    :return: handler for an R type instruction
+    """
+    regs = machine["registers"]
+    next_index = index + 1
+    d = rd or DISCARD
+
+    if mnemonic in ["add", "addu"]:
+        def handler():
+            regs[d] = (regs[rs] + regs[rt]) & WORD_MASK
+            return next_index
+    elif mnemonic in ["sub", "subu"]:
+        def handler():
+            regs[d] = (regs[rs] - regs[rt]) & WORD_MASK
+            return next_index
+    elif mnemonic == "and":
+        def handler():
+            regs[d] = regs[rs] & regs[rt]
+            return next_index
+    elif mnemonic == "or":
+        def handler():
+            regs[d] = regs[rs] | regs[rt]
+            return next_index
+    elif mnemonic == "xor":
+        def handler():
+            regs[d] = regs[rs] ^ regs[rt]
+            return next_index
+    elif mnemonic == "nor":
+        def handler():
+            regs[d] = ~(regs[rs] | regs[rt]) & WORD_MASK
+            return next_index
+    elif mnemonic == "slt":
+        def handler():
+            regs[d] = (regs[rs] ^ SIGN_BIT) < (regs[rt] ^ SIGN_BIT)
+            return next_index
+    elif mnemonic == "sltu":
+        def handler():
+            regs[d] = regs[rs] < regs[rt]
+            return next_index
+    elif mnemonic == "sll":
+        def handler():
+            regs[d] = (regs[rt] << shamt) & WORD_MASK
+            return next_index
+    elif mnemonic == "srl":
+        def handler():
+            regs[d] = regs[rt] >> shamt
+            return next_index
+    elif mnemonic == "sra":
+        def handler():
+            regs[d] = (((regs[rt] ^ SIGN_BIT) - SIGN_BIT) >> shamt) & WORD_MASK
+            return next_index
+    elif mnemonic == "mfhi":
+        def handler():
+            regs[d] = regs[HI]
+            return next_index
+    elif mnemonic == "mflo":
+        def handler():
+            regs[d] = regs[LO]
+            return next_index
+    elif mnemonic == "mthi":
+        def handler():
+            regs[HI] = regs[rs]
+            return next_index
+    elif mnemonic == "mtlo":
+        def handler():
+            regs[LO] = regs[rs]
+            return next_index
+    elif mnemonic in ["mult", "multu"]:
+        signed = mnemonic == "mult"
+
+        def handler():
+            if signed:
+                product = to_signed(regs[rs]) * to_signed(regs[rt])
+            else:
+                product = regs[rs] * regs[rt]
+            regs[HI] = (product >> 32) & WORD_MASK
+            regs[LO] = regs[d] = product & WORD_MASK
+            return next_index
+    elif mnemonic in ["div", "divu"]:
+        signed = mnemonic == "div"
+
+        def handler():
+            dividend, divisor = regs[rs], regs[rt]
+            # Division by zero leaves HI and LO unchanged (the result is unpredictable on real hardware)
+            if divisor:
+                if signed:
+                    dividend, divisor = to_signed(dividend), to_signed(divisor)
+                    # Round toward zero like C (Python's // rounds toward negative infinity)
+                    quotient = abs(dividend) // abs(divisor)
+                    if (dividend < 0) != (divisor < 0):
+                        quotient = -quotient
+                else:
+                    quotient = dividend // divisor
+                regs[HI] = (dividend - quotient * divisor) & WORD_MASK
+                regs[LO] = quotient & WORD_MASK
+            regs[d] = regs[LO]
+            return next_index
+    elif mnemonic in ["jr", "jalr"]:
+        link_address = machine["text_start"] + 4 * next_index
+        link = mnemonic == "jalr"
+
+        def handler():
+            target_index = get_target_index(machine, regs[rs])
+            if link:
+                regs[31] = link_address
+            return target_index
+    else:
+        raise SimulationError(f"No handler for R type instruction \"{mnemonic}\"")
+    return handler
+
+
+def make_i_handler(mnemonic, machine, index, rs, rt, imm):
+    """
+    :return: handler for an I type instruction (imm is the raw 16 bit field)
+    """
+    regs = machine["registers"]
+    memory = machine["memory"]
+    text_start, text_end = machine["text_start"], machine["text_end"]
+    address = text_start + 4 * index
+    next_index = index + 1
+    d = rt or DISCARD
+    simm = imm - ((imm & 0x8000) << 1)         # Sign extended immediate
+    uimm = simm & WORD_MASK                     # Sign extended immediate as an unsigned 32 bit value
+
+    if mnemonic in ["addi", "addiu"]:
+        def handler():
+            regs[d] = (regs[rs] + uimm) & WORD_MASK
+            return next_index
+    elif mnemonic == "andi":
+        def handler():
+            regs[d] = regs[rs] & imm
+            return next_index
+    elif mnemonic == "ori":
+        def handler():
+            regs[d] = regs[rs] | imm
+            return next_index
+    elif mnemonic == "slti":
+        def handler():
+            regs[d] = (regs[rs] ^ SIGN_BIT) - SIGN_BIT < simm
+            return next_index
+    elif mnemonic == "sltiu":
+        def handler():
+            regs[d] = regs[rs] < uimm
+            return next_index
+    elif mnemonic == "lui":
+        value = imm << 16
+
+        def handler():
+            regs[d] = value
+            return next_index
+    elif mnemonic in ["beq", "bne", "bgtz", "blez"]:
+        target_index = get_target_index(machine, address + 4 + 4 * simm)
+        if mnemonic == "beq":
+            def handler():
+                return target_index if regs[rs] == regs[rt] else next_index
+        elif mnemonic == "bne":
+            def handler():
+                return target_index if regs[rs] != regs[rt] else next_index
+        elif mnemonic == "bgtz":
+            def handler():
+                return target_index if 0 < regs[rs] < SIGN_BIT else next_index
+        else:
+            def handler():
+                return target_index if regs[rs] == 0 or regs[rs] >= SIGN_BIT else next_index
+    elif mnemonic == "lw":
+        unpack_from = WORD_STRUCT.unpack_from
+
+        def handler():
+            effective_address = (regs[rs] + uimm) & WORD_MASK
+            if effective_address & 3:
+                raise SimulationError(f"Unaligned word load from {effective_address:#010x}", address)
+            regs[d] = unpack_from(memory, effective_address)[0]
+            return next_index
+    elif mnemonic == "lhu":
+        unpack_from = HALF_STRUCT.unpack_from
+
+        def handler():
+            effective_address = (regs[rs] + uimm) & WORD_MASK
+            if effective_address & 1:
+                raise SimulationError(f"Unaligned halfword load from {effective_address:#010x}", address)
+            regs[d] = unpack_from(memory, effective_address)[0]
+            return next_index
+    elif mnemonic == "lbu":
+        def handler():
+            regs[d] = memory[(regs[rs] + uimm) & WORD_MASK]
+            return next_index
+    elif mnemonic == "lb":
+        def handler():
+            regs[d] = ((memory[(regs[rs] + uimm) & WORD_MASK] ^ 0x80) - 0x80) & WORD_MASK
+            return next_index
+    elif mnemonic in ["sw", "sh", "sb"]:
+        size = {"sw": 4, "sh": 2, "sb": 1}[mnemonic]
+        pack_into = {"sw": WORD_STRUCT.pack_into, "sh": HALF_STRUCT.pack_into, "sb": None}[mnemonic]
+        value_mask = (1 << (8 * size)) - 1
+
+        def handler():
+            effective_address = (regs[rs] + uimm) & WORD_MASK
+            if effective_address & (size - 1):
+                raise SimulationError(f"Unaligned store to {effective_address:#010x}", address)
+            if pack_into is None:
+                memory[effective_address] = regs[rt] & 0xFF
+            else:
+                pack_into(memory, effective_address, regs[rt] & value_mask)
+            # Self modifying code, decode the overwritten instruction again
+            if text_start <= effective_address < text_end:
+                invalidate(machine, effective_address)
+            return next_index
+    else:
+        raise SimulationError(f"No handler for I type instruction \"{mnemonic}\"")
+    return handler
+
+
+def make_j_handler(mnemonic, machine, index, target):
+    """
+    :return: handler for a J type instruction (target is the raw 26 bit field)
+    """
+    regs = machine["registers"]
+    link_address = machine["text_start"] + 4 * (index + 1)
+    target_index = get_target_index(machine, (link_address & 0xF0000000) | (target << 2))
+
+    if mnemonic == "jal":
+        def handler():
+            regs[31] = link_address
+            return target_index
+    else:
+        def handler():
+            return target_index
+    return handler
+
+
+def make_invalid_handler(machine, index, word):
+    """
+    :return: handler for a word which doesn't decode to a supported instruction (raises once it is executed)
+    """
+    address = machine["text_start"] + 4 * index
+
+    def handler():
+        raise SimulationError(f"Unknown instruction word {word:#010x}", address)
+    return handler
+
+
+def decode_word(machine, index):
+    """
+    Decodes the word at an instruction index of the text segment into its handler
+    :param machine: machine dictionary (see load_program(...))
+    :param index: instruction index (0 for the first instruction) (int)
+    :return: handler function (returns the index of the next handler to run)
+    """
+    word = WORD_STRUCT.unpack_from(machine["memory"], machine["text_start"] + 4 * index)[0]
+    opcode = word >> 26
+    mnemonic = DECODE_DICT.get((opcode, word & 0x3F if opcode == 0 else None))
+    if mnemonic is None:
+        return make_invalid_handler(machine, index, word)
+
+    rs, rt = (word >> 21) & 0x1F, (word >> 16) & 0x1F
+    if opcode == 0:
+        return make_r_handler(mnemonic, machine, index, rs, rt, (word >> 11) & 0x1F, (word >> 6) & 0x1F)
+    if opcode in J_TYPE_OPCODES:
+        return make_j_handler(mnemonic, machine, index, word & ADDRESS_MASK)
+    return make_i_handler(mnemonic, machine, index, rs, rt, word & IMM_MASK)
+
+
+def invalidate(machine, address):
+    """
+    Called after memory in the text segment was written, decodes the affected instruction again
+    :param machine: machine dictionary (see load_program(...))
+    :param address: byte address which was written (int)
+    :return: None
+    """
+    index = (address - machine["text_start"]) >> 2
+    machine["code"][index] = decode_word(machine, index)
+
+    # Drop every translated block containing the instruction (see run_blocks(...))
+    blocks = machine["blocks"]
+    for start in [start for start, (_, length) in blocks.items() if start <= index < start + length]:
+        del blocks[start]
+
+
+def get_data_address(memory_size=DEFAULT_MEMORY_SIZE):
+    """
+    :param memory_size: size of the simulated memory in bytes (int)
+    :return: byte address to assemble the data segment of a program at so it can be loaded (see DATA_ADDRESS_FRACTION)
+    """
+    return int(memory_size * DATA_ADDRESS_FRACTION) & ~7
+
+
+def check_data_segment(start_address, text_size, memory_size, data_image, data_address):
+    """
+    Makes sure the data segment of a program can be copied into the simulated memory
+    :param start_address: byte address of the first instruction (int)
+    :param text_size: size of the instructions in bytes (int)
+    :param memory_size: size of the simulated memory in bytes (int)
+    :param data_image: memory image of the data segment (bytes-like, see data_segment.build_data_image(...))
+    :param data_address: byte address of the data segment (int)
+    :return: None
+    :raises SimulationError if the data segment lies outside the memory or overlaps the instructions
+    """
+    if data_address + len(data_image) > memory_size:
+        raise SimulationError(f"Data segment does not fit in memory (it ends at {data_address + len(data_image):#x}, "
+                              f"memory ends at {memory_size:#x}, assemble the program with "
+                              f"data_address=simulator.get_data_address(memory_size))", data_address)
+    if data_address < start_address + text_size and start_address < data_address + len(data_image):
+        raise SimulationError("Data segment overlaps the instructions", data_address)
+
+
+def load_program(words, start_address=None, memory_size=DEFAULT_MEMORY_SIZE, data_image=None, data_address=None):
+    """
+    Creates a machine with a program loaded and ready to run
+    The machine is a dictionary with the keys
+        registers - register file (array of unsigned 32 bit values, see HI, LO and DISCARD for the extra slots)
+        memory - simulated memory (bytearray, big endian)
+        text_start, text_end - byte addresses of the first instruction and just past the last one
+        instruction_count - number of instructions in the text segment
+        code - decoded handlers (list, one per instruction followed by the exit handlers)
+        exit_indexes - dictionary mapping addresses outside the text segment to their exit handler index
+        blocks - dictionary mapping instruction indexes to translated blocks (function, length) (see run_blocks(...))
+        leaders - set of instruction indexes which start a basic block (None until run_blocks(...) needs them)
+        block_progress - one element list holding the index of the last instruction a block started which may fail
+        pc - byte address of the next instruction to execute
+        steps - number of instructions executed so far
+        halted - whether control has left the text segment
+    $sp starts at the top of memory and $ra just past the last instruction (so returning ends the program)
+    :param words: assembled instruction words (iterable of int)
+    :param start_address: byte address of the first instruction (defaults to assembler.START_ADDRESS)
+    :param memory_size: size of the simulated memory in bytes (int)
+    :param data_image: memory image of the data segment (bytes-like, see api.AssembledProgram.data_image), None or
+        empty if the program has no data
+    :param data_address: byte address of the data segment (see get_data_address(...))
+    :return: machine dictionary
+    :raises SimulationError if the program or its data segment doesn't fit in memory
+    """
+    start_address = assembler.START_ADDRESS if start_address is None else start_address
+    text = output_formats.render_big_endian(words)
+    if start_address & 3:
+        raise SimulationError("Start address is not word aligned", start_address)
+    if start_address + len(text) > memory_size:
+        raise SimulationError("Program does not fit in memory", start_address)
+
+    if data_image:
+        check_data_segment(start_address, len(text), memory_size, data_image, data_address)
+
+    memory = bytearray(memory_size)
+    memory[start_address:start_address+len(text)] = text
+    if data_image:
+        memory[data_address:data_address+len(data_image)] = data_image
+    registers = output_formats.get_word_array([0] * REGISTER_COUNT)
+    registers[29] = memory_size & ~7
+    registers[31] = start_address + len(text)
+
+    machine = {"registers": registers, "memory": memory, "text_start": start_address,
+               "text_end": start_address + len(text), "instruction_count": len(text) // 4, "code": [],
+               "exit_indexes": {}, "blocks": {}, "leaders": None, "block_progress": [0], "pc": start_address,
+               "steps": 0, "halted": False}
+    machine["code"] = [None] * machine["instruction_count"]
+    # The handler after the last instruction stops the simulation when execution runs off the end of the program
+    get_exit_index(machine, machine["text_end"])
+    for index in range(machine["instruction_count"]):
+        machine["code"][index] = decode_word(machine, index)
+    return machine
+
+
+def run(machine, max_steps=DEFAULT_MAX_STEPS):
+    """
+    Runs the program until control leaves the text segment or max_steps instructions have been executed
+    Can be called again to continue a program which hit max_steps.
+    :param machine: machine dictionary (see load_program(...)) (updated in place)
+    :param max_steps: maximum number of instructions to execute (int)
+    :return: number of instructions executed by this call (int)
+    :raises SimulationError if an instruction can't be executed (the machine is left at that instruction)
+    """
+    code = machine["code"]
+    text_start = machine["text_start"]
+    if machine["halted"]:
+        return 0
+    index = (machine["pc"] - text_start) >> 2
+
+    steps = 0
+    try:
+        for steps in range(max_steps):
+            index = code[index]()
+        else:
+            steps = max_steps
+    except _Halt as halt:
+        machine["halted"] = True
+        machine["pc"] = halt.address
+    except SimulationError:
+        machine["pc"] = text_start + 4 * index
+        raise
+    except (IndexError, struct.error):
+        machine["pc"] = text_start + 4 * index
+        raise SimulationError("Memory access out of range", machine["pc"])
+    else:
+        machine["pc"] = text_start + 4 * index
+    finally:
+        machine["steps"] += steps
+    return steps
+
+
+def run_trace(machine, trace, max_steps=DEFAULT_MAX_STEPS):
+    """
+    Same as run(...), but also records the instruction index of every executed instruction (see pipeline.py)
+    :param machine: machine dictionary (see load_program(...)) (updated in place)
+    :param trace: array or list the executed instruction indexes are appended to (in execution order)
+    :param max_steps: maximum number of instructions to execute (int)
+    :return: number of instructions executed by this call (int)
+    :raises SimulationError if an instruction can't be executed (the machine is left at that instruction)
+    """
+    code = machine["code"]
+    text_start = machine["text_start"]
+    if machine["halted"]:
+        return 0
+    index = (machine["pc"] - text_start) >> 2
+    append = trace.append
+
+    steps = 0
+    try:
+        for steps in range(max_steps):
+            append(index)
+            index = code[index]()
+        else:
+            steps = max_steps
+    except _Halt as halt:
+        # The exit handler only stops the simulation, it isn't an executed instruction
+        del trace[-1]
+        machine["halted"] = True
+        machine["pc"] = halt.address
+    except SimulationError:
+        del trace[-1]
+        machine["pc"] = text_start + 4 * index
+        raise
+    except (IndexError, struct.error):
+        del trace[-1]
+        machine["pc"] = text_start + 4 * index
+        raise SimulationError("Memory access out of range", machine["pc"])
+    else:
+        machine["pc"] = text_start + 4 * index
+    finally:
+        machine["steps"] += steps
+    return steps
+
+
+# Basic block translation
+# Instead of calling one handler per instruction, run_blocks(...) translates each basic block into a single generated
+# Python function (straight line code ending with the branch or jump, if any) the first time it runs and caches it.
+# The generated code uses the same semantics as the handlers above (rare instructions simply call their handler).
+
+# Maximum number of instructions in a translated block
+MAX_BLOCK_LENGTH = 256
+
+# Generated code for each mnemonic
+# Fields: d (destination slot), rs, rt, shamt, imm (raw field), simm (sign extended), uimm (sign extended, unsigned),
+# k (instruction index), next (index of the next instruction), target (index of the branch/jump target),
+# link (return address), value (lui result), text_start, text_end, text_length
+# Instructions which may fail first store their index in P[0] so failures are reported at the right instruction
+BLOCK_TEMPLATE_DICT = {
+    "add": ["R[{d}] = (R[{rs}] + R[{rt}]) & 0xFFFFFFFF"],
+    "addu": ["R[{d}] = (R[{rs}] + R[{rt}]) & 0xFFFFFFFF"],
+    "sub": ["R[{d}] = (R[{rs}] - R[{rt}]) & 0xFFFFFFFF"],
+    "subu": ["R[{d}] = (R[{rs}] - R[{rt}]) & 0xFFFFFFFF"],
+    "and": ["R[{d}] = R[{rs}] & R[{rt}]"],
+    "or": ["R[{d}] = R[{rs}] | R[{rt}]"],
+    "xor": ["R[{d}] = R[{rs}] ^ R[{rt}]"],
+    "nor": ["R[{d}] = ~(R[{rs}] | R[{rt}]) & 0xFFFFFFFF"],
+    "slt": ["R[{d}] = (R[{rs}] ^ 0x80000000) < (R[{rt}] ^ 0x80000000)"],
+    "sltu": ["R[{d}] = R[{rs}] < R[{rt}]"],
+    "sll": ["R[{d}] = (R[{rt}] << {shamt}) & 0xFFFFFFFF"],
+    "srl": ["R[{d}] = R[{rt}] >> {shamt}"],
+    "sra": ["R[{d}] = (((R[{rt}] ^ 0x80000000) - 0x80000000) >> {shamt}) & 0xFFFFFFFF"],
+    "mfhi": ["R[{d}] = R[32]"],
+    "mflo": ["R[{d}] = R[33]"],
+    "mthi": ["R[32] = R[{rs}]"],
+    "mtlo": ["R[33] = R[{rs}]"],
+    "jr": ["P[0] = {k}",
+           "t = R[{rs}] - {text_start}",
+           "if 0 <= t < {text_length} and not t & 3:",
+           "    return t >> 2",
+           "return get_target_index(machine, R[{rs}])"],
+    "jalr": ["P[0] = {k}",
+             "t = R[{rs}] - {text_start}",
+             "t = t >> 2 if 0 <= t < {text_length} and not t & 3 else get_target_index(machine, R[{rs}])",
+             "R[31] = {link}",
+             "return t"],
+    "addi": ["R[{d}] = (R[{rs}] + {uimm}) & 0xFFFFFFFF"],
+    "addiu": ["R[{d}] = (R[{rs}] + {uimm}) & 0xFFFFFFFF"],
+    "andi": ["R[{d}] = R[{rs}] & {imm}"],
+    "ori": ["R[{d}] = R[{rs}] | {imm}"],
+    "slti": ["R[{d}] = (R[{rs}] ^ 0x80000000) - 0x80000000 < {simm}"],
+    "sltiu": ["R[{d}] = R[{rs}] < {uimm}"],
+    "lui": ["R[{d}] = {value}"],
+    "beq": ["if R[{rs}] == R[{rt}]:",
+            "    return {target}",
+            "return {next}"],
+    "bne": ["if R[{rs}] != R[{rt}]:",
+            "    return {target}",
+            "return {next}"],
+    "bgtz": ["if 0 < R[{rs}] < 0x80000000:",
+             "    return {target}",
+             "return {next}"],
+    "blez": ["if R[{rs}] == 0 or R[{rs}] >= 0x80000000:",
+             "    return {target}",
+             "return {next}"],
+    "lw": ["P[0] = {k}",
+           "a = (R[{rs}] + {uimm}) & 0xFFFFFFFF",
+           "if a & 3:",
+           "    H{k}()",
+           "R[{d}] = unpack_word(M, a)[0]"],
+    "lhu": ["P[0] = {k}",
+            "a = (R[{rs}] + {uimm}) & 0xFFFFFFFF",
+            "if a & 1:",
+            "    H{k}()",
+            "R[{d}] = unpack_half(M, a)[0]"],
+    "lbu": ["P[0] = {k}",
+            "R[{d}] = M[(R[{rs}] + {uimm}) & 0xFFFFFFFF]"],
+    "lb": ["P[0] = {k}",
+           "R[{d}] = ((M[(R[{rs}] + {uimm}) & 0xFFFFFFFF] ^ 0x80) - 0x80) & 0xFFFFFFFF"],
+    "sw": ["P[0] = {k}",
+           "a = (R[{rs}] + {uimm}) & 0xFFFFFFFF",
+           "if a & 3:",
+           "    H{k}()",
+           "pack_word(M, a, R[{rt}])",
+           "if {text_start} <= a < {text_end}:",
+           "    invalidate(machine, a)",
+           "    raise _BlockExit({next})"],
+    "sh": ["P[0] = {k}",
+           "a = (R[{rs}] + {uimm}) & 0xFFFFFFFF",
+           "if a & 1:",
+           "    H{k}()",
+           "pack_half(M, a, R[{rt}] & 0xFFFF)",
+           "if {text_start} <= a < {text_end}:",
+           "    invalidate(machine, a)",
+           "    raise _BlockExit({next})"],
+    "sb": ["P[0] = {k}",
+           "a = (R[{rs}] + {uimm}) & 0xFFFFFFFF",
+           "M[a] = R[{rt}] & 0xFF",
+           "if {text_start} <= a < {text_end}:",
+           "    invalidate(machine, a)",
+           "    raise _BlockExit({next})"],
+    "j": ["return {target}"],
+    "jal": ["R[31] = {link}",
+            "return {target}"],
+}
+
+# Mnemonics which end a basic block
+CONTROL_TRANSFER_MNEMONICS = {"jr", "jalr", "beq", "bne", "bgtz", "blez", "j", "jal"}
+
+
+# Register reads and writes in the generated code
+REGISTER_READ_REGEX = re.compile(r"R\[(\d+)\]")
+REGISTER_WRITE_REGEX = re.compile(r"^R\[(\d+)\] = (.*)$")
+
+
+def cache_registers(body):
+    """
+    Rewrites the lines of a translated block so each register is read from the register file at most once
+    Registers are kept in locals (r8 for $t0 etc.) after they are first read or written.  Writes still go to the
+    register file immediately so its state is exact if an instruction fails.  Handlers called by the block may change
+    any register, so the locals are forgotten after each call.
+    :param body: lines of the block function (list of strings)
+    :return: rewritten lines (list of strings)
+    """
+    cached = set()
+    rewritten = []
+
+    def read(match):
+        register = int(match.group(1))
+        if register == 0:
+            return "0"
+        if register not in cached:
+            rewritten.append(f"r{register} = R[{register}]")
+            cached.add(register)
+        return f"r{register}"
+
+    for line in body:
+        write = REGISTER_WRITE_REGEX.match(line)
+        if line.startswith(" "):
+            # Inside an if statement (error paths and returns), loading registers here wouldn't happen on the other
+            # path, and handlers called here always raise
+            rewritten.append(line)
+            continue
+        if write is None:
+            rewritten.append(REGISTER_READ_REGEX.sub(read, line))
+        elif int(write.group(1)) == DISCARD:
+            rewritten.append(f"R[{DISCARD}] = {REGISTER_READ_REGEX.sub(read, write.group(2))}")
+        else:
+            register = int(write.group(1))
+            expression = REGISTER_READ_REGEX.sub(read, write.group(2))
+            rewritten.append(f"r{register} = {expression}")
+            rewritten.append(f"R[{register}] = r{register}")
+            cached.add(register)
+        if line.startswith("H"):
+            cached.clear()
+    return rewritten
+
+
+class _BlockExit(Exception):
+    """
+    Raised by a translated block after it wrote to the text segment, so the rest of the (now stale) block is skipped
+    """
+    def __init__(self, index):
+        super().__init__(index)
+        self.index = index
+
+
+def get_block_leaders(machine, symbol_table=None):
+    """
+    Finds the instructions which start a basic block: the first instruction, every label in the symbol table, every
+    branch and jump target, and every instruction following a branch or jump
+    :param machine: machine dictionary (see load_program(...))
+    :param symbol_table: dictionary mapping labels to their byte addresses (optional, targets are also found by
+        decoding the branches and jumps)
+    :return: set of instruction indexes
+    """
+    text_start, count = machine["text_start"], machine["instruction_count"]
+    leaders = {0}
+    for address in (symbol_table or {}).values():
+        if text_start <= address < machine["text_end"] and not (address - text_start) & 3:
+            leaders.add((address - text_start) >> 2)
+
+    for index in range(count):
+        word = WORD_STRUCT.unpack_from(machine["memory"], text_start + 4 * index)[0]
+        opcode = word >> 26
+        mnemonic = DECODE_DICT.get((opcode, word & 0x3F if opcode == 0 else None))
+        if mnemonic not in CONTROL_TRANSFER_MNEMONICS:
+            continue
+        leaders.add(index + 1)
+        if opcode in J_TYPE_OPCODES:
+            leaders.add((((text_start + 4 * index + 4) & 0xF0000000) | ((word & ADDRESS_MASK) << 2)
+                         - text_start) >> 2)
+        elif opcode != 0:
+            imm = word & IMM_MASK
+            leaders.add(index + 1 + imm - ((imm & 0x8000) << 1))
+    return {leader for leader in leaders if 0 <= leader < count}
+
+
+def translate_block(machine, start):
+    """
+    Translates the basic block starting at an instruction index into a Python function and caches it
+    The block ends after the first branch or jump, before the next leader (see get_block_leaders(...)), or after
+    MAX_BLOCK_LENGTH instructions.
+    :param machine: machine dictionary (see load_program(...))
+    :param start: instruction index of the first instruction of the block (int)
+    :return: Tuple (block function (returns the index of the next instruction), number of instructions)
+    """
+    text_start, count = machine["text_start"], machine["instruction_count"]
+    leaders = machine["leaders"]
+    namespace = {"R": machine["registers"], "M": machine["memory"], "P": machine["block_progress"],
+                 "machine": machine, "get_target_index": get_target_index, "invalidate": invalidate,
+                 "_BlockExit": _BlockExit, "unpack_word": WORD_STRUCT.unpack_from, "pack_word": WORD_STRUCT.pack_into,
+                 "unpack_half": HALF_STRUCT.unpack_from, "pack_half": HALF_STRUCT.pack_into}
+    body = []
+
+    index = start
+    while True:
+        if index == count or index - start == MAX_BLOCK_LENGTH or (index != start and index in leaders):
+            body.append(f"return {index}")
+            break
+
+        word = WORD_STRUCT.unpack_from(machine["memory"], text_start + 4 * index)[0]
+        opcode = word >> 26
+        mnemonic = DECODE_DICT.get((opcode, word & 0x3F if opcode == 0 else None))
+        template = BLOCK_TEMPLATE_DICT.get(mnemonic)
+        # Handlers are also called for instructions without a template and for the error paths of the templates
+        namespace[f"H{index}"] = machine["code"][index]
+        if template is None:
+            body += [f"P[0] = {index}", f"H{index}()"]
+        else:
+            rs, rt, rd = (word >> 21) & 0x1F, (word >> 16) & 0x1F, (word >> 11) & 0x1F
+            imm = word & IMM_MASK
+            simm = imm - ((imm & 0x8000) << 1)
+            address = text_start + 4 * index
+            if opcode in J_TYPE_OPCODES:
+                target = get_target_index(machine, ((address + 4) & 0xF0000000) | ((word & ADDRESS_MASK) << 2))
+            elif mnemonic in CONTROL_TRANSFER_MNEMONICS and opcode != 0:
+                target = get_target_index(machine, address + 4 + 4 * simm)
+            else:
+                target = None
+            fields = {"d": (rd if opcode == 0 else rt) or DISCARD, "rs": rs, "rt": rt, "shamt": (word >> 6) & 0x1F,
+                      "imm": imm, "simm": simm, "uimm": simm & WORD_MASK, "k": index, "next": index + 1,
+                      "target": target, "link": address + 4, "value": imm << 16,
+                      "text_start": text_start, "text_end": machine["text_end"], "text_length": 4 * count}
+            body += [line.format(**fields) for line in template]
+        index += 1
+        if mnemonic in CONTROL_TRANSFER_MNEMONICS:
+            break
+
+    source = "def block(R=R, M=M, P=P):\n" + "".join(f"    {line}\n" for line in cache_registers(body))
+    exec(compile(source, f"<block {text_start + 4 * start:#010x}>", "exec"), namespace)
+    block = (namespace["block"], index - start)
+    machine["blocks"][start] = block
+    return block
+
+
+def run_blocks(machine, max_steps=DEFAULT_MAX_STEPS, symbol_table=None):
+    """
+    Same as run(...), but executes translated basic blocks (see translate_block(...)) instead of one handler per
+    instruction.  The machine ends up in exactly the same state as with run(...), including when max_steps is reached
+    in the middle of a block (the remaining instructions are run with run(...)) or an instruction fails.
+    Blocks are cached in the machine and dropped when the text segment is written to.
+    :param machine: machine dictionary (see load_program(...)) (updated in place)
+    :param max_steps: maximum number of instructions to execute (int)
+    :param symbol_table: dictionary mapping labels to their byte addresses (optional, used to find the blocks)
+    :return: number of instructions executed by this call (int)
+    :raises SimulationError if an instruction can't be executed (the machine is left at that instruction)
+    """
+    if machine["halted"]:
+        return 0
+    if machine["leaders"] is None:
+        machine["leaders"] = get_block_leaders(machine, symbol_table)
+    code, blocks, progress = machine["code"], machine["blocks"], machine["block_progress"]
+    text_start, count = machine["text_start"], machine["instruction_count"]
+    index = (machine["pc"] - text_start) >> 2
+
+    steps = 0
+    try:
+        while True:
+            block = blocks.get(index)
+            if block is None:
+                if index >= count:
+                    code[index]()   # Exit handler, raises _Halt
+                block = translate_block(machine, index)
+            function, length = block
+            steps += length
+            if steps > max_steps:
+                steps -= length
+                break
+            try:
+                index = function()
+            except _BlockExit as block_exit:
+                # Only the instructions up to the store into the text segment ran
+                steps += block_exit.index - index - length
+                index = block_exit.index
+    except _Halt as halt:
+        machine["halted"] = True
+        machine["pc"] = halt.address
+        machine["steps"] += steps
+        return steps
+    except (SimulationError, IndexError, struct.error) as error:
+        # The block stored the index of the failing instruction before running it
+        steps += progress[0] - index - length
+        machine["steps"] += steps
+        machine["pc"] = text_start + 4 * progress[0]
+        if isinstance(error, SimulationError):
+            raise
+        raise SimulationError("Memory access out of range", machine["pc"])
+
+    # Not enough steps left for the whole block, finish instruction by instruction
+    machine["pc"] = text_start + 4 * index
+    machine["steps"] += steps
+    return steps + run(machine, max_steps - steps)
+
+
+def get_register_values(machine):
+    """
+    :param machine: machine dictionary (see load_program(...))
+    :return: dictionary mapping register names ($zero ... $ra, hi, lo) to their values (ints)
+    """
+    registers = machine["registers"]
+    register_values = {name: registers[number] for name, number in dicts.REGISTER_DICT.items() if name != "$0"}
+    register_values["hi"] = registers[HI]
+    register_values["lo"] = registers[LO]
+    return register_values
+
+
+def simulate_source(source, start_address=None, memory_size=DEFAULT_MEMORY_SIZE, max_steps=DEFAULT_MAX_STEPS,
+                    blocks=False):
+    """
+    Assembles and runs a program
+    :param source: the assembly program (see api.get_source_lines(...) for the supported types)
+    :param start_address: byte address of the first instruction (defaults to assembler.START_ADDRESS)
+    :param memory_size: size of the simulated memory in bytes (int)
+    :param max_steps: maximum number of instructions to execute (int)
+    :param blocks: run translated basic blocks (see run_blocks(...)) instead of interpreting each instruction
+    :return: machine dictionary after running (see load_program(...))
+    :raises AssemblerError if the program is invalid, SimulationError if it can't be executed
+    """
+    program = api.assemble_source(source, start_address, data_address=get_data_address(memory_size))
+    machine = load_program(program.words, program.start_address, memory_size, program.data_image,
+                           program.data_address)
+    if blocks:
+        run_blocks(machine, max_steps, program.symbol_table)
+    else:
+        run(machine, max_steps)
+    return machine
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Assemble and run a MIPS assembly file")
+    parser.add_argument("input", help="assembly file")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS,
+                        help="maximum number of instructions to execute (default: %(default)s)")
+    parser.add_argument("--memory-size", type=int, default=DEFAULT_MEMORY_SIZE,
+                        help="size of the simulated memory in bytes (default: %(default)s)")
+    parser.add_argument("--start-address", type=lambda value: int(value, 0), default=None,
+                        help="byte address of the first instruction (default: 7996)")
+    parser.add_argument("--blocks", action="store_true", help="run translated basic blocks instead of interpreting")
+    args = parser.parse_args()
+
+    try:
+        with open(args.input) as i_file:
+            result = simulate_source(i_file, args.start_address, args.memory_size, args.max_steps, args.blocks)
+    except (OSError, AssemblerError, SimulationError) as error:
+        print(error)
+        sys.exit(1)
+    print(f"{result['steps']:,} instructions executed, "
+          f"{'halted' if result['halted'] else 'stopped'} at {result['pc']:#010x}")
+    for register_name, register_value in get_register_values(result).items():
+        print(f"{register_name:<6}{register_value:#010x} {to_signed(register_value):>12}")